@@ -0,0 +1,159 @@
+import json
+import os
+import tracemalloc
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import regf_generator
+
+# Render without a display, unless a platform was chosen
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+# Peak memory growth that is always allowed, so small allocations don't fail on noise
+MEMORY_SLACK = 64 * 1024
+
+# Shapes of the generated hives used by the benchmarks
+SHAPES = {
+    # About 5,000 keys four levels deep, with small values
+    "deep": regf_generator.HiveShape(depth=4, fanout=8, values_per_key=4),
+    # 20,000 subkeys under the root
+    "wide": regf_generator.HiveShape(depth=1, fanout=20000, values_per_key=0),
+    # Keys with many values, every tenth one a 64 KB big data value
+    "values": regf_generator.HiveShape(depth=1, fanout=10, values_per_key=500, value_sizes=(4, 64, 512, 2048),
+                                       big_data_every=10, big_data_size=0x10000),
+    # A key with eight values, every other one a 4 MB big data value
+    "big_values": regf_generator.HiveShape(depth=1, fanout=1, values_per_key=8, big_data_every=2,
+                                           big_data_size=0x400000),
+    # About 1,900 keys, every fourth one with a deleted subkey left in free cells
+    "deleted": regf_generator.HiveShape(depth=3, fanout=12, values_per_key=4, value_sizes=(4, 64, 512, 2048),
+                                        deleted_every=4),
+}
+for list_type in regf_generator.LIST_TYPES:
+    SHAPES[f"wide_{list_type}"] = regf_generator.HiveShape(
+        depth=1, fanout=5000, values_per_key=0, list_type=list_type)
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("baselines")
+    group.addoption("--update-baselines", action="store_true",
+                    help="record the results as the new baselines instead of comparing against them")
+    group.addoption("--throughput-tolerance", type=float, default=0.5,
+                    help="fraction of the baseline throughput that may be lost before a benchmark fails")
+    group.addoption("--memory-tolerance", type=float, default=0.25,
+                    help="fraction of the baseline peak memory that may be added before a benchmark fails")
+
+
+def pytest_sessionstart(session):
+    session.config.new_baselines = {}
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    if not config.getoption("update_baselines") or len(config.new_baselines) == 0:
+        return
+    baselines = load_baselines()
+    baselines.update(config.new_baselines)
+    with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(baselines.items())), f, indent=2)
+        f.write("\n")
+
+
+def load_baselines() -> dict:
+    try:
+        with open(BASELINES_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+@pytest.fixture(scope="session")
+def qapp(tmp_path_factory):
+    import PySide6.QtCore as QtCore
+    import PySide6.QtWidgets as QtWidgets
+
+    # Keep the benchmarked windows away from the user's settings
+    QtCore.QSettings.setDefaultFormat(QtCore.QSettings.Format.IniFormat)
+    QtCore.QSettings.setPath(QtCore.QSettings.Format.IniFormat, QtCore.QSettings.Scope.UserScope,
+                             str(tmp_path_factory.mktemp("settings")))
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    # Don't replace the user's last session when the benchmarked windows close
+    QtCore.QSettings().setValue("session/restore", False)
+    return app
+
+
+@pytest.fixture(scope="session")
+def hive_files(tmp_path_factory) -> "dict[str, str]":
+    """Filenames of the generated hives by shape name"""
+    directory = tmp_path_factory.mktemp("hives")
+    return {name: regf_generator.write_hive(str(directory / f"{name}.hiv"), shape)
+            for name, shape in SHAPES.items()}
+
+
+@pytest.fixture
+def window(qapp):
+    from registryspy import registryspy
+
+    window = registryspy.RegViewer()
+    window.show()
+    yield window
+    window.tree.remove_all_hives()
+    window.close()
+    window.deleteLater()
+
+
+@pytest.fixture
+def measure(request, benchmark):
+    """Benchmark a function and compare its throughput and peak memory against the baselines.
+
+    setup is called before every round and its result passed to the function. Peak memory is the
+    peak of the Python allocations of a separate run, so Qt's own allocations aren't included."""
+
+    def run(function, setup=None, rounds=20):
+        if setup is None:
+            result = benchmark(function)
+        else:
+            result = benchmark.pedantic(function, setup=lambda: ((setup(),), {}), rounds=rounds)
+        if benchmark.disabled:
+            return result
+
+        arguments = () if setup is None else (setup(),)
+        tracemalloc.start()
+        try:
+            function(*arguments)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        ops = 1 / benchmark.stats.stats.mean
+        benchmark.extra_info["peak_memory"] = peak_memory
+        check_baseline(request, ops, peak_memory)
+        return result
+
+    return run
+
+
+def check_baseline(request, ops: float, peak_memory: int):
+    config = request.config
+    # Independent of the directory pytest is run from
+    name = f"{request.node.path.name}::{request.node.name}"
+    if config.getoption("update_baselines"):
+        config.new_baselines[name] = {"ops": round(ops, 2), "peak_memory": peak_memory}
+        return
+
+    baseline = load_baselines().get(name)
+    if baseline is None:
+        return
+    regressions = []
+    min_ops = baseline["ops"] * (1 - config.getoption("throughput_tolerance"))
+    if ops < min_ops:
+        regressions.append(
+            f"throughput {ops:,.2f} ops/s is below {min_ops:,.2f} (baseline {baseline['ops']:,.2f})")
+    max_memory = baseline["peak_memory"] * (1 + config.getoption("memory_tolerance")) + MEMORY_SLACK
+    if peak_memory > max_memory:
+        regressions.append(
+            f"peak memory {peak_memory:,} B is above {max_memory:,.0f} (baseline {baseline['peak_memory']:,})")
+    if regressions:
+        pytest.fail(f"{name} regressed: " + "; ".join(regressions), pytrace=False)
@@ -0,0 +1,313 @@
+"""Generate synthetic REGF hive files with a configurable shape, for the benchmarks"""
+
+import argparse
+import random
+import struct
+
+HBIN_SIZE = 0x1000
+# Largest data cell before the data is split into db record segments
+BIG_DATA_SEGMENT = 0x3FD8
+LIST_TYPES = ["lf", "lh", "li", "ri"]
+
+REG_SZ = 1
+REG_BINARY = 3
+REG_DWORD = 4
+REG_MULTI_SZ = 7
+REG_QWORD = 11
+
+# 2023-01-01 00:00:00 UTC as a FILETIME
+BASE_FILETIME = 133170048000000000
+
+
+class HiveShape:
+    """Shape of a generated hive.
+
+    fanout is the number of subkeys of every key above depth, or a list with the fan-out of each
+    level. Value data sizes are drawn from value_sizes, so repeating a size weights it. Every
+    big_data_every-th value holds big_data_size bytes, stored in a db record once it's larger
+    than a single cell. Subkey lists of more than ri_chunk keys are split when list_type is ri.
+    Every deleted_every-th key gets a deleted subkey with a deleted subkey and value of its own,
+    and a deleted value that no key refers to, left in free cells."""
+
+    def __init__(self, depth=3, fanout=4, values_per_key=3, value_sizes=(4, 64, 512),
+                 big_data_every=0, big_data_size=0x8000, list_type="lh", ri_chunk=512,
+                 hive_name="SOFTWARE", deleted_every=0, seed=0):
+        if list_type not in LIST_TYPES:
+            raise ValueError(f"Unknown subkey list type: {list_type}")
+        self.depth = depth
+        self.fanout = fanout
+        self.values_per_key = values_per_key
+        self.value_sizes = value_sizes
+        self.big_data_every = big_data_every
+        self.big_data_size = big_data_size
+        self.list_type = list_type
+        self.ri_chunk = ri_chunk
+        self.hive_name = hive_name
+        self.deleted_every = deleted_every
+        self.seed = seed
+
+    def key_count(self) -> int:
+        """Returns the number of keys in a hive of this shape, including the root"""
+        total = level_keys = 1
+        for level in range(self.depth):
+            level_keys *= self.fanout[level] if isinstance(self.fanout, (list, tuple)) else self.fanout
+            total += level_keys
+        return total
+
+
+class _Allocator:
+    """Append-only cell allocator that packs cells into hbins"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.hbin_end = 0
+        self.cursor = 0
+
+    def _new_hbin(self, min_size: int):
+        size = max(HBIN_SIZE, (min_size + 0x20 + HBIN_SIZE - 1) // HBIN_SIZE * HBIN_SIZE)
+        self._fill_free()
+        start = len(self.data)
+        self.data += b"hbin" + struct.pack("<II", start, size) + bytes(size - 12)
+        self.hbin_end = start + size
+        self.cursor = start + 0x20
+
+    def _fill_free(self):
+        """Close the current hbin with a free cell filling the remainder"""
+        if self.cursor < self.hbin_end:
+            struct.pack_into("<i", self.data, self.cursor, self.hbin_end - self.cursor)
+            self.cursor = self.hbin_end
+
+    def alloc(self, size: int) -> int:
+        """Allocate a cell holding size bytes, returns its offset relative to the first hbin"""
+        cell_size = (size + 4 + 7) & ~7
+        if self.cursor + cell_size > self.hbin_end:
+            self._new_hbin(cell_size)
+        offset = self.cursor
+        struct.pack_into("<i", self.data, offset, -cell_size)
+        self.cursor += cell_size
+        return offset
+
+    def write(self, offset: int, payload: bytes, at: int = 0):
+        start = offset + 4 + at
+        self.data[start:start + len(payload)] = payload
+
+    def free(self, size: int, payload: bytes = b"") -> int:
+        """Allocate a cell and mark it as free, optionally keeping payload in it"""
+        offset = self.alloc(size)
+        self.write(offset, payload)
+        struct.pack_into("<i", self.data, offset, -struct.unpack_from("<i", self.data, offset)[0])
+        return offset
+
+    def finish(self) -> bytes:
+        self._fill_free()
+        return bytes(self.data)
+
+
+def _random_bytes(rng: random.Random, size: int) -> bytes:
+    return rng.getrandbits(size * 8).to_bytes(size, "little") if size > 0 else b""
+
+
+def _name_hash(name: str) -> int:
+    h = 0
+    for c in name.upper():
+        h = (h * 37 + ord(c)) & 0xFFFFFFFF
+    return h
+
+
+def _nk(name: str, flags: int, timestamp: int, parent: int) -> bytearray:
+    encoded = name.encode("windows-1252")
+    body = bytearray(0x4C + len(encoded))
+    body[0:2] = b"nk"
+    # Names are stored as ASCII (KEY_COMP_NAME)
+    struct.pack_into("<HQ", body, 2, flags | 0x20, timestamp)
+    struct.pack_into("<I", body, 0x10, parent)
+    # No subkeys, values, security or class name until they are written
+    struct.pack_into("<IIIIII", body, 0x18, 0, 0xFFFFFFFF, 0, 0xFFFFFFFF, 0xFFFFFFFF, 0xFFFFFFFF)
+    struct.pack_into("<HH", body, 0x48, len(encoded), 0)
+    body[0x4C:] = encoded
+    return body
+
+
+def _vk(name: str, datatype: int, data: bytes) -> bytes:
+    """Build a vk record holding up to 4 bytes of data in place of the data offset"""
+    encoded = name.encode("windows-1252")
+    return (b"vk" + struct.pack("<HI", len(encoded), 0x80000000 | len(data)) + data.ljust(4, b"\x00") +
+            struct.pack("<IHH", datatype, 1, 0) + encoded)
+
+
+def generate_hive(shape: HiveShape) -> bytes:
+    """Build a complete REGF image of the given shape"""
+    rng = random.Random(shape.seed)
+    alloc = _Allocator()
+    keys_written = 0
+
+    def write_direct_list(kind: str, children: list) -> int:
+        if kind == "li":
+            offset = alloc.alloc(4 + 4 * len(children))
+            alloc.write(offset, b"li" + struct.pack("<H", len(children)) +
+                        b"".join(struct.pack("<I", o) for o, _ in children))
+            return offset
+        entries = []
+        for child, name in children:
+            if kind == "lf":
+                hint = name.encode("windows-1252")[:4].ljust(4, b"\x00")
+            else:
+                hint = struct.pack("<I", _name_hash(name))
+            entries.append(struct.pack("<I", child) + hint)
+        offset = alloc.alloc(4 + 8 * len(children))
+        alloc.write(offset, kind.encode() + struct.pack("<H", len(children)) + b"".join(entries))
+        return offset
+
+    def write_subkey_list(children: list) -> int:
+        """Write the subkey list of (offset, name) children sorted by name"""
+        if shape.list_type != "ri":
+            return write_direct_list(shape.list_type, children)
+        sublists = [write_direct_list("lh", children[i:i + shape.ri_chunk])
+                    for i in range(0, len(children), shape.ri_chunk)]
+        offset = alloc.alloc(4 + 4 * len(sublists))
+        alloc.write(offset, b"ri" + struct.pack("<H", len(sublists)) +
+                    b"".join(struct.pack("<I", s) for s in sublists))
+        return offset
+
+    def write_data(payload: bytes) -> int:
+        if len(payload) <= BIG_DATA_SEGMENT:
+            offset = alloc.alloc(len(payload))
+            alloc.write(offset, payload)
+            return offset
+        segments = []
+        for i in range(0, len(payload), BIG_DATA_SEGMENT):
+            segment = alloc.alloc(BIG_DATA_SEGMENT)
+            alloc.write(segment, payload[i:i + BIG_DATA_SEGMENT])
+            segments.append(segment)
+        segment_list = alloc.alloc(4 * len(segments))
+        alloc.write(segment_list, b"".join(struct.pack("<I", s) for s in segments))
+        offset = alloc.alloc(8)
+        alloc.write(offset, b"db" + struct.pack("<HI", len(segments), segment_list))
+        return offset
+
+    def write_value(index: int, key_index: int) -> int:
+        kind = (key_index + index) % 5
+        if shape.big_data_every and (key_index * shape.values_per_key + index) % shape.big_data_every == 0:
+            datatype, payload = REG_BINARY, _random_bytes(rng, shape.big_data_size)
+        elif kind == 0:
+            datatype, payload = REG_DWORD, struct.pack("<I", rng.getrandbits(32))
+        elif kind == 1:
+            size = rng.choice(shape.value_sizes)
+            text = f"String data {key_index}.{index} "
+            text = (text * (size // (2 * len(text)) + 1))[:max(size // 2 - 1, 0)]
+            datatype, payload = REG_SZ, (text + "\x00").encode("utf-16le")
+        elif kind == 2:
+            datatype, payload = REG_QWORD, struct.pack("<Q", rng.getrandbits(64))
+        elif kind == 3:
+            parts = [f"item{key_index}", f"entry{index}", ""]
+            datatype, payload = REG_MULTI_SZ, ("\x00".join(parts) + "\x00").encode("utf-16le")
+        else:
+            datatype, payload = REG_BINARY, _random_bytes(rng, rng.choice(shape.value_sizes))
+
+        name = f"Value{index}".encode("windows-1252")
+        if len(payload) <= 4:
+            # Small data is stored in the vk record itself
+            size_field = 0x80000000 | len(payload)
+            data_field = payload.ljust(4, b"\x00")
+        else:
+            size_field = len(payload)
+            data_field = struct.pack("<I", write_data(payload))
+        offset = alloc.alloc(0x14 + len(name))
+        alloc.write(offset, b"vk" + struct.pack("<HI", len(name), size_field) + data_field +
+                    struct.pack("<IHH", datatype, 1, 0) + name)
+        return offset
+
+    def write_deleted_key(name: str, parent: int, key_index: int):
+        """Leave a deleted subkey of parent, its own deleted subkey and value, and an orphaned value in free cells"""
+        value = _vk("DeletedValue", REG_DWORD, struct.pack("<I", key_index))
+        value_list = alloc.free(4, struct.pack("<I", alloc.free(len(value), value)))
+        body = _nk(name, 0, BASE_FILETIME + key_index * 10_000_000, parent)
+        struct.pack_into("<II", body, 0x24, 1, value_list)
+        offset = alloc.free(len(body), body)
+        child = _nk(name + "Child", 0, BASE_FILETIME + key_index * 10_000_000, offset)
+        alloc.free(len(child), child)
+        orphan = _vk("OrphanedValue", REG_DWORD, struct.pack("<I", key_index))
+        alloc.free(len(orphan), orphan)
+
+    def write_key(name: str, parent: int, level: int, flags: int = 0) -> int:
+        nonlocal keys_written
+        offset = alloc.alloc(0x4C + len(name))
+        keys_written += 1
+        alloc.write(offset, _nk(name, flags, BASE_FILETIME + keys_written * 10_000_000, parent))
+        key_index = keys_written
+
+        values = [write_value(i, key_index) for i in range(shape.values_per_key)]
+        if values:
+            value_list = alloc.alloc(4 * len(values))
+            alloc.write(value_list, b"".join(struct.pack("<I", v) for v in values))
+            alloc.write(offset, struct.pack("<II", len(values), value_list), at=0x24)
+
+        if shape.deleted_every and key_index % shape.deleted_every == 0:
+            write_deleted_key(f"Deleted{key_index}", offset, key_index)
+
+        if level < shape.depth:
+            count = shape.fanout[level] if isinstance(shape.fanout, (list, tuple)) else shape.fanout
+            children = []
+            for i in range(count):
+                child_name = f"Key{level + 1}_{i:05d}"
+                children.append((write_key(child_name, offset, level + 1), child_name))
+            if children:
+                children.sort(key=lambda child: child[1].upper())
+                alloc.write(offset, struct.pack("<I", len(children)), at=0x14)
+                alloc.write(offset, struct.pack("<I", write_subkey_list(children)), at=0x1C)
+        return offset
+
+    # The root key is flagged as KEY_HIVE_ENTRY and KEY_NO_DELETE
+    root = write_key("ROOT", 0, 0, flags=0x4 | 0x8)
+    hbins = alloc.finish()
+
+    header = bytearray(0x1000)
+    header[0:4] = b"regf"
+    # Sequence numbers, timestamp, version 1.5, primary file, direct memory load and the root key
+    struct.pack_into("<IIQIIIII", header, 4, 1, 1, BASE_FILETIME, 1, 5, 0, 1, root)
+    struct.pack_into("<II", header, 0x28, len(hbins), 1)
+    hive_name = ("\\SystemRoot\\System32\\Config\\" + shape.hive_name)[-31:].encode("utf-16le")
+    header[0x30:0x30 + len(hive_name)] = hive_name
+    checksum = 0
+    for (dword,) in struct.iter_unpack("<I", bytes(header[:0x1FC])):
+        checksum ^= dword
+    struct.pack_into("<I", header, 0x1FC, checksum)
+    return bytes(header) + hbins
+
+
+def write_hive(filename: str, shape: HiveShape = None) -> str:
+    """Generate a hive and write it to a file"""
+    with open(filename, "wb") as f:
+        f.write(generate_hive(shape or HiveShape()))
+    return filename
+
+
+def main(argv: "list[str]" = None):
+    parser = argparse.ArgumentParser(description="Write a synthetic registry hive")
+    parser.add_argument("output")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, nargs="+", default=[4],
+                        help="subkeys per key, or one number for each level")
+    parser.add_argument("--values", type=int, default=3,
+                        help="values per key")
+    parser.add_argument("--value-sizes", type=int, nargs="+", default=[4, 64, 512],
+                        help="data sizes to draw from, repeat a size to weight it")
+    parser.add_argument("--big-data-every", type=int, default=0,
+                        help="make every Nth value a big data value")
+    parser.add_argument("--big-data-size", type=int, default=0x8000)
+    parser.add_argument("--list-type", choices=LIST_TYPES, default="lh")
+    parser.add_argument("--deleted-every", type=int, default=0,
+                        help="give every Nth key a deleted subkey")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    shape = HiveShape(depth=args.depth, fanout=args.fanout if len(args.fanout) > 1 else args.fanout[0],
+                      values_per_key=args.values, value_sizes=args.value_sizes,
+                      big_data_every=args.big_data_every, big_data_size=args.big_data_size,
+                      list_type=args.list_type, deleted_every=args.deleted_every, seed=args.seed)
+    write_hive(args.output, shape)
+    print(f"Wrote {shape.key_count():,} keys to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
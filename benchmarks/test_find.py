@@ -0,0 +1,57 @@
+import pytest
+
+from registryspy import matching
+from registryspy import regf
+from registryspy import search
+from registryspy import search_index
+from registryspy import value_cache
+
+# Doesn't match anything, so every key and value is scanned
+TERM = "not in the hive"
+
+
+@pytest.mark.parametrize("categories", [(True, False, False), (True, True, True)], ids=["keys", "all"])
+def test_find(measure, hive_files, categories):
+    """Search a whole hive of about 5,000 keys as Find All does"""
+    hive = regf.open_hive(hive_files["deep"])
+    matcher = matching.Matcher(TERM)
+
+    def find():
+        return list(search.Search(matcher, *categories).matches(hive, hive.root(), include_start=True))
+
+    assert measure(find) == []
+
+
+def test_find_indexed(measure, hive_files):
+    filename = hive_files["deep"]
+    hive = regf.open_hive(filename)
+    index = search_index.build_index(filename, hive)
+    matcher = matching.Matcher(TERM)
+
+    def find():
+        return list(search.Search(matcher).matches(hive, hive.root(), include_start=True, index=index))
+
+    assert measure(find) == []
+
+
+def test_find_repeated(measure, hive_files):
+    """Search the data of a whole hive whose values were all shown in the value table"""
+    hive = regf.open_hive(hive_files["deep"])
+    buf = regf.buffer(hive)
+    matcher = matching.Matcher(TERM)
+    cache = value_cache.ValueCache()
+
+    def show(key):
+        for offset in regf.value_offsets(buf, key._nkrecord.offset()):
+            cache.formatted(hive, regf.cell_data_offset(offset))
+        for subkey in key.subkeys():
+            show(subkey)
+
+    def find():
+        return list(search.Search(matcher, cache=cache).matches(hive, hive.root(), include_start=True))
+
+    show(hive.root())
+    used = cache.used
+    assert measure(find) == []
+    # Searching doesn't add to the cache
+    assert cache.used == used
@@ -0,0 +1,139 @@
+import PySide6.QtCore as QtCore
+import pytest
+
+import regf_generator
+from registryspy import regf
+
+# Longest the first page of subkeys may take to load and show, a frame at 60 Hz
+FRAME_TIME = 1 / 60
+# Rows of the key tree that fit in a maximized window
+VISIBLE_ROWS = 64
+
+
+@pytest.fixture(scope="module")
+def huge_key_file(tmp_path_factory) -> str:
+    """A hive whose root has 200,000 subkeys in an ri list, kept out of the shared shapes since only one test reads it"""
+    shape = regf_generator.HiveShape(depth=1, fanout=200000, values_per_key=0, list_type="ri")
+    return regf_generator.write_hive(str(tmp_path_factory.mktemp("hives") / "huge_key.hiv"), shape)
+
+
+@pytest.mark.parametrize("shape", ["deep", "wide", "values"])
+def test_open_hive(measure, hive_files, shape):
+    measure(lambda: regf.open_hive(hive_files[shape]))
+
+
+@pytest.mark.parametrize("shape", ["deep", "wide"])
+def test_load_hive(measure, window, hive_files, shape):
+    """Open a hive in the key tree, from reading the file to showing its root key"""
+    filename = hive_files[shape]
+
+    def setup():
+        root = window.tree.roots.get(filename)
+        if root is not None:
+            window.tree.remove_hive(root)
+
+    measure(lambda _: window.tree.load_hive(filename), setup=setup)
+
+
+@pytest.mark.parametrize("list_type", ["lf", "lh", "li", "ri"])
+def test_load_subkeys(measure, qapp, hive_files, list_type):
+    """Load every subkey row of a key with 5,000 subkeys"""
+    from registryspy import key_tree
+
+    filename = hive_files[f"wide_{list_type}"]
+    hive = regf.open_hive(filename)
+
+    def setup():
+        model = key_tree.KeyTreeModel()
+        return model, model.add_hive(filename, hive)
+
+    def load(args):
+        model, root = args
+        model.fetch_until(root, len(root.subkey_offsets()) - 1)
+
+    measure(load, setup=setup)
+
+
+def test_first_page(measure, benchmark, qapp, huge_key_file):
+    """Expand a key with 200,000 subkeys and show the rows of its first page that fit in a window,
+    which has to take less than a frame"""
+    from registryspy import key_tree
+
+    hive = regf.open_hive(huge_key_file)
+
+    def setup():
+        model = key_tree.KeyTreeModel()
+        return model, model.add_hive(huge_key_file, hive)
+
+    def expand(args):
+        model, root = args
+        parent = model.index_for(root)
+        assert model.canFetchMore(parent)
+        model.fetchMore(parent)
+        for row in range(VISIBLE_ROWS):
+            for column in range(3):
+                model.data(model.index(row, column, parent))
+            model.hasChildren(model.index(row, 0, parent))
+        return model.rowCount(parent)
+
+    assert measure(expand, setup=setup) == key_tree.FETCH_SIZE
+    if not benchmark.disabled:
+        # The median, so that a slow round on a busy machine doesn't fail the run
+        assert benchmark.stats.stats.median < FRAME_TIME
+
+
+def test_key_rows(measure, qapp, hive_files):
+    """Decode and format every column of 5,000 subkey rows, as the view does when they are shown"""
+    from registryspy import key_tree
+
+    filename = hive_files["wide_lf"]
+    hive = regf.open_hive(filename)
+
+    def setup():
+        model = key_tree.KeyTreeModel()
+        root = model.add_hive(filename, hive)
+        model.fetch_until(root, len(root.subkey_offsets()) - 1)
+        return model, root
+
+    def show(args):
+        model, root = args
+        parent = model.index_for(root)
+        for row in range(model.rowCount(parent)):
+            for column in range(3):
+                model.data(model.index(row, column, parent))
+            model.hasChildren(model.index(row, 0, parent))
+
+    measure(show, setup=setup)
+
+
+def test_open_hives(measure, window, hive_files):
+    """Open every generated hive at once on worker threads, until the last one is in the key tree"""
+    filenames = list(hive_files.values())
+
+    def setup():
+        window.tree.remove_all_hives()
+
+    def open_all(_):
+        window.tree.open_hives(filenames)
+        while window.tree.loaders:
+            window.app.processEvents(QtCore.QEventLoop.ProcessEventsFlag.WaitForMoreEvents, 10)
+        assert len(window.tree.roots) == len(filenames)
+
+    measure(open_all, setup=setup)
+
+
+def test_restore_skeleton(measure, qapp, hive_files):
+    """Reopen a hive from the skeleton of a session in which its first two levels were shown"""
+    from registryspy import key_tree
+    from registryspy import session
+
+    filename = hive_files["deep"]
+    hive = regf.open_hive(filename)
+    model = key_tree.KeyTreeModel()
+    root = model.add_hive(filename, hive)
+    model.fetch_until(root, len(root.subkey_offsets()) - 1)
+    for child in root.children:
+        model.fetch_until(child, len(child.subkey_offsets()) - 1)
+    skeleton = {"fingerprint": session.fingerprint(filename, hive), "keys": model.skeleton(root)}
+
+    measure(lambda: key_tree.load_root(filename, skeleton=skeleton))
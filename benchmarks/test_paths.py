@@ -0,0 +1,41 @@
+from registryspy import key_cache
+from registryspy import regf
+
+PATH = "Key1_00007\\Key2_00003\\Key3_00005\\Key4_00001"
+
+
+def test_open_path(measure, hive_files):
+    hive = regf.open_hive(hive_files["deep"])
+    measure(lambda: hive.open(PATH))
+
+
+def test_open_path_cached(measure, hive_files):
+    cache = key_cache.KeyCache(regf.open_hive(hive_files["deep"]))
+    measure(lambda: cache.open(PATH))
+
+
+def test_open_path_sibling(measure, hive_files):
+    """Open a key whose parent is cached but which itself isn't"""
+    cache = key_cache.KeyCache(regf.open_hive(hive_files["deep"]))
+
+    def setup():
+        cache.clear()
+        cache.open(PATH.rsplit("\\", 1)[0])
+
+    measure(lambda _: cache.open(PATH), setup=setup)
+
+
+def test_select_key_from_path(measure, window, hive_files):
+    """Select a deep key in the key tree of a hive that was just opened"""
+    filename = hive_files["deep"]
+
+    def setup():
+        root = window.tree.roots.get(filename)
+        if root is not None:
+            window.tree.remove_hive(root)
+        window.tree.load_hive(filename)
+
+    def select(_):
+        assert window.tree.select_key_from_path(PATH) is not None
+
+    measure(select, setup=setup)
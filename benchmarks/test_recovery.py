@@ -0,0 +1,12 @@
+from registryspy import recovery
+from registryspy import regf
+
+
+def test_scan(measure, hive_files):
+    """Search the free cells of a hive for deleted keys and values and rebuild their subtrees"""
+    hive = regf.open_hive(hive_files["deleted"])
+    found = recovery.scan(hive)
+    # Each deleted key has a deleted subkey and a value, and leaves an orphaned value behind
+    assert found.key_count() > 0 and found.value_count() == found.key_count()
+    assert len(found.subkey_offsets(recovery.ROOT)) == found.key_count() // 2
+    measure(lambda: recovery.scan(hive))
@@ -0,0 +1,28 @@
+import io
+
+from registryspy import regf
+from registryspy import timeline
+
+
+def test_build_index(measure, hive_files):
+    hive = regf.open_hive(hive_files["wide"])
+    measure(lambda: timeline.build_index(hive))
+
+
+def test_query_range(measure, hive_files):
+    index = timeline.build_index(regf.open_hive(hive_files["wide"]))
+    start = index.first() + (index.last() - index.first()) // 4
+    end = start + (index.last() - index.first()) // 100
+    measure(lambda: timeline.query([index], start, end))
+
+
+def test_query_merged(measure, hive_files):
+    """Merge the keys of two hives written in the same range"""
+    indexes = [timeline.build_index(regf.open_hive(hive_files[name])) for name in ("deep", "wide_lf")]
+    measure(lambda: timeline.query(indexes))
+
+
+def test_export_body(measure, hive_files):
+    hives = [(hive_files["deep"], regf.open_hive(hive_files["deep"]))]
+    entries = timeline.query([timeline.build_index(hives[0][1])])
+    measure(lambda: timeline.export(io.StringIO(), hives, entries))
@@ -0,0 +1,94 @@
+from registryspy import regf
+
+
+def largest_key(hive):
+    """Returns the nk record offset of the subkey of the root with the most values"""
+    key = max(hive.root().subkeys(), key=lambda key: key.values_number())
+    return key._nkrecord.offset()
+
+
+def test_set_data(measure, window, hive_files):
+    """Show a key with 500 values that haven't been decoded before"""
+    hive = regf.open_hive(hive_files["values"])
+    offset = largest_key(hive)
+    table = window.value_table
+
+    def setup():
+        table.set_data()
+        table.value_model.cache.clear()
+
+    measure(lambda _: table.set_data(hive, offset), setup=setup)
+
+
+def test_decode_rows(measure, window, hive_files):
+    """Decode every row of a key with 500 values"""
+    hive = regf.open_hive(hive_files["values"])
+    offset = largest_key(hive)
+    model = window.value_table.value_model
+
+    def setup():
+        model.set_key(None, None)
+        model.cache.clear()
+        model.set_key(hive, offset)
+
+    def decode(_):
+        for row in range(model.rowCount()):
+            model.row_data(row)
+
+    measure(decode, setup=setup)
+
+
+def test_reselect_rows(measure, window, hive_files):
+    """Go back to a key with 500 values that were already decoded, and decode every row again"""
+    hive = regf.open_hive(hive_files["values"])
+    offset = largest_key(hive)
+    model = window.value_table.value_model
+
+    def setup():
+        model.cache.clear()
+        model.set_key(hive, offset)
+        for row in range(model.rowCount()):
+            model.row_data(row)
+        model.set_key(hive, hive.root()._nkrecord.offset())
+
+    def reselect(_):
+        model.set_key(hive, offset)
+        for row in range(model.rowCount()):
+            model.row_data(row)
+
+    measure(reselect, setup=setup)
+
+
+def test_select_big_values(measure, window, hive_files):
+    """Show a key with four 4 MB values, then select and paint each of its values in turn"""
+    hive = regf.open_hive(hive_files["big_values"])
+    offset = largest_key(hive)
+    table = window.value_table
+    viewer = window.data_viewer
+
+    def setup():
+        table.set_data()
+        table.value_model.cache.clear()
+
+    def select(_):
+        table.set_data(hive, offset)
+        for row in range(table.value_model.rowCount()):
+            table.value_model.row_data(row)
+            table.selectRow(row)
+            viewer.viewport().repaint()
+
+    measure(select, setup=setup)
+
+
+def test_set_value(measure, window, hive_files):
+    """Read the data of a 64 KB big data value and paint it in the data viewer"""
+    hive = regf.open_hive(hive_files["values"])
+    value = next(value for value in hive.root().subkeys()[0].values()
+                 if len(value.raw_data()) > 0x3FD8)
+    viewer = window.data_viewer
+
+    def show():
+        viewer.set_value(value.raw_data())
+        viewer.viewport().repaint()
+
+    measure(show)
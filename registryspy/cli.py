@@ -0,0 +1,328 @@
+import argparse
+import concurrent.futures
+import datetime
+import multiprocessing
+import os
+import re
+import struct
+import sys
+
+from Registry import Registry
+
+from . import diff
+from . import export
+from . import formatting
+from . import helpers
+from . import matching
+from . import regf
+from . import search
+from . import search_index
+from . import timeline
+
+
+class CommandError(Exception):
+    pass
+
+
+def open_hive(filename: str) -> Registry.Registry:
+    try:
+        return regf.open_hive(filename)
+    except OSError as e:
+        raise CommandError(f"{filename}: {e.strerror}")
+    except (Registry.RegistryParse.ParseException, struct.error):
+        raise CommandError(f"{filename}: unable to parse registry file")
+
+
+def open_key(hive: Registry.Registry, path: str) -> Registry.RegistryKey:
+    """Open a key from a path as shown in the navigation bar or in search results"""
+    path = formatting.parse_path(
+        path, hive.hive_type().name, hive.root().name())
+    if path == hive.root().name():
+        path = ""
+    try:
+        return hive.open(path) if path else hive.root()
+    except Registry.RegistryKeyNotFoundException:
+        raise CommandError(f"Key was not found: {path}")
+
+
+def walk(key: Registry.RegistryKey):
+    """Yield a key and all of its subkeys in tree order"""
+    stack = [key]
+    while stack:
+        key = stack.pop()
+        yield key
+        stack.extend(reversed(key.subkeys()))
+
+
+def value_line(value: Registry.RegistryValue) -> str:
+    try:
+        datatype = formatting.reg_type_to_str(value.value_type())
+    except (Registry.RegistryParse.ParseException, struct.error):
+        datatype = "UNKNOWN"
+    data = formatting.format_value(value)[0]
+    return f"{value.name()}\t{datatype}\t{data}"
+
+
+def command_ls(args) -> int:
+    hive = open_hive(args.hive)
+    start = open_key(hive, args.path)
+    keys = walk(start) if args.recursive else start.subkeys()
+    for key in keys:
+        if key is start:
+            continue
+        name = key.path() if args.recursive else key.name()
+        if args.long:
+            print(f"{key.timestamp()}\t{key.subkeys_number()}\t{key.values_number()}\t{name}")
+        else:
+            print(name)
+    return 0
+
+
+def command_cat(args) -> int:
+    hive = open_hive(args.hive)
+    key = open_key(hive, args.path)
+    if args.value is None:
+        for value in key.values():
+            print(value_line(value))
+        return 0
+
+    try:
+        value = key.value(args.value)
+    except Registry.RegistryValueNotFoundException:
+        raise CommandError(f"Value was not found: {args.value}")
+    if args.raw:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(value.raw_data())
+    else:
+        print(formatting.format_value(value)[0])
+    return 0
+
+
+def command_dump(args) -> int:
+    hive = open_hive(args.hive)
+    for key in walk(open_key(hive, args.path)):
+        print(f"[{key.path()}]\t{key.timestamp()}")
+        for value in key.values():
+            print(value_line(value))
+        print()
+    return 0
+
+
+def command_export(args) -> int:
+    hive = open_hive(args.hive)
+    key = open_key(hive, args.path)
+    if args.output is None:
+        export.export(sys.stdout, hive, key, args.format or "jsonl")
+        return 0
+
+    progress = None
+    if sys.stderr.isatty():
+        def progress(keys, values):
+            print(f"\rExported {keys:,} keys, {values:,} values", end="", file=sys.stderr)
+    try:
+        export.export_file(args.output, hive, key, args.format or export.format_for(args.output),
+                           progress=progress)
+    except OSError as e:
+        raise CommandError(f"{args.output}: {e.strerror}")
+    finally:
+        if progress is not None:
+            print(file=sys.stderr)
+    return 0
+
+
+def command_diff(args) -> int:
+    old_hive = open_hive(args.old)
+    new_hive = open_hive(args.new)
+    changes = diff.diff(old_hive, diff.hash_hive(old_hive), new_hive, diff.hash_hive(new_hive))
+    found = False
+    for change in changes:
+        found = True
+        print(f"{change.change_type.name}\t{change.path}\t{change.value or ''}")
+    return 1 if found else 0
+
+
+def parse_time(text: str) -> int:
+    """Parse an ISO 8601 UTC time given on the command line into a FILETIME"""
+    if text is None:
+        return None
+    try:
+        value = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise CommandError(f"Invalid time: {text}")
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return regf.datetime_to_filetime(value)
+
+
+def command_timeline(args) -> int:
+    start = parse_time(args.after)
+    end = parse_time(args.before)
+    hives = [(filename, open_hive(filename)) for filename in args.hives]
+    entries = timeline.query([timeline.build_index(hive) for _, hive in hives], start, end)
+    if args.output is None:
+        timeline.export(sys.stdout, hives, entries, args.format or "body")
+        return 0
+    try:
+        timeline.export_file(args.output, hives, entries, args.format or timeline.format_for(args.output))
+    except OSError as e:
+        raise CommandError(f"{args.output}: {e.strerror}")
+    return 0
+
+
+def find_sequential(args, matcher: matching.Matcher, categories: tuple):
+    """Yield (filename, ResultType, key, value) for each match, searching the hives one at a time"""
+    for filename in args.hives:
+        hive = open_hive(filename)
+        index = search_index.load_index(filename, hive) if args.index else None
+        finder = search.Search(matcher, *categories)
+        for result_type, key, value in finder.matches(hive, hive.root(), include_start=True, index=index):
+            yield filename, result_type, key, value
+
+
+def find_parallel(args, matcher: matching.Matcher, categories: tuple):
+    """Yield (filename, ResultType, key, value) for each match, searching the hives on a process pool"""
+    hives = {filename: open_hive(filename) for filename in args.hives}
+    jobs = search.plan_jobs(list(hives), hives)
+    options = (matcher.term, matcher.case_sensitive, matcher.exact_match, matcher.regex) + categories
+    cancel_event = multiprocessing.Event()
+    counters = multiprocessing.Array("q", 2)
+    with concurrent.futures.ProcessPoolExecutor(args.jobs, initializer=search.init_pool_process,
+                                                initargs=(cancel_event, counters)) as pool:
+        futures = [pool.submit(search.run_job, job, *options) for job in jobs]
+        try:
+            for job, future in zip(jobs, futures):
+                for result_type, key, value in future.result():
+                    yield job.filename, result_type, key, value
+        finally:
+            # Stop the remaining jobs if the output was closed or the search interrupted
+            cancel_event.set()
+            for future in futures:
+                future.cancel()
+
+
+def command_find(args) -> int:
+    categories = (args.keys, args.values, args.data)
+    if not any(categories):
+        categories = (True, True, True)
+    try:
+        matcher = matching.Matcher(args.term, case_sensitive=args.case_sensitive,
+                                   exact_match=args.exact, regex=args.regex)
+    except re.error as e:
+        raise CommandError(f"Invalid regular expression: {e}")
+
+    if args.jobs > 1 and not args.index:
+        results = find_parallel(args, matcher, categories)
+    else:
+        results = find_sequential(args, matcher, categories)
+
+    found = False
+    for filename, result_type, key, value in results:
+        found = True
+        print(f"{filename}\t{result_type.name}\t{key}\t{value or ''}")
+    return 0 if found else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="registryspy-cli", description=f"Command-line interface of {helpers.APP_NAME}")
+    parser.add_argument("--version", action="version",
+                        version=".".join(str(i) for i in helpers.VERSION))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ls = subparsers.add_parser("ls", help="list the subkeys of a key")
+    ls.add_argument("hive")
+    ls.add_argument("path", nargs="?", default="")
+    ls.add_argument("-r", "--recursive", action="store_true",
+                    help="list every key below the key by its full path")
+    ls.add_argument("-l", "--long", action="store_true",
+                    help="show the last written time and the subkey and value counts")
+    ls.set_defaults(func=command_ls)
+
+    cat = subparsers.add_parser("cat", help="print the values of a key")
+    cat.add_argument("hive")
+    cat.add_argument("path", nargs="?", default="")
+    cat.add_argument("value", nargs="?",
+                     help="only print the data of this value")
+    cat.add_argument("--raw", action="store_true",
+                     help="write the raw bytes of the value's data")
+    cat.set_defaults(func=command_cat)
+
+    find = subparsers.add_parser(
+        "find", help="search the keys, values and data of hives")
+    find.add_argument("term")
+    find.add_argument("hives", nargs="+", metavar="hive")
+    find.add_argument("-k", "--keys", action="store_true",
+                      help="search key names")
+    find.add_argument("-v", "--values", action="store_true",
+                      help="search value names")
+    find.add_argument("-d", "--data", action="store_true",
+                      help="search value data (all three are searched if none are given)")
+    find.add_argument("-c", "--case-sensitive", action="store_true")
+    find.add_argument("-x", "--exact", action="store_true",
+                      help="only match whole names and data")
+    find.add_argument("-e", "--regex", action="store_true",
+                      help="treat the term as a regular expression")
+    find.add_argument("-i", "--index", action="store_true",
+                      help="use the saved search index of each hive if it is up to date")
+    find.add_argument("-j", "--jobs", type=int, default=1,
+                      help="number of processes to search with")
+    find.set_defaults(func=command_find)
+
+    diff_parser = subparsers.add_parser(
+        "diff", help="list the keys and values added, removed or modified between two hives")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.set_defaults(func=command_diff)
+
+    timeline_parser = subparsers.add_parser(
+        "timeline", help="list the keys of hives by last written time as a bodyfile or CSV")
+    timeline_parser.add_argument("hives", nargs="+", metavar="hive")
+    timeline_parser.add_argument("-a", "--after",
+                                 help="only list keys written at or after this UTC time, e.g. 2023-01-31T12:00:00")
+    timeline_parser.add_argument("-b", "--before",
+                                 help="only list keys written at or before this UTC time")
+    timeline_parser.add_argument("-o", "--output",
+                                 help="file to write to instead of standard output")
+    timeline_parser.add_argument("-f", "--format", choices=timeline.FORMATS,
+                                 help="output format, from the output file extension by default")
+    timeline_parser.set_defaults(func=command_timeline)
+
+    dump = subparsers.add_parser(
+        "dump", help="print a key and everything below it")
+    dump.add_argument("hive")
+    dump.add_argument("path", nargs="?", default="")
+    dump.set_defaults(func=command_dump)
+
+    export_parser = subparsers.add_parser(
+        "export", help="export a key and everything below it as JSON Lines or CSV")
+    export_parser.add_argument("hive")
+    export_parser.add_argument("path", nargs="?", default="")
+    export_parser.add_argument("-o", "--output",
+                               help="file to write to instead of standard output")
+    export_parser.add_argument("-f", "--format", choices=export.FORMATS,
+                               help="output format, from the output file extension by default")
+    export_parser.set_defaults(func=command_export)
+
+    return parser
+
+
+def main(argv: "list[str]" = None) -> int:
+    args = build_parser().parse_args(argv)
+    # Names and data can hold characters the terminal can't show
+    sys.stdout.reconfigure(errors="backslashreplace")
+    try:
+        return args.func(args)
+    except CommandError as e:
+        print(f"registryspy-cli: {e}", file=sys.stderr)
+        return 2
+    except BrokenPipeError:
+        # The output was closed early, e.g. by piping into head
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,53 +1,187 @@
+import PySide6.QtCore as QtCore
 import PySide6.QtGui as QtGui
 import PySide6.QtWidgets as QtWidgets
 
 from . import helpers
+from . import profiling
+from . import regf
 
 
-class DataViewer(QtWidgets.QSplitter):
-    """Viewer to preview data of the selected registry key entry."""
+BYTES_PER_LINE = 16
 
-    def __init__(self):
-        super().__init__(QtGui.Qt.Orientation.Horizontal)
-
-        mono_font = QtGui.QFont()
-        mono_font.setFamilies(["DejaVu Sans Mono", "Courier New", "Monospaced"])
-        mono_font.setStyleHint(QtGui.QFont.Monospace)
-
-        self.value_hex = self.add_data_viewer(mono_font)
-        self.value_ascii = self.add_data_viewer(mono_font)
-
-    def add_data_viewer(self, font: QtGui.QFont):
-        """Create a data viewer widget and add it to this widget."""
-
-        viewer = QtWidgets.QPlainTextEdit()
-        viewer.setReadOnly(True)
-        viewer.setFont(font)
-        viewer.setLineWrapMode(viewer.LineWrapMode.NoWrap)
-        self.addWidget(viewer)
-        return viewer
 
-    def set_value(self, bytes: bytes):
-        """Set the value of all displayed viewers to the specified bytes."""
+class DataViewer(QtWidgets.QAbstractScrollArea):
+    """Viewer to preview data of the selected registry key entry.
 
-        self.value_hex.setPlainText("")
-        self.value_ascii.setPlainText("")
+    Only the lines that are visible are read, formatted and painted, so the cost of showing a value
+    does not depend on its size."""
 
-        def chunks(lst, n):
-            """Yield successive n-sized chunks from lst."""
-            for i in range(0, len(lst), n):
-                yield lst[i : i + n]
-
-        hex_text = ""
-        ascii_text = ""
-
-        for chunk in chunks(bytes, 16):
-            hex_text += " ".join(["{:02x}".format(x) for x in chunk]) + "\n"
-
-            # Decode text, replace control/non-printable characters
-            decoded_text = helpers.bytes_to_printable(chunk)
+    def __init__(self):
+        super().__init__()
 
-            ascii_text += decoded_text + "\n"
+        # Either can be sliced for the visible lines without reading the rest of the data
+        self.data: "memoryview | regf.DataReader" = memoryview(b"")
+        # Selected bytes as (anchor, cursor), both inclusive
+        self.selection: "tuple[int, int]" = None
+        self.selecting_ascii = False
 
-        self.value_hex.setPlainText(hex_text)
-        self.value_ascii.setPlainText(ascii_text)
+        mono_font = QtGui.QFont()
+        mono_font.setFamilies(["DejaVu Sans Mono", "Courier New", "Monospaced"])
+        mono_font.setStyleHint(QtGui.QFont.Monospace)
+        self.setFont(mono_font)
+        self.viewport().setCursor(QtCore.Qt.CursorShape.IBeamCursor)
+        self.setFocusPolicy(QtCore.Qt.FocusPolicy.StrongFocus)
+
+        self.update_metrics()
+
+    def update_metrics(self):
+        """Recalculate the column layout for the current font"""
+        # Glyph advances are fractional, rounding them would misalign long lines
+        metrics = QtGui.QFontMetricsF(self.font())
+        self.char_width = metrics.horizontalAdvance("0")
+        self.line_height = round(metrics.lineSpacing())
+        self.ascent = metrics.ascent()
+        self.margin = self.char_width
+
+        self.hex_x = self.margin + self.char_width * 10
+        self.ascii_x = self.hex_x + self.char_width * (BYTES_PER_LINE * 3 + 1)
+        self.content_width = self.ascii_x + self.char_width * BYTES_PER_LINE + self.margin
+
+    def line_count(self) -> int:
+        return (len(self.data) + BYTES_PER_LINE - 1) // BYTES_PER_LINE
+
+    def visible_lines(self) -> int:
+        return max(1, self.viewport().height() // self.line_height)
+
+    def update_scrollbars(self):
+        visible = self.visible_lines()
+        self.verticalScrollBar().setRange(0, max(0, self.line_count() - visible))
+        self.verticalScrollBar().setPageStep(visible)
+        self.verticalScrollBar().setSingleStep(1)
+        self.horizontalScrollBar().setRange(
+            0, max(0, round(self.content_width) - self.viewport().width()))
+        self.horizontalScrollBar().setPageStep(self.viewport().width())
+        self.horizontalScrollBar().setSingleStep(round(self.char_width))
+
+    def set_value(self, data: "bytes | regf.DataReader"):
+        """Show the specified bytes, or the data of a reader, which is read a page at a time as it is scrolled to."""
+
+        with profiling.span("set_value") as span:
+            if len(data) > 0:
+                span.add(values=1)
+            self.data = data if isinstance(data, regf.DataReader) else memoryview(data)
+            self.selection = None
+            self.verticalScrollBar().setValue(0)
+            self.horizontalScrollBar().setValue(0)
+            self.update_scrollbars()
+            self.viewport().update()
+
+    def selected_range(self) -> "tuple[int, int]":
+        """Returns the selection as a (start, end) slice, or None"""
+        if self.selection is None or len(self.data) == 0:
+            return None
+        anchor, cursor = self.selection
+        return min(anchor, cursor), max(anchor, cursor) + 1
+
+    def byte_at(self, pos: QtCore.QPoint) -> int:
+        """Returns the index of the byte under a viewport position"""
+        line = self.verticalScrollBar().value() + max(0, pos.y()) // self.line_height
+        x = pos.x() + self.horizontalScrollBar().value()
+        if self.selecting_ascii:
+            column = int((x - self.ascii_x) // self.char_width)
+        else:
+            column = int((x - self.hex_x + self.char_width / 2) // (self.char_width * 3))
+        column = min(max(column, 0), BYTES_PER_LINE - 1)
+        return min(line * BYTES_PER_LINE + column, len(self.data) - 1)
+
+    def paintEvent(self, event: QtGui.QPaintEvent):
+        painter = QtGui.QPainter(self.viewport())
+        palette = self.palette()
+        painter.fillRect(self.viewport().rect(), palette.base())
+
+        first_line = self.verticalScrollBar().value()
+        last_line = min(self.line_count(), first_line + self.visible_lines() + 1)
+        x_offset = -self.horizontalScrollBar().value()
+        selected = self.selected_range()
+
+        # Offset gutter
+        painter.fillRect(QtCore.QRectF(0, 0, x_offset + self.hex_x - self.char_width, self.viewport().height()),
+                         palette.alternateBase())
+
+        page_start = first_line * BYTES_PER_LINE
+        page = memoryview(self.data[page_start:last_line * BYTES_PER_LINE])
+        for line in range(first_line, last_line):
+            start = line * BYTES_PER_LINE
+            chunk = page[start - page_start:start - page_start + BYTES_PER_LINE]
+            y = (line - first_line) * self.line_height
+
+            if selected is not None and selected[0] < start + len(chunk) and selected[1] > start:
+                first = max(selected[0], start) - start
+                last = min(selected[1], start + len(chunk)) - start
+                painter.fillRect(QtCore.QRectF(x_offset + self.hex_x + first * 3 * self.char_width, y,
+                                               ((last - first) * 3 - 1) * self.char_width, self.line_height),
+                                 palette.highlight())
+                painter.fillRect(QtCore.QRectF(x_offset + self.ascii_x + first * self.char_width, y,
+                                               (last - first) * self.char_width, self.line_height),
+                                 palette.highlight())
+
+            baseline = y + self.ascent
+            painter.setPen(palette.color(QtGui.QPalette.ColorRole.PlaceholderText))
+            painter.drawText(QtCore.QPointF(x_offset + self.margin, baseline), "%08x" % start)
+            painter.setPen(palette.color(QtGui.QPalette.ColorRole.Text))
+            painter.drawText(QtCore.QPointF(x_offset + self.hex_x, baseline), chunk.hex(" "))
+            painter.drawText(QtCore.QPointF(x_offset + self.ascii_x, baseline),
+                             helpers.bytes_to_printable(chunk))
+
+    def resizeEvent(self, event: QtGui.QResizeEvent):
+        super().resizeEvent(event)
+        self.update_scrollbars()
+
+    def changeEvent(self, event: QtCore.QEvent):
+        super().changeEvent(event)
+        if event.type() == QtCore.QEvent.Type.FontChange:
+            self.update_metrics()
+            self.update_scrollbars()
+
+    def mousePressEvent(self, event: QtGui.QMouseEvent):
+        if event.button() != QtCore.Qt.MouseButton.LeftButton or len(self.data) == 0:
+            return super().mousePressEvent(event)
+        x = event.position().toPoint().x() + self.horizontalScrollBar().value()
+        self.selecting_ascii = x >= self.ascii_x - self.char_width
+        index = self.byte_at(event.position().toPoint())
+        self.selection = (index, index)
+        self.viewport().update()
+
+    def mouseMoveEvent(self, event: QtGui.QMouseEvent):
+        if self.selection is None or not event.buttons() & QtCore.Qt.MouseButton.LeftButton:
+            return super().mouseMoveEvent(event)
+        pos = event.position().toPoint()
+        # Scroll while dragging past the top or bottom edge
+        if pos.y() < 0:
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() - 1)
+        elif pos.y() > self.viewport().height():
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() + 1)
+        self.selection = (self.selection[0], self.byte_at(pos))
+        self.viewport().update()
+
+    def keyPressEvent(self, event: QtGui.QKeyEvent):
+        if event.matches(QtGui.QKeySequence.StandardKey.Copy):
+            self.copy()
+        elif event.matches(QtGui.QKeySequence.StandardKey.SelectAll):
+            if len(self.data) > 0:
+                self.selection = (0, len(self.data) - 1)
+                self.viewport().update()
+        else:
+            super().keyPressEvent(event)
+
+    def copy(self):
+        """Copy the selected bytes as hex, or as text if the selection was made in the text column"""
+        selected = self.selected_range()
+        if selected is None:
+            return
+        chunk = self.data[selected[0]:selected[1]]
+        if self.selecting_ascii:
+            text = helpers.bytes_to_printable(chunk)
+        else:
+            text = chunk.hex(" ")
+        QtWidgets.QApplication.clipboard().setText(text)
@@ -0,0 +1,257 @@
+import array
+import bisect
+import collections
+import enum
+import hashlib
+import struct
+
+from Registry import Registry
+
+from . import regf
+
+
+# Bytes of each key and value hash
+DIGEST_SIZE = 16
+# Hash of a subkey whose nk record can't be parsed
+INVALID_DIGEST = bytes(DIGEST_SIZE)
+# Keys hashed or compared between progress reports
+PROGRESS_INTERVAL = 1000
+
+
+class ChangeType(enum.Enum):
+    ADDED = 0
+    REMOVED = 1
+    MODIFIED = 2
+
+
+# A changed key, or a changed value of a key if value isn't None. old_offset and new_offset are the
+# offsets of the key's nk record in each hive, None in the hive the key is missing from.
+Change = collections.namedtuple(
+    "Change", ["change_type", "path", "value", "old_offset", "new_offset"])
+
+
+class KeyHashes:
+    """Hashes of the keys of a hive by the offset of their nk records, in 20 bytes per key"""
+
+    def __init__(self, offsets: array.array, digests: bytearray):
+        # Ascending, with the digest of the key at offsets[i] at digests[i * DIGEST_SIZE]
+        self.offsets = offsets
+        self.digests = digests
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def position(self, offset: int) -> int:
+        """Returns the position of a key's digest, or -1 if the key wasn't hashed"""
+        i = bisect.bisect_left(self.offsets, offset)
+        return i if i < len(self.offsets) and self.offsets[i] == offset else -1
+
+    def get(self, offset: int) -> bytes:
+        """Returns the digest of the key whose nk record is at offset, or None if it wasn't hashed"""
+        i = self.position(offset)
+        return None if i < 0 else bytes(self.digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE])
+
+
+def _join(path: str, name: str) -> str:
+    return name if path == "" else path + "\\" + name
+
+
+def _value_digest(buf, offset: int) -> bytes:
+    """Hash the name, type and data of the vk record at offset.
+
+    Names are hashed as stored rather than decoded, which is much faster on large hives."""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    try:
+        name_length, = struct.unpack_from("<H", buf, offset + 0x2)
+        data = regf.value_data(buf, offset)
+        # The data type and the flags, which tell how the name is encoded
+        digest.update(buf[offset + 0xC:offset + 0x12])
+        digest.update(buf[offset + 0x14:offset + 0x14 + name_length])
+        digest.update(struct.pack("<HQ", name_length, len(data)))
+        digest.update(data)
+    except (Registry.RegistryParse.ParseException, struct.error):
+        digest.update(b"(invalid value)")
+    return digest.digest()
+
+
+def _value_offsets(buf, offset: int):
+    try:
+        return [regf.cell_data_offset(value) for value in regf.value_offsets(buf, offset)]
+    except (Registry.RegistryParse.ParseException, struct.error):
+        return ()
+
+
+def _values(buf, offset: int) -> "dict[str, tuple[str, bytes]]":
+    """Returns the name and hash of each value of the nk record at offset, by lowercase name"""
+    values = {}
+    for value_offset in _value_offsets(buf, offset):
+        try:
+            name = regf.value_name(buf, value_offset)
+        except struct.error:
+            continue
+        values[name.lower()] = (name, _value_digest(buf, value_offset))
+    return values
+
+
+def _own_digest(buf, offset: int) -> bytes:
+    """Hash the name, timestamp and values of the nk record at offset, but not its subkeys"""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    flags, = struct.unpack_from("<H", buf, offset + 0x2)
+    name_length, = struct.unpack_from("<H", buf, offset + 0x48)
+    # The flag that tells how the name is encoded
+    digest.update(struct.pack("<QHH", regf.key_timestamp(buf, offset), flags & 0x0020, name_length))
+    digest.update(buf[offset + 0x4C:offset + 0x4C + name_length])
+    # Sorted so that the order of the value list doesn't matter
+    for value_digest in sorted(_value_digest(buf, value) for value in _value_offsets(buf, offset)):
+        digest.update(value_digest)
+    return digest.digest()
+
+
+def _subkeys(buf, offset: int):
+    try:
+        return regf.subkey_offsets(buf, offset)
+    except (Registry.RegistryParse.ParseException, struct.error):
+        return ()
+
+
+def hash_hive(hive: Registry.Registry, progress=None, cancelled=None) -> KeyHashes:
+    """Hash every key of a hive from the bottom up.
+
+    A key's hash covers its name, timestamp and values and the hashes of its subkeys, so two
+    keys with the same hash have identical subtrees. progress is called with the number of keys
+    hashed so far, and hashing stops early, returning None, once cancelled returns True."""
+    buf = regf.buffer(hive)
+
+    # Every valid key in tree order, so that reversing it hashes subkeys before their parents, and the
+    # position in it of each key's parent
+    order = array.array("I")
+    parents = array.array("i")
+    # One bit per 8 byte aligned cell
+    seen = bytearray(len(buf) // 64 + 1)
+    stack = [(regf.root_offset(hive), -1)]
+    while stack:
+        offset, parent = stack.pop()
+        cell = offset >> 3
+        if offset >= len(buf) or seen[cell >> 3] & (1 << (cell & 7)):
+            # Don't loop forever on a damaged hive whose subkey lists form a cycle
+            continue
+        seen[cell >> 3] |= 1 << (cell & 7)
+        try:
+            regf.check_key(buf, offset)
+        except Registry.RegistryParse.ParseException:
+            continue
+        position = len(order)
+        order.append(offset)
+        parents.append(parent)
+        stack.extend((regf.cell_data_offset(subkey), position) for subkey in _subkeys(buf, offset))
+    del seen
+
+    digests = bytearray(DIGEST_SIZE * len(order))
+    # Digests of the subkeys of keys that aren't hashed yet, by the position of the key. Only the
+    # ancestors of the key being hashed can have any, so few are held at a time
+    pending: "dict[int, dict[int, bytes]]" = {}
+    for keys, position in enumerate(range(len(order) - 1, -1, -1), 1):
+        offset = order[position]
+        digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        try:
+            digest.update(_own_digest(buf, offset))
+        except struct.error:
+            digest.update(b"(invalid key)")
+        subkey_digests = pending.pop(position, {})
+        for subkey in _subkeys(buf, offset):
+            digest.update(subkey_digests.get(regf.cell_data_offset(subkey), INVALID_DIGEST))
+        key_digest = digest.digest()
+        digests[position * DIGEST_SIZE:(position + 1) * DIGEST_SIZE] = key_digest
+        if parents[position] >= 0:
+            pending.setdefault(parents[position], {})[offset] = key_digest
+
+        if keys % PROGRESS_INTERVAL == 0:
+            if progress is not None:
+                progress(keys)
+            if cancelled is not None and cancelled():
+                return None
+    del parents
+
+    # Sorted by offset so that digests can be looked up by offset
+    ranked = sorted(range(len(order)), key=order.__getitem__)
+    sorted_digests = bytearray(len(digests))
+    for rank, position in enumerate(ranked):
+        sorted_digests[rank * DIGEST_SIZE:(rank + 1) * DIGEST_SIZE] = \
+            digests[position * DIGEST_SIZE:(position + 1) * DIGEST_SIZE]
+    return KeyHashes(array.array("I", map(order.__getitem__, ranked)), sorted_digests)
+
+
+def _children(buf, offset: int) -> "dict[str, tuple[str, int]]":
+    """Returns the name and nk record offset of each subkey of the nk record at offset, by lowercase name"""
+    children = {}
+    for subkey in _subkeys(buf, offset):
+        subkey = regf.cell_data_offset(subkey)
+        try:
+            regf.check_key(buf, subkey)
+            name = regf.key_name(buf, subkey)
+        except (Registry.RegistryParse.ParseException, struct.error):
+            continue
+        children[name.lower()] = (name, subkey)
+    return children
+
+
+def diff(old_hive: Registry.Registry, old_hashes: KeyHashes, new_hive: Registry.Registry, new_hashes: KeyHashes, progress=None, cancelled=None):
+    """Yield a Change for every key and value added, removed or modified between two hives, in tree order.
+
+    Keys are matched by name from the roots down, and keys whose hashes are equal are skipped without
+    looking at anything below them, so only the branches that changed are read. Keys below an added
+    or removed key aren't reported separately. progress is called with the number of keys compared."""
+    old_buf = regf.buffer(old_hive)
+    new_buf = regf.buffer(new_hive)
+
+    # (path, old offset, new offset) of the keys still to compare, either offset is None for a key
+    # that only exists in one of the hives
+    stack = [("", regf.root_offset(old_hive), regf.root_offset(new_hive))]
+    compared = 0
+    while stack:
+        path, old, new = stack.pop()
+        if old is None:
+            yield Change(ChangeType.ADDED, path, None, None, new)
+            continue
+        if new is None:
+            yield Change(ChangeType.REMOVED, path, None, old, None)
+            continue
+        old_digest = old_hashes.get(old)
+        if old_digest is not None and old_digest == new_hashes.get(new):
+            continue
+
+        compared += 1
+        if compared % PROGRESS_INTERVAL == 0:
+            if progress is not None:
+                progress(compared)
+            if cancelled is not None and cancelled():
+                return
+
+        try:
+            key_changed = _own_digest(old_buf, old) != _own_digest(new_buf, new)
+        except struct.error:
+            key_changed = True
+        if key_changed:
+            yield Change(ChangeType.MODIFIED, path, None, old, new)
+            old_values = _values(old_buf, old)
+            new_values = _values(new_buf, new)
+            for value_name in sorted(old_values.keys() | new_values.keys()):
+                if value_name not in new_values:
+                    yield Change(ChangeType.REMOVED, path, old_values[value_name][0], old, new)
+                elif value_name not in old_values:
+                    yield Change(ChangeType.ADDED, path, new_values[value_name][0], old, new)
+                elif old_values[value_name] != new_values[value_name]:
+                    yield Change(ChangeType.MODIFIED, path, new_values[value_name][0], old, new)
+
+        old_children = _children(old_buf, old)
+        new_children = _children(new_buf, new)
+        names = sorted(old_children.keys() | new_children.keys())
+        # Pushed in reverse so that subkeys are popped in name order
+        for name in reversed(names):
+            old_child = old_children.get(name)
+            new_child = new_children.get(name)
+            stack.append((_join(path, (new_child or old_child)[0]),
+                          old_child and old_child[1], new_child and new_child[1]))
+
+    if progress is not None:
+        progress(compared)
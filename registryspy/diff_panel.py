@@ -0,0 +1,340 @@
+import struct
+import threading
+
+from Registry import Registry
+import PySide6.QtCore as QtCore
+import PySide6.QtGui as QtGui
+import PySide6.QtWidgets as QtWidgets
+
+from . import diff
+from . import formatting
+from . import helpers
+from . import regf
+
+# Bytes of value data shown in the old and new data columns
+PREVIEW_BYTES = 64
+# Translucent, so that the highlighted keys and values stay readable with any style
+CHANGE_COLORS = {
+    diff.ChangeType.ADDED: QtGui.QColor(0, 170, 0, 70),
+    diff.ChangeType.REMOVED: QtGui.QColor(220, 0, 0, 70),
+    diff.ChangeType.MODIFIED: QtGui.QColor(230, 170, 0, 80),
+}
+
+
+class DiffWorkerSignals(QtCore.QObject):
+    progress = QtCore.Signal(str)
+    # Changes, and the hashes of each hive by filename so they can be reused
+    finished = QtCore.Signal(list, object)
+    cancelled = QtCore.Signal()
+    error = QtCore.Signal(str)
+
+
+class DiffWorker(QtCore.QRunnable):
+    """Hashes two hives, unless their hashes are already known, and compares them on a worker thread"""
+
+    def __init__(self, old_filename: str, old_hive: Registry.Registry, old_hashes: diff.KeyHashes, new_filename: str, new_hive: Registry.Registry, new_hashes: diff.KeyHashes):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.old_filename = old_filename
+        self.new_filename = new_filename
+        self.filenames = {old_filename, new_filename}
+        self.hives = {old_filename: old_hive, new_filename: new_hive}
+        self.hashes = {old_filename: old_hashes, new_filename: new_hashes}
+
+        self.signals = DiffWorkerSignals()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        try:
+            try:
+                for filename, hive in self.hives.items():
+                    if self.hashes[filename] is None:
+                        self.hashes[filename] = diff.hash_hive(
+                            hive, lambda keys: self.signals.progress.emit(f"Hashing {filename}: {keys:,} keys"),
+                            self.is_cancelled)
+                    if self.hashes[filename] is None:
+                        self.signals.cancelled.emit()
+                        return
+
+                changes = list(diff.diff(
+                    self.hives[self.old_filename], self.hashes[self.old_filename],
+                    self.hives[self.new_filename], self.hashes[self.new_filename],
+                    lambda keys: self.signals.progress.emit(f"Comparing: {keys:,} keys"),
+                    self.is_cancelled))
+            except (Registry.RegistryParse.RegistryException, struct.error) as e:
+                self.signals.error.emit(str(e))
+                return
+            if self.is_cancelled():
+                self.signals.cancelled.emit()
+                return
+            self.signals.finished.emit(changes, self.hashes)
+        finally:
+            self._finished.set()
+
+
+class DiffModel(QtCore.QAbstractTableModel):
+    """Table model of the differences between two hives"""
+
+    HEADERS = ["Change", "Key", "Value", "Old Data", "New Data"]
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.changes: "list[diff.Change]" = []
+        self.old_hive: Registry.Registry = None
+        self.new_hive: Registry.Registry = None
+        # Formatted old and new data of the value changes shown so far, by row
+        self.previews: "dict[int, tuple[str, str]]" = {}
+
+    def set_changes(self, old_hive: Registry.Registry, new_hive: Registry.Registry, changes: "list[diff.Change]"):
+        self.beginResetModel()
+        self.old_hive = old_hive
+        self.new_hive = new_hive
+        self.changes = changes
+        self.previews = {}
+        self.endResetModel()
+
+    def preview(self, hive: Registry.Registry, offset: int, name: str) -> str:
+        """Format the data of a value of the key whose nk record is at offset"""
+        if offset is None:
+            return ""
+        try:
+            value = regf.open_key(hive, offset).value(name)
+        except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError):
+            return ""
+        return formatting.format_value(value, limit=PREVIEW_BYTES)[0]
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.changes)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return len(self.HEADERS)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        change = self.changes[index.row()]
+        column = index.column()
+        if column == 0:
+            return change.change_type.name.capitalize()
+        if column == 1:
+            return change.path
+        if column == 2:
+            return change.value or ""
+
+        if change.value is None:
+            return ""
+        if index.row() not in self.previews:
+            old = "" if change.change_type == diff.ChangeType.ADDED else self.preview(
+                self.old_hive, change.old_offset, change.value)
+            new = "" if change.change_type == diff.ChangeType.REMOVED else self.preview(
+                self.new_hive, change.new_offset, change.value)
+            self.previews[index.row()] = (old, new)
+        return self.previews[index.row()][column - 3]
+
+    def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+
+class DiffPanel(QtWidgets.QDockWidget):
+    """Dockable list of the keys and values added, removed and modified between two open hives"""
+
+    # (hive filename, nk record offset, value name or None)
+    activated = QtCore.Signal(str, object, object)
+    # Colors of the changed keys by hive filename and nk record offset, and of the changed values by
+    # lowercase name by (hive, nk record offset) of their key
+    changes_shown = QtCore.Signal(object, object)
+
+    def __init__(self, *args):
+        super().__init__("Hive Differences", *args)
+        self.setObjectName("hive_differences")
+
+        self.hives: "dict[str, Registry.Registry]" = {}
+        # Key hashes of the hives compared so far, by filename
+        self.hashes: "dict[str, diff.KeyHashes]" = {}
+        self.worker: DiffWorker = None
+        self.old_filename: str = None
+        self.new_filename: str = None
+
+        container = QtWidgets.QWidget(self)
+        layout = QtWidgets.QVBoxLayout(container)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        hives = QtWidgets.QHBoxLayout()
+        hives.addWidget(QtWidgets.QLabel("Old:", container))
+        self.old_hive = QtWidgets.QComboBox(container)
+        self.old_hive.setSizeAdjustPolicy(QtWidgets.QComboBox.SizeAdjustPolicy.AdjustToMinimumContentsLengthWithIcon)
+        hives.addWidget(self.old_hive, 1)
+        hives.addWidget(QtWidgets.QLabel("New:", container))
+        self.new_hive = QtWidgets.QComboBox(container)
+        self.new_hive.setSizeAdjustPolicy(QtWidgets.QComboBox.SizeAdjustPolicy.AdjustToMinimumContentsLengthWithIcon)
+        hives.addWidget(self.new_hive, 1)
+        self.compare_button = QtWidgets.QPushButton("Compare", container)
+        self.compare_button.clicked.connect(self.compare)
+        hives.addWidget(self.compare_button)
+        self.cancel_button = QtWidgets.QPushButton("Cancel", container)
+        self.cancel_button.clicked.connect(self.cancel)
+        self.cancel_button.hide()
+        hives.addWidget(self.cancel_button)
+        layout.addLayout(hives)
+
+        self.diff_model = DiffModel(self)
+        self.table = QtWidgets.QTableView(container)
+        self.table.setModel(self.diff_model)
+        self.table.setSelectionBehavior(
+            QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(
+            QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(
+            QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setWordWrap(False)
+        self.table.verticalHeader().setVisible(False)
+        self.table.verticalHeader().setSectionResizeMode(
+            QtWidgets.QHeaderView.ResizeMode.Fixed)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.clicked.connect(self.handle_click)
+        self.table.activated.connect(self.handle_click)
+        layout.addWidget(self.table)
+
+        buttons = QtWidgets.QHBoxLayout()
+        self.status = QtWidgets.QLabel(container)
+        buttons.addWidget(self.status)
+        buttons.addStretch()
+        clear_button = QtWidgets.QPushButton("Clear", container)
+        clear_button.clicked.connect(self.clear)
+        buttons.addWidget(clear_button)
+        layout.addLayout(buttons)
+
+        self.setWidget(container)
+
+    def set_hives(self, hives: "dict[str, Registry.Registry]"):
+        """Offer the open hives for comparison, keeping the current choices if they are still open"""
+        self.hives = dict(hives)
+        for combo, fallback in ((self.old_hive, 0), (self.new_hive, 1)):
+            current = combo.currentText()
+            combo.clear()
+            combo.addItems(list(self.hives))
+            if current in self.hives:
+                combo.setCurrentText(current)
+            elif combo.count() > fallback:
+                combo.setCurrentIndex(fallback)
+        self.compare_button.setEnabled(len(self.hives) >= 2 and self.worker is None)
+
+    def remove_hive(self, filename: str) -> "list[DiffWorker]":
+        """Stop comparing and forget the hashes and differences of a hive that is being closed.
+
+        Returns the workers that may still be reading the hive"""
+        workers = []
+        if self.worker is not None and filename in self.worker.filenames:
+            self.worker.cancel()
+            workers.append(self.worker)
+        self.hashes.pop(filename, None)
+        if filename in (self.old_filename, self.new_filename):
+            self.clear()
+        hives = dict(self.hives)
+        hives.pop(filename, None)
+        self.set_hives(hives)
+        return workers
+
+    def clear(self):
+        self.old_filename = self.new_filename = None
+        self.diff_model.set_changes(None, None, [])
+        self.status.setText("")
+        self.changes_shown.emit({}, {})
+
+    def compare(self):
+        old_filename = self.old_hive.currentText()
+        new_filename = self.new_hive.currentText()
+        if old_filename == new_filename:
+            helpers.show_message_box(
+                "Choose two different hives to compare", alert_type=helpers.MessageBoxTypes.WARNING)
+            return
+        if self.worker is not None or old_filename not in self.hives or new_filename not in self.hives:
+            return
+
+        self.clear()
+        self.worker = DiffWorker(old_filename, self.hives[old_filename], self.hashes.get(old_filename),
+                                 new_filename, self.hives[new_filename], self.hashes.get(new_filename))
+        self.worker.signals.progress.connect(self.status.setText)
+        self.worker.signals.finished.connect(self.handle_finished)
+        self.worker.signals.cancelled.connect(self.handle_cancelled)
+        self.worker.signals.error.connect(self.handle_error)
+        self.compare_button.setEnabled(False)
+        self.cancel_button.show()
+        self.status.setText("Comparing...")
+        QtCore.QThreadPool.globalInstance().start(self.worker)
+
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def end_compare(self):
+        self.worker = None
+        self.cancel_button.hide()
+        self.compare_button.setEnabled(len(self.hives) >= 2)
+
+    def handle_finished(self, changes: "list[diff.Change]", hashes: dict):
+        worker = self.worker
+        self.end_compare()
+        if worker.is_cancelled():
+            self.status.setText("")
+            return
+        for filename, hive_hashes in hashes.items():
+            if filename in self.hives:
+                self.hashes[filename] = hive_hashes
+
+        self.old_filename = worker.old_filename
+        self.new_filename = worker.new_filename
+        self.diff_model.set_changes(self.hives[self.old_filename], self.hives[self.new_filename], changes)
+        self.status.setText(f"{len(changes):,} differences" if changes else "The hives are identical")
+        self.emit_changes(changes)
+
+    def emit_changes(self, changes: "list[diff.Change]"):
+        """Tell the key tree and value table which keys and values to highlight"""
+        keys = {self.old_filename: {}, self.new_filename: {}}
+        values = {}
+        for change in changes:
+            color = CHANGE_COLORS[change.change_type]
+            sides = []
+            if change.change_type != diff.ChangeType.ADDED:
+                sides.append((self.old_filename, change.old_offset))
+            if change.change_type != diff.ChangeType.REMOVED:
+                sides.append((self.new_filename, change.new_offset))
+            for filename, offset in sides:
+                if change.value is None:
+                    keys[filename][offset] = color
+                else:
+                    values.setdefault((self.hives[filename], offset), {})[change.value.lower()] = color
+        self.changes_shown.emit(keys, values)
+
+    def handle_cancelled(self):
+        self.end_compare()
+        self.status.setText("Comparison cancelled")
+
+    def handle_error(self, message: str):
+        self.end_compare()
+        self.status.setText("")
+        helpers.show_message_box(
+            f"Could not compare the hives: {message}", alert_type=helpers.MessageBoxTypes.CRITICAL)
+
+    def handle_click(self, index: QtCore.QModelIndex):
+        change = self.diff_model.changes[index.row()]
+        if change.change_type == diff.ChangeType.REMOVED:
+            # Only the old hive has it
+            self.activated.emit(self.old_filename, change.old_offset, change.value)
+        else:
+            self.activated.emit(self.new_filename, change.new_offset, change.value)
@@ -0,0 +1,148 @@
+import csv
+import json
+import os
+import struct
+
+from Registry import Registry
+
+from . import formatting
+from . import regf
+
+
+# Columns of every exported record, key records leave the value columns empty
+FIELDS = ["path", "timestamp", "name", "type", "data", "raw"]
+FORMATS = ["jsonl", "csv"]
+# Size of the write buffer of exported files
+BUFFER_SIZE = 1024 * 1024
+# Keys exported between progress reports
+PROGRESS_INTERVAL = 1000
+
+
+def format_for(filename: str, selected_filter: str = "") -> str:
+    """Pick the export format from a file extension, falling back to the selected file dialog filter"""
+    lower = filename.lower()
+    if lower.endswith(".csv") or (not lower.endswith(".jsonl") and "csv" in selected_filter.lower()):
+        return "csv"
+    return "jsonl"
+
+
+def _timestamp(buf, offset: int) -> str:
+    try:
+        return regf.filetime_to_datetime(regf.key_timestamp(buf, offset)).isoformat()
+    except OverflowError:
+        return None
+
+
+def _value_record(hive: Registry.Registry, path: str, timestamp: str, offset: int) -> tuple:
+    try:
+        value = regf.open_value(hive, regf.cell_data_offset(offset))
+        name = value.name()
+        datatype = formatting.reg_type_to_str(value.value_type())
+    except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError):
+        return path, timestamp, "(invalid value)", None, None, None
+    data = formatting.format_value(value)[0]
+    try:
+        raw = value.raw_data().hex()
+    except (Registry.RegistryParse.RegistryException, struct.error):
+        raw = None
+    return path, timestamp, name, datatype, data, raw
+
+
+def records(hive: Registry.Registry, key: Registry.RegistryKey = None, progress=None, cancelled=None):
+    """Yield a record in FIELDS order for a key, each of its values and everything below it, in tree order.
+
+    Only the subkey lists of the keys on the current path are held, so memory doesn't grow with the
+    size of the hive. progress is called with the number of keys and values exported so far, and
+    the export stops early once cancelled returns True."""
+    buf = regf.buffer(hive)
+    if key is None:
+        key = hive.root()
+
+    # (path, offset) of the keys on the current path and an iterator over the subkeys still to export
+    stack = [((key.path(), key._nkrecord.offset()), iter(()))]
+    ancestors = {key._nkrecord.offset()}
+    pending = stack[0][0]
+    keys = values = 0
+    while True:
+        if pending is not None:
+            path, offset = pending
+            pending = None
+            try:
+                regf.check_key(buf, offset)
+                timestamp = _timestamp(buf, offset)
+            except (Registry.RegistryParse.ParseException, struct.error):
+                # Not a key, so there is nothing below it either
+                continue
+            yield path, timestamp, None, None, None, None
+
+            try:
+                value_offsets = regf.value_offsets(buf, offset)
+            except (Registry.RegistryParse.ParseException, struct.error):
+                value_offsets = ()
+            for value_offset in value_offsets:
+                yield _value_record(hive, path, timestamp, value_offset)
+                values += 1
+            try:
+                stack[-1] = (stack[-1][0], iter(regf.subkey_offsets(buf, offset)))
+            except (Registry.RegistryParse.ParseException, struct.error):
+                pass
+
+            keys += 1
+            if progress is not None and keys % PROGRESS_INTERVAL == 0:
+                progress(keys, values)
+            if cancelled is not None and cancelled():
+                return
+
+        (path, offset), subkeys = stack[-1]
+        subkey = next(subkeys, None)
+        if subkey is None:
+            ancestors.discard(offset)
+            stack.pop()
+            if len(stack) == 0:
+                break
+            continue
+
+        subkey = regf.cell_data_offset(subkey)
+        if subkey in ancestors:
+            # Don't loop forever on a damaged hive whose subkey lists form a cycle
+            continue
+        try:
+            name = regf.key_name(buf, subkey)
+        except struct.error:
+            continue
+        pending = (path + "\\" + name, subkey)
+        ancestors.add(subkey)
+        stack.append((pending, iter(())))
+
+    if progress is not None:
+        progress(keys, values)
+
+
+def write_jsonl(f, rows):
+    for row in rows:
+        f.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False))
+        f.write("\n")
+
+
+def write_csv(f, rows):
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    writer.writerows(rows)
+
+
+WRITERS = {"jsonl": write_jsonl, "csv": write_csv}
+
+
+def export(f, hive: Registry.Registry, key: Registry.RegistryKey = None, export_format="jsonl", progress=None, cancelled=None):
+    """Write a key and everything below it to an open text file"""
+    WRITERS[export_format](f, records(hive, key, progress, cancelled))
+
+
+def export_file(filename: str, hive: Registry.Registry, key: Registry.RegistryKey = None, export_format="jsonl", progress=None, cancelled=None) -> bool:
+    """Export a key and everything below it to a file, returning False and removing the file if cancelled"""
+    with open(filename, "w", newline="", encoding="utf-8", buffering=BUFFER_SIZE) as f:
+        export(f, hive, key, export_format, progress, cancelled)
+    if cancelled is not None and cancelled():
+        os.remove(filename)
+        return False
+    return True
@@ -1,4 +1,9 @@
-import enum
+import concurrent.futures
+import multiprocessing
+import re
+import struct
+import threading
+import time
 
 import PySide6.QtCore as QtCore
 import PySide6.QtWidgets as QtWidgets
@@ -6,18 +11,247 @@ from Registry import Registry
 
 from . import helpers
 from . import key_tree
+from . import matching
+from . import profiling
+from . import search
+from . import search_index
+from . import value_cache
 
 
-class ResultType(enum.Enum):
-    KEY = 0
-    VALUE = 1
-    DATA = 2
+class IndexBuilderSignals(QtCore.QObject):
+    progress = QtCore.Signal(str, int)
+    finished = QtCore.Signal(str, object)
+
+
+class IndexBuilder(QtCore.QRunnable):
+    """Loads the saved search index of a hive on a worker thread, building and saving it if needed"""
+
+    def __init__(self, filename: str, hive: Registry.Registry):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.filename = filename
+        self.hive = hive
+        self.signals = IndexBuilderSignals()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        try:
+            index = None
+            try:
+                index = search_index.load_index(self.filename, self.hive)
+                if index is None:
+                    index = search_index.build_index(self.filename, self.hive,
+                                                     progress=lambda keys: self.signals.progress.emit(
+                                                         self.filename, keys),
+                                                     cancelled=self.is_cancelled)
+                    if index is not None:
+                        search_index.save_index(self.filename, index)
+            except OSError:
+                index = None
+            finally:
+                self.signals.finished.emit(self.filename, index)
+        finally:
+            self._finished.set()
+
+
+class FindWorkerSignals(QtCore.QObject):
+    progress = QtCore.Signal(int, int)
+    found = QtCore.Signal(str, list)
+    finished = QtCore.Signal(object)
+    cancelled = QtCore.Signal()
+    error = QtCore.Signal(str)
+
+
+class FindWorker(QtCore.QRunnable):
+    """Searches a hive for the next match, or for every match if find_all is set, on a worker thread"""
+
+    # Seconds between progress reports
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, filename: str, hive: Registry.Registry, starting_key: Registry.RegistryKey, matcher: matching.Matcher, start_at_value=0, search_keys=True, search_values=True, search_data=True, index: search_index.SearchIndex = None, find_all=False):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.filename = filename
+        self.filenames = {filename}
+        self.hive = hive
+        self.starting_key = starting_key
+        self.matcher = matcher
+        self.start_at_value = start_at_value
+        self.search_keys = search_keys
+        self.search_values = search_values
+        self.search_data = search_data
+        self.index = index
+        self.find_all = find_all
+
+        self.signals = FindWorkerSignals()
+        self.pending: "list[tuple[search.ResultType, str, str]]" = []
+        self.keys_scanned = 0
+        self.values_scanned = 0
+        self._last_progress = 0
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def scanned(self, keys=0, values=0):
+        """Count scanned keys and values, reporting progress and stopping the search if cancelled"""
+        if self._cancelled.is_set():
+            raise search.SearchCancelled()
+        self.keys_scanned += keys
+        self.values_scanned += values
+        now = time.monotonic()
+        if now - self._last_progress >= self.PROGRESS_INTERVAL:
+            self._last_progress = now
+            self.signals.progress.emit(self.keys_scanned, self.values_scanned)
+            self.flush()
+
+    def flush(self):
+        """Deliver the matches found since the last flush"""
+        if len(self.pending) > 0:
+            self.signals.found.emit(self.filename, self.pending)
+            self.pending = []
+
+    def run(self):
+        try:
+            matches = search.Search(self.matcher, self.search_keys, self.search_values, self.search_data,
+                                    self.scanned, value_cache.shared()).matches(self.hive, self.starting_key,
+                                                          start_at_value=self.start_at_value,
+                                                          include_start=self.find_all,
+                                                          index=self.index)
+            with profiling.span("find") as span:
+                try:
+                    if self.find_all:
+                        for match in matches:
+                            self.pending.append(match)
+                        result = None
+                    else:
+                        result = next(matches, None)
+                except search.SearchCancelled:
+                    self.flush()
+                    self.signals.cancelled.emit()
+                except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError) as e:
+                    self.flush()
+                    self.signals.error.emit(str(e))
+                else:
+                    self.flush()
+                    self.signals.finished.emit(result)
+                span.add(self.keys_scanned, self.values_scanned)
+        finally:
+            self._finished.set()
+
+
+class ParallelFindWorker(QtCore.QRunnable):
+    """Finds every match in several hives by running search jobs on a process pool.
+
+    Matches are delivered job by job in tree order, however the jobs finish."""
+
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, pool: concurrent.futures.ProcessPoolExecutor, cancel_event, counters, jobs: "list[search.SearchJob]", matcher: matching.Matcher, search_keys=True, search_values=True, search_data=True):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.pool = pool
+        self.cancel_event = cancel_event
+        self.counters = counters
+        self.jobs = jobs
+        self.options = (matcher.term, matcher.case_sensitive, matcher.exact_match, matcher.regex,
+                        search_keys, search_values, search_data)
+        self.filenames = {job.filename for job in jobs}
+        self.find_all = True
+
+        self.signals = FindWorkerSignals()
+        self.keys_scanned = 0
+        self.values_scanned = 0
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+        self.cancel_event.set()
+
+    def update_counters(self):
+        with self.counters.get_lock():
+            self.keys_scanned, self.values_scanned = self.counters[0], self.counters[1]
+
+    def run(self):
+        with profiling.span("find") as span:
+            self.search()
+            span.add(self.keys_scanned, self.values_scanned)
+
+    def search(self):
+        self.cancel_event.clear()
+        with self.counters.get_lock():
+            self.counters[0] = self.counters[1] = 0
+
+        futures = []
+        try:
+            futures = [self.pool.submit(search.run_job, job, *self.options)
+                       for job in self.jobs]
+            for job, future in zip(self.jobs, futures):
+                while True:
+                    try:
+                        results = future.result(timeout=self.PROGRESS_INTERVAL)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        if self._cancelled.is_set():
+                            raise search.SearchCancelled()
+                        self.update_counters()
+                        self.signals.progress.emit(
+                            self.keys_scanned, self.values_scanned)
+                if len(results) > 0:
+                    self.signals.found.emit(job.filename, results)
+        except search.SearchCancelled:
+            for future in futures:
+                future.cancel()
+            concurrent.futures.wait(futures)
+            self.update_counters()
+            self.signals.cancelled.emit()
+        except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError, OSError,
+                concurrent.futures.process.BrokenProcessPool) as e:
+            for future in futures:
+                future.cancel()
+            self.signals.error.emit(str(e))
+        else:
+            self.update_counters()
+            self.signals.finished.emit(None)
 
 
 class FindDialog(QtWidgets.QDialog):
     def __init__(self, *args):
         super().__init__(*args)
 
+        self.settings = QtCore.QSettings()
+        self.indexes: dict[str, search_index.SearchIndex] = {}
+        self.index_builders: dict[str, IndexBuilder] = {}
+        self.worker: FindWorker = None
+        self.searching = False
+        self.search_started = 0
+        self.pool: concurrent.futures.ProcessPoolExecutor = None
+        self.pool_cancel_event = None
+        self.pool_counters = None
+        # Hives the pool processes may have open, and whether the pool must go once the search ends
+        self.pool_filenames: "set[str]" = set()
+        self.pool_expired = False
+
         self.setWindowTitle("Find")
         self.resize(400, 200)
         self.setWindowFlags(QtCore.Qt.Dialog |
@@ -30,15 +264,19 @@ class FindDialog(QtWidgets.QDialog):
         self.text = QtWidgets.QLineEdit()
         self.text.setClearButtonEnabled(True)
         self.text.setToolTip(
-            "For binary data, enter it in hexadecimal with spaces between bytes. E.g. 0A 54 D3")
+            "For binary data, enter it in hexadecimal. E.g. 0A 54 D3")
         text_group_layout.addWidget(self.text)
 
         find_btn = QtWidgets.QPushButton("Find Next")
         find_btn.setDefault(True)
+        find_all_btn = QtWidgets.QPushButton("Find All")
+        find_all_btn.clicked.connect(self.handle_find_all)
 
         self.buttonBox = QtWidgets.QDialogButtonBox()
         self.buttonBox.addButton(
             find_btn, QtWidgets.QDialogButtonBox.ButtonRole.AcceptRole)
+        self.buttonBox.addButton(
+            find_all_btn, QtWidgets.QDialogButtonBox.ButtonRole.ActionRole)
         self.buttonBox.addButton(
             QtWidgets.QDialogButtonBox.StandardButton.Cancel)
         self.buttonBox.rejected.connect(self.closed)
@@ -58,10 +296,14 @@ class FindDialog(QtWidgets.QDialog):
         self.value_search.setChecked(True)
         self.data_search = QtWidgets.QCheckBox("Data", self)
         self.data_search.setChecked(True)
+        self.all_hives = QtWidgets.QCheckBox("All Open Hives", self)
+        self.all_hives.setToolTip(
+            "Find All searches every open hive in parallel instead of only the selected one")
 
         category_group_layout.addWidget(self.key_search)
         category_group_layout.addWidget(self.value_search)
         category_group_layout.addWidget(self.data_search)
+        category_group_layout.addWidget(self.all_hives)
         category_group_layout.addStretch()
         options_container_layout.addWidget(category_group)
 
@@ -71,9 +313,20 @@ class FindDialog(QtWidgets.QDialog):
 
         self.case_sensitive = QtWidgets.QCheckBox("Case Sensitive", self)
         self.exact_match = QtWidgets.QCheckBox("Exact Match", self)
+        self.regex = QtWidgets.QCheckBox("Regular Expression", self)
+        self.regex.setToolTip(
+            "Match names and text data with a regular expression, and binary data with a bytes regular expression")
+        self.use_index = QtWidgets.QCheckBox("Use Search Index", self)
+        self.use_index.setToolTip(
+            "Index open hives in the background and save the index next to each hive, so that later searches are instant")
+        self.use_index.setChecked(self.settings.value(
+            "find/use_index", False, bool))
+        self.use_index.toggled.connect(self.toggle_index)
 
         options_group_layout.addWidget(self.case_sensitive)
         options_group_layout.addWidget(self.exact_match)
+        options_group_layout.addWidget(self.regex)
+        options_group_layout.addWidget(self.use_index)
         options_group_layout.addStretch()
         options_container_layout.addWidget(options_group)
 
@@ -89,6 +342,19 @@ class FindDialog(QtWidgets.QDialog):
         super().showEvent(event)
 
     def handle_find(self):
+        """Search for the next match after the selected key and value"""
+        self.start_search(find_all=False)
+
+    def handle_find_all(self):
+        """Search the selected hive for every match, streaming them into the results panel"""
+        self.start_search(find_all=True)
+
+    def start_search(self, find_all: bool):
+        if self.searching:
+            self.parent().statusBar().showMessage(
+                "A search is already running", 2000)
+            return
+
         active_key: key_tree.KeyItem = self.parent().tree.get_selected_key()
         if self.text.text() == "":
             helpers.show_message_box(
@@ -100,118 +366,233 @@ class FindDialog(QtWidgets.QDialog):
                 "You must select one type to search in.", alert_type=helpers.MessageBoxTypes.CRITICAL)
             return
 
+        try:
+            matcher = matching.Matcher(self.text.text(),
+                                       case_sensitive=self.case_sensitive.isChecked(),
+                                       exact_match=self.exact_match.isChecked(),
+                                       regex=self.regex.isChecked())
+        except re.error as e:
+            helpers.show_message_box(
+                f"Invalid regular expression: {e}", alert_type=helpers.MessageBoxTypes.CRITICAL)
+            return
+
         self.close()
         self.accept()
 
+        tree: key_tree.KeyTree = self.parent().tree
+        if find_all and self.all_hives.isChecked() and len(tree.reg) > 0:
+            self.parent().results_panel.start(self.text.text())
+            # Search the hives in the order they are shown in the tree
+            filenames = [root.filename for root in tree.key_model.hive_roots()]
+            try:
+                jobs = search.plan_jobs(filenames, tree.reg)
+            except OSError as e:
+                helpers.show_message_box(
+                    f"Could not search the open hives: {e}", alert_type=helpers.MessageBoxTypes.CRITICAL)
+                return
+            pool, cancel_event, counters = self.get_pool()
+            self.pool_filenames.update(filenames)
+            self.worker = ParallelFindWorker(pool, cancel_event, counters, jobs, matcher,
+                                             search_keys=self.key_search.isChecked(),
+                                             search_values=self.value_search.isChecked(),
+                                             search_data=self.data_search.isChecked())
+            self.start_worker()
+            return
+
         if active_key is None:
             helpers.show_message_box(
                 "Select a key or hive first.", alert_type=helpers.MessageBoxTypes.CRITICAL)
             return
 
-        hive: Registry.Registry = self.parent().tree.reg[active_key.filename]
-        current_key = hive.open(active_key.path)
-
+        hive: Registry.Registry = tree.reg[active_key.filename]
+        if find_all:
+            current_key = hive.root()
+            start_at_value = 0
+            self.parent().results_panel.start(self.text.text())
+        elif active_key.recovery is not None:
+            # Deleted keys aren't in the hive's tree, so search it from the top
+            current_key = hive.root()
+            start_at_value = 0
+        else:
+            current_key = active_key.open()
+            start_at_value = self.parent().value_table.get_selected_row() + 1
+
+        self.worker = FindWorker(active_key.filename, hive, current_key, matcher,
+                                 start_at_value=start_at_value,
+                                 search_keys=self.key_search.isChecked(),
+                                 search_values=self.value_search.isChecked(),
+                                 search_data=self.data_search.isChecked(),
+                                 index=self.indexes.get(active_key.filename),
+                                 find_all=find_all)
+        self.start_worker()
+
+    def start_worker(self):
+        self.worker.signals.progress.connect(self.handle_find_progress)
+        self.worker.signals.found.connect(self.handle_find_found)
+        self.worker.signals.finished.connect(self.handle_find_finished)
+        self.worker.signals.cancelled.connect(self.handle_find_cancelled)
+        self.worker.signals.error.connect(self.handle_find_error)
+
+        self.searching = True
+        self.search_started = time.monotonic()
         self.parent().progress_bar.show()
         self.parent().progress_bar.setRange(0, 0)
         self.parent().progress_bar.setValue(1)
         self.parent().progress_bar.setValue(0)
-        result = self.find(current_key,
-                           self.text.text(),
-                           case_sensitive=self.case_sensitive.isChecked(),
-                           exact_match=self.exact_match.isChecked(),
-                           search_keys=self.key_search.isChecked(),
-                           search_values=self.value_search.isChecked(),
-                           search_data=self.data_search.isChecked())
+        self.parent().cancel_button.show()
+        self.parent().statusBar().showMessage("Searching...")
+        QtCore.QThreadPool.globalInstance().start(self.worker)
+
+    def get_pool(self):
+        """Returns the process pool for searching all open hives, with its cancel flag and counters"""
+        if self.pool is None:
+            # Forking a process that runs Qt isn't safe
+            context = multiprocessing.get_context("spawn")
+            self.pool_cancel_event = context.Event()
+            self.pool_counters = context.Array("q", 2)
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                mp_context=context, initializer=search.init_pool_process,
+                initargs=(self.pool_cancel_event, self.pool_counters))
+        return self.pool, self.pool_cancel_event, self.pool_counters
+
+    def shutdown_pool(self, wait=False):
+        """Stop the pool processes, which unmaps every hive they have open"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait)
+            self.pool = None
+        self.pool_filenames.clear()
+        self.pool_expired = False
+
+    def cancel_find(self):
+        """Stop the running search"""
+        if self.searching:
+            self.worker.cancel()
+
+    def search_stats(self, keys: int, values: int) -> str:
+        elapsed = max(time.monotonic() - self.search_started, 0.001)
+        return f"{keys:,} keys ({keys / elapsed:,.0f}/s), {values:,} values ({values / elapsed:,.0f}/s)"
+
+    def end_search(self):
+        self.searching = False
+        if self.pool_expired:
+            self.shutdown_pool(wait=True)
         self.parent().progress_bar.setRange(0, 100)
         self.parent().progress_bar.hide()
+        self.parent().cancel_button.hide()
+
+    def handle_find_progress(self, keys: int, values: int):
+        if self.searching:
+            self.parent().statusBar().showMessage(
+                "Searching... " + self.search_stats(keys, values))
+
+    def handle_find_found(self, filename: str, results: "list[tuple[search.ResultType, str, str]]"):
+        self.parent().results_panel.add_results(filename, results)
+
+    def handle_find_cancelled(self):
+        self.end_search()
+        self.parent().statusBar().showMessage("Search cancelled", 2000)
+
+    def handle_find_error(self, message: str):
+        self.end_search()
+        if isinstance(self.worker, ParallelFindWorker):
+            # A pool process may have died, start a new pool next time
+            self.shutdown_pool()
+        self.parent().statusBar().clearMessage()
+        helpers.show_message_box(
+            f"Search failed: {message}", alert_type=helpers.MessageBoxTypes.CRITICAL)
+
+    def handle_find_finished(self, result: "tuple[search.ResultType, str, str]"):
+        self.end_search()
+        self.parent().statusBar().showMessage(
+            "Searched " + self.search_stats(self.worker.keys_scanned, self.worker.values_scanned), 5000)
+        if self.worker.find_all:
+            return
 
         if result is None:
-            self.parent().tree.select_key_from_path("")
-            helpers.show_message_box(
-                "Term not found. Looping back to start.", alert_type=helpers.MessageBoxTypes.WARNING)
+            if self.worker.filename in self.parent().tree.roots:
+                self.select_result(self.worker.filename, None)
+                helpers.show_message_box(
+                    "Term not found. Looping back to start.", alert_type=helpers.MessageBoxTypes.WARNING)
+            return
+
+        self.select_result(self.worker.filename, result)
+
+    def select_result(self, filename: str, result: "tuple[search.ResultType, str, str]"):
+        """Select the key and value of a match, or the root of the hive if result is None"""
+        tree: key_tree.KeyTree = self.parent().tree
+        root = tree.roots.get(filename)
+        if root is None:
+            # The hive has been closed since it was searched
+            return
+        tree.select_item(root)
+
+        if result is None:
+            tree.select_key_from_path("")
             return
 
         result_type, result_key, result_value = result
-        sanitized_path = self.parent().tree.parse_uri(
-            result_key, root=hive.root().name())
-        self.parent().tree.select_key_from_path(sanitized_path)
-        if result_type == ResultType.VALUE or result_type == ResultType.DATA:
+        sanitized_path = tree.parse_uri(
+            result_key, root=tree.reg[filename].root().name())
+        tree.select_key_from_path(sanitized_path)
+        if result_type == search.ResultType.VALUE or result_type == search.ResultType.DATA:
             self.parent().value_table.select_value(result_value)
 
-    def find(self, starting_key: Registry.RegistryKey, term: str, case_sensitive=False, exact_match=False, search_keys=True, search_values=True, search_data=True, reverse=False) -> "tuple[ResultType, str, str]":
-        """Find the next matching subkey or value. Returns (ResultType, key, value)"""
-
-        if not case_sensitive:
-            term = term.upper()
+    def toggle_index(self, checked: bool):
+        self.settings.setValue("find/use_index", checked)
+        if checked:
+            for filename in self.parent().tree.reg:
+                self.add_hive(filename)
+        else:
+            for filename in list(self.indexes) + list(self.index_builders):
+                self.remove_hive(filename)
+
+    def add_hive(self, filename: str):
+        """Start loading or building the search index of a newly opened hive"""
+        if not self.use_index.isChecked() or filename in self.indexes or filename in self.index_builders:
+            return
 
-        def check_match(text: str) -> bool:
-            """Check if a subkey matches the search term"""
-            if not case_sensitive:
-                text = text.upper()
-            if exact_match:
-                if term == text:
-                    return True
+        builder = IndexBuilder(filename, self.parent().tree.reg[filename])
+        builder.signals.progress.connect(self.handle_index_progress)
+        builder.signals.finished.connect(self.handle_index_finished)
+        self.index_builders[filename] = builder
+        QtCore.QThreadPool.globalInstance().start(builder)
+
+    def remove_hive(self, filename: str) -> "list[QtCore.QRunnable]":
+        """Stop searching and indexing, and forget the index of a hive that is being closed.
+
+        Returns the workers that may still be reading the hive"""
+        workers = []
+        if self.searching and filename in self.worker.filenames:
+            self.worker.cancel()
+            if isinstance(self.worker, FindWorker):
+                workers.append(self.worker)
+        if filename in self.pool_filenames:
+            # The pool processes keep searched hives mapped, so stop them once they are idle
+            if self.searching and isinstance(self.worker, ParallelFindWorker):
+                self.pool_expired = True
             else:
-                if term in text:
-                    return True
-
-            return False
-
-        def search(start_key: Registry.RegistryKey, term: str, start_at_value=0, skip_start_key_name=False) -> "tuple[ResultType, str, str]":
-            """Returns (ResultType, key, value)"""
-
-            # Check the start key name if asked (i.e. if the search has just started)
-            if search_keys and not skip_start_key_name:
-                if check_match(start_key.name()):
-                    return ResultType.KEY, start_key.path(), None
-
-            values = start_key.values()[start_at_value:]
-            # Skip extra looping if values and data are not searched for
-            if search_values or search_data:
-                for value in values:
-                    # Check through the value
-                    if search_values and check_match(value.name()):
-                        return ResultType.VALUE, start_key.path(), value.name()
-                    # Check through the value's data
-                    if search_data and (
-                            check_match(str(value.value())) or
-                            check_match(self.parent().value_table.reg_data_to_str(value.value_type(), value.raw_data(), value.value()))):
-                        return ResultType.DATA, start_key.path(), value.name()
-
-            # Recurse through the subkeys
-            for subkey in start_key.subkeys():
-                # Check subkey name
-                if search_keys and check_match(subkey.name()):
-                    return ResultType.KEY, subkey.path(), None
-                result = search(subkey, term)
-                if result is not None:
-                    # Found a recursive match!
-                    return result
-
-            # No match was found
-            return None
-
-        match = search(starting_key, term,
-                       start_at_value=self.parent().value_table.get_selected_row() + 1, skip_start_key_name=True)
-        if match is not None:
-            return match
-
-        current_key = starting_key
-        try:
-            while current_key.parent():
-                subkeys = current_key.parent().subkeys()
-                index = next((i for i, subkey in enumerate(subkeys)
-                             if subkey.name() == current_key.name()))
-                subkeys = subkeys[index+1:]
-                for subkey in subkeys:
-                    result = search(subkey, term)
-                    if result is not None:
-                        return result
-                current_key = current_key.parent()
-        except Registry.RegistryKeyHasNoParentException:
-            pass
-
-        return None
+                self.shutdown_pool(wait=True)
+        builder = self.index_builders.pop(filename, None)
+        if builder is not None:
+            builder.cancel()
+            workers.append(builder)
+        self.indexes.pop(filename, None)
+        return workers
+
+    def handle_index_progress(self, filename: str, keys: int):
+        if filename in self.index_builders:
+            self.parent().statusBar().showMessage(
+                f"Indexing {filename}: {keys} keys", 2000)
+
+    def handle_index_finished(self, filename: str, index: search_index.SearchIndex):
+        builder = self.index_builders.get(filename)
+        if builder is None or builder.is_cancelled():
+            return
+        del self.index_builders[filename]
+        if index is not None:
+            self.indexes[filename] = index
+            self.parent().statusBar().showMessage(
+                f"Search index ready for {filename}", 2000)
 
     def closed(self):
         self.close()
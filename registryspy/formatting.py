@@ -0,0 +1,107 @@
+import struct
+
+from Registry import Registry
+
+
+TYPE_NAMES = {
+    Registry.RegNone: "REG_NONE",
+    Registry.RegSZ: "REG_SZ",
+    Registry.RegExpandSZ: "REG_EXPAND_SZ",
+    Registry.RegBin: "REG_BINARY",
+    Registry.RegDWord: "REG_DWORD",
+    Registry.RegBigEndian: "REG_DWORD_BIG_ENDIAN",
+    Registry.RegLink: "REG_LINK",
+    Registry.RegMultiSZ: "REG_MULTI_SZ",
+    Registry.RegResourceList: "REG_RESOURCE_LIST",
+    Registry.RegQWord: "REG_QWORD",
+}
+
+
+def reg_type_to_str(datatype: int) -> str:
+    return TYPE_NAMES.get(datatype, "UNKNOWN")
+
+
+def reg_data_to_str(datatype: int, raw_data: bytes, value, limit: int = None) -> str:
+    """Format value data for display, only formatting the first limit bytes of binary data if given"""
+    if len(raw_data) == 0:
+        return "(value not set)"
+    if datatype == Registry.RegDWord:
+        try:
+            return "{0:#010x} ({0})".format(value)
+        except (struct.error, IndexError):
+            pass
+    if datatype == Registry.RegQWord:
+        try:
+            return "{0:#018x} ({0})".format(value)
+        except (struct.error, IndexError):
+            pass
+    if datatype == Registry.RegBigEndian:
+        try:
+            return "{0:#010x} ({0})".format(value)
+        except (struct.error, IndexError):
+            pass
+    if datatype == Registry.RegLink:
+        # Not sure what format this will actually be
+        return str(value)
+    if datatype == Registry.RegMultiSZ:
+        return " ".join(value)
+    if datatype == Registry.RegResourceList:
+        # Not sure what format this will actually be
+        return str(value)
+    if datatype == Registry.RegSZ or datatype == Registry.RegExpandSZ:
+        return value
+    else:
+        if limit is not None and len(raw_data) > limit:
+            return raw_data[:limit].hex(" ") + " ..."
+        return " ".join(["{:02x}".format(x) for x in raw_data])
+
+
+def format_preview(datatype: int, preview: bytes, size: int) -> str:
+    """Format the first bytes of data that is too large to be read for display, after its full size"""
+    if datatype in (Registry.RegSZ, Registry.RegExpandSZ, Registry.RegMultiSZ, Registry.RegLink):
+        text = preview[:len(preview) & ~1].decode("utf-16le", "replace").replace("\x00", " ")
+    else:
+        text = preview.hex(" ")
+    return "({:,} bytes) {} ...".format(size, text)
+
+
+def format_value(value: Registry.RegistryValue, limit: int = None, raw_data: bytes = None) -> "tuple[str, bool]":
+    """Returns the display text of a value's data and whether the data is empty, reusing its raw data if already read"""
+    try:
+        datatype = value.value_type()
+        if raw_data is None:
+            raw_data = value.raw_data()
+        if datatype == Registry.RegBin or datatype == Registry.RegNone:
+            # The parsed value is just the raw data, so don't read it twice
+            data = raw_data
+        else:
+            data = value.value()
+        return reg_data_to_str(datatype, raw_data, data, limit=limit), len(raw_data) == 0
+    except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError):
+        return "(unable to parse data)", True
+
+
+def parse_path(uri: str, hive_type: str = None, root: str = None) -> str:
+    """Parses a user-specified URI into a registry path"""
+
+    # Sanitize URI
+    uri = uri.strip()
+    uri = uri.strip("\\")
+    if hive_type is not None:
+        uri = uri.replace(hive_type + "\\", "", 1)
+        uri = uri.strip("\\")
+    if root is not None:
+        uri = uri.replace(root + "\\", "", 1)
+        uri = uri.strip("\\")
+
+    if uri == "" or uri == hive_type:
+        return ""
+
+    return uri
+
+
+def format_path(hive: Registry.Registry, path: str) -> str:
+    """Format a URI path for a key path relative to the root of a hive"""
+    if path == "":
+        return hive.hive_type().name
+    return hive.hive_type().name + "\\" + path
@@ -2,8 +2,6 @@ import os
 import sys
 import string
 
-import PySide6.QtWidgets as QtWidgets
-
 
 APP_NAME = "Registry Spy"
 VERSION = (1, 1, 0)
@@ -29,15 +27,25 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 
+def _printable_table(encoding: str) -> bytes:
+    """Build a bytes.translate table mapping control and non-printable bytes to '.'"""
+    banned = [chr(i) for i in range(0x20)] + ["\x7f", "\xa0", "\xad", "\uFFFD"]
+    table = bytearray(range(256))
+    for i in range(256):
+        if bytes([i]).decode(encoding, "replace") in banned:
+            table[i] = ord(".")
+    return bytes(table)
+
+
+_PRINTABLE_TABLES = {"windows-1252": _printable_table("windows-1252")}
+
+
 def bytes_to_printable(b: bytes, encoding="windows-1252") -> str:
     """Convert bytes to string, replacing control and non-printable chars"""
-    decoded = b.decode(encoding, "replace")
-    # Replace the unicode replacement character
-    decoded = decoded.replace("\uFFFD", ".")
-    # Replace control characters
-    banned = "".join([chr(i) for i in range(0x20)] + ["\x7f", "\xa0", "\xad"])
-    decoded = "".join([c if c not in banned else "." for c in decoded])
-    return decoded
+    table = _PRINTABLE_TABLES.get(encoding)
+    if table is None:
+        table = _PRINTABLE_TABLES[encoding] = _printable_table(encoding)
+    return bytes(b).translate(table).decode(encoding, "replace")
 
 
 def resource_path(relative_path: str) -> str:
@@ -52,16 +60,19 @@ def resource_path(relative_path: str) -> str:
 
 
 class MessageBoxTypes:
-    INFORMATION = (QtWidgets.QMessageBox.Information, "Information")
-    WARNING = (QtWidgets.QMessageBox.Warning, "Warning")
-    CRITICAL = (QtWidgets.QMessageBox.Critical, "Error")
-    QUESTION = (QtWidgets.QMessageBox.Question, "Question")
+    # QMessageBox icon names, so that importing helpers doesn't load Qt
+    INFORMATION = ("Information", "Information")
+    WARNING = ("Warning", "Warning")
+    CRITICAL = ("Critical", "Error")
+    QUESTION = ("Question", "Question")
 
 
 def show_message_box(text, alert_type=MessageBoxTypes.INFORMATION, title=None):
+    import PySide6.QtWidgets as QtWidgets
+
     msgbox = QtWidgets.QMessageBox()
     if title is None:
         msgbox.setWindowTitle(alert_type[1])
     msgbox.setText(text)
-    msgbox.setIcon(alert_type[0])
+    msgbox.setIcon(getattr(QtWidgets.QMessageBox.Icon, alert_type[0]))
     return msgbox.exec()
@@ -44,14 +44,14 @@ class HiveInfoTable(QtWidgets.QTableWidget):
         hive_type_item = QtWidgets.QTableWidgetItem(hive_type)
         hive_type_item.setFlags(hive_type_item.flags() & ~
                                 QtCore.Qt.ItemFlag.ItemIsEditable)
-        self.setItem(0, 1, hive_type_item)
+        self.setItem(1, 0, hive_type_item)
 
         hive_name_item = QtWidgets.QTableWidgetItem(hive_name)
         hive_name_item.setFlags(hive_name_item.flags() & ~
                                 QtCore.Qt.ItemFlag.ItemIsEditable)
-        self.setItem(0, 2, hive_name_item)
+        self.setItem(2, 0, hive_name_item)
 
         root_name_item = QtWidgets.QTableWidgetItem(root_name)
         root_name_item.setFlags(root_name_item.flags() & ~
                                 QtCore.Qt.ItemFlag.ItemIsEditable)
-        self.setItem(0, 3, QtWidgets.QTableWidgetItem(root_name_item))
+        self.setItem(3, 0, root_name_item)
@@ -0,0 +1,90 @@
+import collections
+import struct
+
+from Registry import Registry
+
+from . import regf
+
+
+# Number of paths, and of subkey lookups, remembered per hive
+KEY_CACHE_SIZE = 1024
+
+
+class KeyCache:
+    """Size-bounded LRU cache of the keys of a hive by path and by (parent offset, subkey name).
+
+    Paths are resolved from the deepest cached ancestor instead of from the root, and key names
+    are compared case-insensitively like Windows does."""
+
+    def __init__(self, hive: Registry.Registry, size: int = KEY_CACHE_SIZE):
+        self.hive = hive
+        self.size = size
+        self.paths: "collections.OrderedDict[str, Registry.RegistryKey]" = collections.OrderedDict()
+        self.children: "collections.OrderedDict[tuple, Registry.RegistryKey]" = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        return path.strip("\\").lower()
+
+    def _store(self, cache: collections.OrderedDict, cache_key, key: Registry.RegistryKey):
+        cache[cache_key] = key
+        cache.move_to_end(cache_key)
+        while len(cache) > self.size:
+            cache.popitem(last=False)
+
+    def child(self, parent_offset: int, name: str) -> Registry.RegistryKey:
+        """Returns the subkey with the given name of the key whose nk record is at parent_offset, or None"""
+        name = name.lower()
+        cache_key = (parent_offset, name)
+        key = self.children.get(cache_key)
+        if key is not None:
+            self.hits += 1
+            self.children.move_to_end(cache_key)
+            return key
+
+        self.misses += 1
+        buf = regf.buffer(self.hive)
+        try:
+            for offset in regf.subkey_offsets(buf, parent_offset):
+                offset = regf.cell_data_offset(offset)
+                if regf.key_name(buf, offset).lower() == name:
+                    key = regf.open_key(self.hive, offset)
+                    self._store(self.children, cache_key, key)
+                    return key
+        except (Registry.RegistryParse.ParseException, struct.error):
+            pass
+        return None
+
+    def open(self, path: str) -> Registry.RegistryKey:
+        """Open the key at a path relative to the root of the hive.
+
+        Raises Registry.RegistryKeyNotFoundException if there is no such key."""
+        normalized = self.normalize(path)
+        key = self.paths.get(normalized)
+        if key is not None:
+            self.hits += 1
+            self.paths.move_to_end(normalized)
+            return key
+        self.misses += 1
+
+        # Start from the deepest ancestor that is still cached
+        names = normalized.split("\\") if normalized else []
+        depth = max(len(names) - 1, 0)
+        while depth > 0 and "\\".join(names[:depth]) not in self.paths:
+            depth -= 1
+        key = self.paths["\\".join(names[:depth])] if depth > 0 else self.hive.root()
+
+        for depth in range(depth, len(names)):
+            key = self.child(key._nkrecord.offset(), names[depth])
+            if key is None:
+                raise Registry.RegistryKeyNotFoundException(path)
+            self._store(self.paths, "\\".join(names[:depth + 1]), key)
+        if not names:
+            self._store(self.paths, normalized, key)
+        return key
+
+    def clear(self):
+        self.paths.clear()
+        self.children.clear()
@@ -1,43 +1,585 @@
+import datetime
+import functools
+import gc
 import struct
+import threading
 
 from Registry import Registry
 import PySide6.QtCore as QtCore
 import PySide6.QtWidgets as QtWidgets
 import PySide6.QtGui as QtGui
 
+from . import formatting
 from . import helpers
+from . import profiling
+from . import regf
+from . import session
 
+# Path lookups and deleted key recovery are imported once the first hive is opened
+
+
+# Number of rows added to a key each time the view asks for more
+FETCH_SIZE = 256
+# Milliseconds after a hive is removed, and between attempts while worker threads are still running,
+# before the file of the hive is unmapped
+CLOSE_INTERVAL = 500
+# Number of formatted dates remembered, keys of a hive are usually written on far fewer days
+DATE_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def _format_date(days: int) -> str:
+    return (regf.FILETIME_EPOCH + datetime.timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def format_timestamp(filetime: int) -> str:
+    """Format a FILETIME as shown in the Modified column, to the second.
+
+    Only the date goes through datetime, and it is cached, the time of day is plain arithmetic."""
+    # Rounds the same way as regf.filetime_to_datetime
+    days, seconds = divmod((filetime + 5) // regf.FILETIME_RESOLUTION, 86400)
+    try:
+        date = _format_date(days)
+    except OverflowError:
+        return ""
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{date} {hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+class KeyItem:
+    """A key shown in the KeyTreeModel, only decoded from its nk record once it is displayed"""
+
+    __slots__ = ("hive", "filename", "offset", "parent", "row", "children", "recovery", "name", "num_subkeys",
+                 "timestamp", "_subkey_offsets", "_subkey_rows", "_path")
+
+    def __init__(self, hive: Registry.Registry, filename: str, offset: int, parent: "KeyItem" = None, row: int = 0,
+                 recovery: "recovery.Recovery" = None):
+        self.hive = hive
+        self.filename = filename
+        self.offset = offset
+        self.parent = parent
+        self.row = row
+        self.children: list[KeyItem] = []
+        # Deleted keys recovered from the hive if this is one of them, their subkeys come from it
+        self.recovery = recovery
+
+        self.name: str = None
+        self.num_subkeys = 0
+        self.timestamp = 0
+        self._subkey_offsets = None
+        self._subkey_rows: "dict[int, int]" = None
+        self._path: str = None
+
+    def load(self):
+        """Decode the name, subkey count and timestamp of the key if it hasn't been already"""
+        if self.name is not None:
+            return
+
+        profiling.decoded(keys=1)
+        try:
+            self.set_record(regf.key_record(regf.buffer(self.hive), self.offset))
+        except (Registry.RegistryParse.ParseException, struct.error):
+            self.set_record(None)
+        if self.recovery is not None:
+            # Only the subkeys that were recovered along with a deleted key are shown
+            self.num_subkeys = len(self.recovery.subkey_offsets(self.offset))
+
+    def set_record(self, record: regf.KeyRecord):
+        """Take the name, subkey count and timestamp of the key from an already decoded record, or None if it is invalid"""
+        if record is None:
+            self.name = "(invalid key)"
+            self.num_subkeys = 0
+            return
+        self.name = record.name
+        self.num_subkeys = record.subkey_count
+        self.timestamp = record.timestamp
+
+    def has_subkeys(self) -> bool:
+        """Check for subkeys without decoding the rest of the nk record, for rows that aren't shown yet"""
+        if self.name is not None:
+            return self.num_subkeys > 0
+        if self.recovery is not None:
+            return len(self.subkey_offsets()) > 0
+        buf = regf.buffer(self.hive)
+        try:
+            regf.check_key(buf, self.offset)
+            return regf.key_subkey_count(buf, self.offset) > 0
+        except (Registry.RegistryParse.ParseException, struct.error):
+            return False
+
+    def subkey_offsets(self):
+        """Returns the cell offsets of all subkeys, read straight from the subkey list"""
+        if self._subkey_offsets is None and self.recovery is not None:
+            self._subkey_offsets = self.recovery.subkey_offsets(self.offset)
+        if self._subkey_offsets is None:
+            self.load()
+            try:
+                self._subkey_offsets = regf.subkey_offsets(regf.buffer(self.hive), self.offset)
+            except (Registry.RegistryParse.ParseException, struct.error):
+                self._subkey_offsets = ()
+            if self.num_subkeys == 0:
+                self._subkey_offsets = ()
+        return self._subkey_offsets
+
+    def subkey_row(self, offset: int) -> int:
+        """Returns the row of the subkey whose nk record is at offset, or -1 if it isn't a subkey"""
+        if self._subkey_rows is None:
+            self._subkey_rows = {}
+            for row, subkey in enumerate(self.subkey_offsets()):
+                self._subkey_rows.setdefault(regf.cell_data_offset(subkey), row)
+        return self._subkey_rows.get(offset, -1)
+
+    @property
+    def path(self) -> str:
+        """Path of the key relative to the root of the hive"""
+        if self._path is None:
+            if self.parent is None:
+                self._path = ""
+            else:
+                self.load()
+                if self.parent.parent is None and self.recovery is not None:
+                    # Deleted keys are shown under a row of their own, but their paths are where they were deleted from
+                    location = self.recovery.location(self.offset)
+                    self._path = self.name if not location else location + "\\" + self.name
+                elif self.parent.parent is None:
+                    self._path = self.name
+                else:
+                    self._path = self.parent.path + "\\" + self.name
+        return self._path
+
+    def open(self) -> Registry.RegistryKey:
+        """Open the python-registry key for this item"""
+        return regf.open_key(self.hive, self.offset)
+
+
+def restore_skeleton(hive: Registry.Registry, filename: str, keys: list) -> KeyItem:
+    """Rebuild the KeyItems of a skeleton cached in a session without reading their nk records.
+
+    Returns the root KeyItem, or None if the skeleton is damaged."""
+    items: "list[KeyItem]" = []
+    try:
+        for offset, parent, name, num_subkeys, timestamp in keys:
+            if parent < 0:
+                if len(items) > 0:
+                    return None
+                item = KeyItem(hive, filename, offset)
+            else:
+                parent_item = items[parent]
+                item = KeyItem(hive, filename, offset, parent_item, len(parent_item.children))
+                parent_item.children.append(item)
+            item.name = str(name)
+            item.num_subkeys = int(num_subkeys)
+            item.timestamp = int(timestamp)
+            items.append(item)
+    except (ValueError, TypeError, IndexError):
+        return None
+    if len(items) == 0 or items[0].offset != regf.root_offset(hive):
+        return None
+
+    for item in items:
+        if len(item.children) > 0 and len(item.children) == item.num_subkeys:
+            # Every subkey is cached, so the subkey list doesn't need to be read either
+            item._subkey_offsets = [child.offset - regf.cell_data_offset(0) for child in item.children]
+    return items[0]
+
+
+def load_root(filename: str, prefetch: int = 0, skeleton: dict = None) -> KeyItem:
+    """Open a hive and decode its root key and up to prefetch of its subkeys, without touching Qt.
+
+    If a skeleton cached from the same state of the file is given, the keys in it are restored
+    instead. Raises OSError if the file can't be read, or a ParseException or struct.error if it
+    isn't a hive."""
+    with profiling.span("load_hive") as span:
+        hive = regf.open_hive(filename)
+        root = None
+        if skeleton is not None and skeleton.get("fingerprint") == session.fingerprint(filename, hive):
+            root = restore_skeleton(hive, filename, skeleton.get("keys", ()))
+        if root is None:
+            root = KeyItem(hive, filename, regf.root_offset(hive))
+            root.load()
+            if prefetch > 0:
+                offsets = root.subkey_offsets()
+                records = regf.subkey_records(regf.buffer(hive), root.offset, 0, prefetch) if offsets else ()
+                for row, record in enumerate(records):
+                    child = KeyItem(hive, filename, regf.cell_data_offset(offsets[row]), root, row)
+                    child.set_record(record)
+                    root.children.append(child)
+            span.add(keys=len(root.children) + 1)
+    return root
+
+
+class HiveLoaderSignals(QtCore.QObject):
+    # Filename and root KeyItem
+    loaded = QtCore.Signal(str, object)
+    # Filename and error message
+    failed = QtCore.Signal(str, str)
+
+
+class HiveLoader(QtCore.QRunnable):
+    """Opens a hive and enumerates its root key on a worker thread"""
+
+    def __init__(self, filename: str, skeleton: dict = None):
+        super().__init__()
+        self.setAutoDelete(False)
 
-class KeyItem(QtWidgets.QTreeWidgetItem):
-    def __init__(self, path: str, filename: str, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.path = path
         self.filename = filename
+        self.skeleton = skeleton
+        self.signals = HiveLoaderSignals()
+        self._cancelled = threading.Event()
 
+    def cancel(self):
+        self._cancelled.set()
 
-class KeyTree(QtWidgets.QTreeWidget):
-    """Tree widget that displays registry keys"""
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        try:
+            # Decoded here so that expanding the hive doesn't have to
+            root = load_root(self.filename, FETCH_SIZE, self.skeleton)
+        except OSError as e:
+            self.signals.failed.emit(self.filename, e.strerror or str(e))
+            return
+        except (Registry.RegistryParse.ParseException, struct.error):
+            self.signals.failed.emit(self.filename, "Unable to parse registry file")
+            return
+        self.signals.loaded.emit(self.filename, root)
+
+
+class RecoveryWorkerSignals(QtCore.QObject):
+    # Filename, and bytes searched so far and in total
+    progress = QtCore.Signal(str, object, object)
+    # Filename and Recovery, or None if the scan was cancelled
+    finished = QtCore.Signal(str, object)
+
+
+class RecoveryWorker(QtCore.QRunnable):
+    """Searches the free cells of a hive for deleted keys and values on a worker thread"""
+
+    def __init__(self, filename: str, hive: Registry.Registry):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.filename = filename
+        self.hive = hive
+        self.signals = RecoveryWorkerSignals()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        from . import recovery
+
+        try:
+            with profiling.span("recover_deleted") as span:
+                result = recovery.scan(self.hive,
+                                       progress=lambda done, total: self.signals.progress.emit(self.filename, done, total),
+                                       cancelled=self.is_cancelled)
+                if result is not None:
+                    span.add(keys=result.key_count(), values=result.value_count())
+            self.signals.finished.emit(self.filename, result)
+        finally:
+            self._finished.set()
+
+
+def deleted_icon(filename: str) -> QtGui.QIcon:
+    """Tint an icon red, to tell recovered keys apart from the keys still in the hive"""
+    pixmap = QtGui.QPixmap(helpers.resource_path(filename))
+    painter = QtGui.QPainter(pixmap)
+    painter.setCompositionMode(QtGui.QPainter.CompositionMode.CompositionMode_SourceAtop)
+    painter.fillRect(pixmap.rect(), QtGui.QColor(220, 40, 40, 150))
+    painter.end()
+    return QtGui.QIcon(pixmap)
+
+
+class KeyTreeModel(QtCore.QAbstractItemModel):
+    """Item model of the loaded hives, fetching subkeys page by page as the view needs them"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.roots: list[KeyItem] = []
+        # Loaded KeyItems of each hive by the offset of their nk record
+        self.nodes: "dict[str, dict[int, KeyItem]]" = {}
+        # Background colors of keys by hive filename and nk record offset
+        self.highlights: "dict[str, dict[int, QtGui.QColor]]" = {}
+        # Top level rows of the deleted keys recovered from each hive by filename
+        self.deleted: "dict[str, KeyItem]" = {}
+
+        self.key_icon = QtGui.QIcon(
+            helpers.resource_path("img/folder.png"))
+        self.hive_icon = QtGui.QIcon(
+            helpers.resource_path("img/icon.png"))
+        self._deleted_icon: QtGui.QIcon = None
+
+    @property
+    def deleted_icon(self) -> QtGui.QIcon:
+        if self._deleted_icon is None:
+            self._deleted_icon = deleted_icon("img/folder.png")
+        return self._deleted_icon
+
+    def item(self, index: QtCore.QModelIndex) -> KeyItem:
+        """Returns the KeyItem for a model index"""
+        if not index.isValid():
+            return None
+        return index.internalPointer()
+
+    def index_for(self, item: KeyItem, column: int = 0) -> QtCore.QModelIndex:
+        """Returns the model index of a KeyItem"""
+        if item is None:
+            return QtCore.QModelIndex()
+        return self.createIndex(item.row, column, item)
+
+    def add_hive(self, filename: str, hive: Registry.Registry, root: KeyItem = None) -> KeyItem:
+        """Add a hive as the first top level row, along with any subkeys already loaded into its root"""
+        if root is None:
+            root = KeyItem(hive, filename, regf.root_offset(hive))
+        nodes = self.nodes[filename] = {}
+        stack = [root]
+        while stack:
+            item = stack.pop()
+            nodes.setdefault(item.offset, item)
+            stack.extend(item.children)
+        self.beginInsertRows(QtCore.QModelIndex(), 0, 0)
+        self.roots.insert(0, root)
+        self.renumber_roots()
+        self.endInsertRows()
+        return root
+
+    def remove_hive(self, root: KeyItem):
+        """Remove the top level row of a hive, and the row of its deleted keys"""
+        self.remove_deleted(root.filename)
+        self.beginRemoveRows(QtCore.QModelIndex(), root.row, root.row)
+        del self.roots[root.row]
+        del self.nodes[root.filename]
+        self.highlights.pop(root.filename, None)
+        self.renumber_roots()
+        self.endRemoveRows()
+
+    def add_deleted(self, root: KeyItem, found: "recovery.Recovery") -> KeyItem:
+        """Add a top level row for the deleted keys recovered from a hive, right below the hive's row"""
+        from . import recovery
+
+        item = KeyItem(root.hive, root.filename, recovery.ROOT, recovery=found)
+        item.name = ""
+        item.num_subkeys = len(found.subkey_offsets(recovery.ROOT))
+        row = root.row + 1
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.roots.insert(row, item)
+        self.deleted[root.filename] = item
+        self.renumber_roots()
+        self.endInsertRows()
+        return item
+
+    def remove_deleted(self, filename: str):
+        """Remove the row of the deleted keys of a hive, if there is one"""
+        item = self.deleted.pop(filename, None)
+        if item is None:
+            return
+        self.beginRemoveRows(QtCore.QModelIndex(), item.row, item.row)
+        del self.roots[item.row]
+        self.renumber_roots()
+        self.endRemoveRows()
+
+    def hive_roots(self) -> "list[KeyItem]":
+        """Returns the top level rows of the open hives in the order they are shown, without the rows of deleted keys"""
+        return [root for root in self.roots if root.recovery is None]
+
+    def skeleton(self, root: KeyItem) -> list:
+        """Returns the metadata of the loaded keys of a hive in tree order, in the format of a session skeleton"""
+        keys = []
+        stack = [(root, -1)]
+        while stack:
+            item, parent = stack.pop()
+            item.load()
+            keys.append([item.offset, parent, item.name, item.num_subkeys, item.timestamp])
+            position = len(keys) - 1
+            stack.extend((child, position) for child in reversed(item.children))
+        return keys
+
+    def renumber_roots(self):
+        for row, root in enumerate(self.roots):
+            root.row = row
+
+    def fetch_until(self, item: KeyItem, row: int):
+        """Fetch the children of a KeyItem until the given row is loaded, in a single insert"""
+        self.fetch(self.index_for(item), (row // FETCH_SIZE + 1) * FETCH_SIZE)
+
+    def child_item(self, item: KeyItem, offset: int) -> KeyItem:
+        """Returns the child of a KeyItem whose nk record is at offset, loading the rows up to it if needed"""
+        child = self.nodes[item.filename].get(offset)
+        if child is not None and child.parent is item:
+            return child
+        row = item.subkey_row(offset)
+        if row < 0:
+            return None
+        self.fetch_until(item, row)
+        return item.children[row]
+
+    def index(self, row: int, column: int, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> QtCore.QModelIndex:
+        if not self.hasIndex(row, column, parent):
+            return QtCore.QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, self.roots[row])
+        return self.createIndex(row, column, parent.internalPointer().children[row])
+
+    def parent(self, index: QtCore.QModelIndex = None) -> QtCore.QModelIndex:
+        if index is None:
+            return super().parent()
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self.index_for(index.internalPointer().parent)
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.column() > 0:
+            return 0
+        if not parent.isValid():
+            return len(self.roots)
+        return len(parent.internalPointer().children)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 3
+
+    def hasChildren(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> bool:
+        if parent.column() > 0:
+            return False
+        if not parent.isValid():
+            return len(self.roots) > 0
+        return parent.internalPointer().has_subkeys()
+
+    def canFetchMore(self, parent: QtCore.QModelIndex) -> bool:
+        if not parent.isValid():
+            return False
+        item: KeyItem = parent.internalPointer()
+        return len(item.children) < len(item.subkey_offsets())
+
+    def fetchMore(self, parent: QtCore.QModelIndex):
+        if not parent.isValid():
+            return
+        self.fetch(parent, len(parent.internalPointer().children) + FETCH_SIZE)
+
+    def fetch(self, parent: QtCore.QModelIndex, end: int):
+        """Load the children of parent up to, but not including, row end"""
+        item: KeyItem = parent.internalPointer()
+        offsets = item.subkey_offsets()
+        start = len(item.children)
+        end = min(end, len(offsets))
+        if end <= start:
+            return
+
+        with profiling.span("load_subkeys") as span:
+            span.add(keys=end - start)
+            self.beginInsertRows(parent, start, end - 1)
+            item.children.extend(KeyItem(item.hive, item.filename, regf.cell_data_offset(offsets[row]), item, row,
+                                         item.recovery)
+                                 for row in range(start, end))
+            if item.recovery is None:
+                # Deleted keys are never looked up by offset, the tree only leads to keys still in the hive
+                nodes = self.nodes[item.filename]
+                for child in item.children[start:end]:
+                    nodes.setdefault(child.offset, child)
+            self.endInsertRows()
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        item: KeyItem = index.internalPointer()
+
+        if role == QtCore.Qt.ItemDataRole.DisplayRole:
+            item.load()
+            if index.column() == 0:
+                if item.parent is None and item.recovery is not None:
+                    return f"Deleted Keys ({item.filename})"
+                if item.parent is None:
+                    return f"{item.hive.hive_type().name} ({item.filename})"
+                return item.name
+            if index.column() == 1:
+                return str(item.num_subkeys)
+            if index.column() == 2:
+                if item.parent is None and item.recovery is not None:
+                    return ""
+                return format_timestamp(item.timestamp)
+
+        if role == QtCore.Qt.ItemDataRole.DecorationRole and index.column() == 0:
+            if item.recovery is not None:
+                return self.deleted_icon
+            if item.parent is None:
+                return self.hive_icon
+            return self.key_icon
+
+        if role == QtCore.Qt.ItemDataRole.ToolTipRole and item.recovery is not None and item.parent is not None \
+                and item.parent.parent is None:
+            location = item.recovery.location(item.offset)
+            if location is None:
+                return "Deleted, the key it was deleted from is gone"
+            return f"Deleted from {formatting.format_path(item.hive, location)}"
+
+        if role == QtCore.Qt.ItemDataRole.BackgroundRole and item.filename in self.highlights:
+            return self.highlights[item.filename].get(item.offset)
+
+        return None
+
+    def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.ItemDataRole.DisplayRole):
+        if orientation == QtCore.Qt.Orientation.Horizontal and role == QtCore.Qt.ItemDataRole.DisplayRole:
+            return ["Key", "Subkeys", "Modified"][section]
+        return None
+
+
+class KeyTree(QtWidgets.QTreeView):
+    """Tree view that displays registry keys"""
+
+    # Filename of a hive that was just added
+    hive_loaded = QtCore.Signal(str)
+    # Number of hives opened so far and in total since the last time none were being opened
+    load_progress = QtCore.Signal(int, int)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.roots: dict[str, KeyItem] = {}
         self.reg: dict[str, Registry.Registry] = {}
+        self.key_caches: "dict[str, key_cache.KeyCache]" = {}
+        # Hives still being opened by filename
+        self.loaders: "dict[str, HiveLoader]" = {}
+        self.loads_finished = 0
+        self.loads_started = 0
+        # Filenames and messages of the hives that couldn't be opened since the last report
+        self.load_errors: "list[tuple[str, str]]" = []
+        # Expanded keys and skeletons of the hives of a session that is being restored, by filename
+        self.pending_views: "dict[str, dict]" = {}
+        # Key and value to select once its hive is restored
+        self.pending_selection: dict = None
+        # Whether the deleted keys of every open hive are recovered and shown
+        self.show_deleted = False
+        # Searches for deleted keys still running by filename
+        self.recoveries: "dict[str, RecoveryWorker]" = {}
+        # Removed hives, and the workers that must stop before their files are unmapped
+        self.closing: "list[tuple[Registry.Registry, list[QtCore.QRunnable]]]" = []
+        self.close_timer = QtCore.QTimer(self)
+        self.close_timer.setSingleShot(True)
+        self.close_timer.setInterval(CLOSE_INTERVAL)
+        self.close_timer.timeout.connect(self.close_hives)
+
+        self.key_model = KeyTreeModel(self)
+        self.setModel(self.key_model)
+        self.setUniformRowHeights(True)
+        self.setSelectionMode(
+            QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
 
-        self.setColumnCount(3)
-        self.setHeaderLabels(["Key", "Subkeys", "Modified"])
         self.header().setStretchLastSection(False)
         self.header().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
         self.header().setSectionResizeMode(1, QtWidgets.QHeaderView.ResizeToContents)
         self.header().setSectionResizeMode(2, QtWidgets.QHeaderView.ResizeToContents)
         self.selectionModel().selectionChanged.connect(self.handle_selection_change)
-        self.expanded.connect(self.handle_expand)
-        self.collapsed.connect(self.handle_collapse)
-
-        self.key_icon = QtGui.QIcon(
-            helpers.resource_path("img/folder.png"))
-        self.hive_icon = QtGui.QIcon(
-            helpers.resource_path("img/icon.png"))
 
     def get_uri_textbox(self) -> QtWidgets.QLineEdit:
         """Returns the URI textbox from the main form"""
@@ -45,9 +587,9 @@ class KeyTree(QtWidgets.QTreeWidget):
 
     def get_selected_key(self) -> KeyItem:
         """Returns the selected key in the KeyTree"""
-        selected = self.selectedItems()
+        selected = self.selectionModel().selectedRows()
         if len(selected) > 0:
-            return selected[0]
+            return self.key_model.item(selected[0])
 
     def get_selected_hive(self) -> KeyItem:
         """Returns the root KeyItem of the selected KeyItem"""
@@ -59,6 +601,14 @@ class KeyTree(QtWidgets.QTreeWidget):
         if self.roots.get(key.filename) is not None:
             return self.roots[key.filename]
 
+    def select_item(self, item: KeyItem):
+        """Select and scroll to the specified KeyItem"""
+        index = self.key_model.index_for(item)
+        self.clearSelection()
+        self.scrollTo(index)
+        self.setCurrentIndex(index)
+        self.setFocus()
+
     def remove_all_hives(self):
         """Unload all hives"""
         for root in list(self.roots.values()):
@@ -76,157 +626,298 @@ class KeyTree(QtWidgets.QTreeWidget):
         self.window().hive_info.set_info("", "", "", "")
 
         filename = root.filename
-        self.takeTopLevelItem(self.indexOfTopLevelItem(root))
-        self.window().value_table.set_data([])
+        # Workers that may still be reading the hive, which is only unmapped once they have stopped
+        workers = []
+        recovery_worker = self.recoveries.pop(filename, None)
+        if recovery_worker is not None:
+            recovery_worker.cancel()
+            workers.append(recovery_worker)
+        self.key_model.remove_hive(root)
+        self.window().value_table.set_data()
+        self.window().value_table.remove_hive(root.hive)
+        if self.window().find_dialog_created():
+            workers.extend(self.window().find_dialog.remove_hive(filename))
+        if self.window().diff_panel_created():
+            workers.extend(self.window().diff_panel.remove_hive(filename))
+        if self.window().timeline_panel_created():
+            workers.extend(self.window().timeline_panel.remove_hive(filename))
+        export_worker = self.window().export_worker
+        if export_worker is not None and export_worker.hive is root.hive:
+            workers.append(export_worker)
         self.get_uri_textbox().setText("")
 
         del self.roots[filename]
         del self.reg[filename]
+        del self.key_caches[filename]
+        self.closing.append((root.hive, workers))
+        self.close_timer.start()
+
+    def close_hives(self):
+        """Unmap the files of removed hives, once the view has let go of their keys and the workers that were
+        reading them have stopped"""
+        ready = []
+        waiting = []
+        for hive, workers in self.closing:
+            for worker in workers:
+                # A cancelled worker still queued behind unrelated ones stops as soon as it starts, so run it here
+                if worker.is_cancelled() and QtCore.QThreadPool.globalInstance().tryTake(worker):
+                    worker.run()
+            if all(worker.is_finished() for worker in workers):
+                ready.append(hive)
+            else:
+                waiting.append((hive, workers))
+        self.closing = waiting
+        if len(self.closing) > 0:
+            self.close_timer.start()
+        if len(ready) == 0:
+            return
+        # Removed keys refer to each other, and hold views of the map until the cycles are collected
+        gc.collect()
+        for hive in ready:
+            regf.close_hive(hive)
+
+    def set_highlights(self, highlights: "dict[str, dict[int, QtGui.QColor]]"):
+        """Color the background of keys by hive filename and nk record offset"""
+        self.key_model.highlights = highlights
+        self.viewport().update()
 
     def load_hive(self, filename: str):
-        """Load a registry hive from a file"""
+        """Load a registry hive from a file on the GUI thread"""
 
         # Remove hive before loading another one
-        if self.roots.get(filename) is not None:
+        if self.roots.get(filename) is not None or filename in self.loaders:
             helpers.show_message_box(
                 "Registry hive already open, close it first before opening again", alert_type=helpers.MessageBoxTypes.CRITICAL)
             return
 
         try:
-            self.reg[filename] = Registry.Registry(filename)
-        except (Registry.RegistryParse.ParseException, struct.error):
+            root = load_root(filename)
+        except (OSError, Registry.RegistryParse.ParseException, struct.error):
             helpers.show_message_box(
                 "Unable to parse registry file", alert_type=helpers.MessageBoxTypes.CRITICAL)
             return
+        self.add_loaded_hive(filename, root)
+
+    def open_hives(self, filenames: "list[str]"):
+        """Open hives concurrently on worker threads, adding each one to the tree as soon as it is ready"""
+        for filename in filenames:
+            if self.roots.get(filename) is not None or filename in self.loaders:
+                self.load_errors.append(
+                    (filename, "Registry hive already open, close it first before opening again"))
+                continue
+            loader = HiveLoader(filename, self.pending_views.get(filename, {}).get("skeleton"))
+            loader.signals.loaded.connect(self.handle_hive_loaded)
+            loader.signals.failed.connect(self.handle_hive_failed)
+            self.loaders[filename] = loader
+            self.loads_started += 1
+            QtCore.QThreadPool.globalInstance().start(loader)
+        self.report_load_progress()
+
+    def cancel_loading(self):
+        """Stop adding the hives that are still being opened"""
+        for loader in self.loaders.values():
+            loader.cancel()
+
+    def add_loaded_hive(self, filename: str, root: KeyItem):
+        self.reg[filename] = root.hive
+        from . import key_cache
+
+        self.key_caches[filename] = key_cache.KeyCache(root.hive)
+        self.roots[filename] = self.key_model.add_hive(filename, root.hive, root)
+        # Don't take the selection away from a key the user has moved to while hives were opening
+        selected = self.get_selected_key()
+        if selected is None or selected.parent is None:
+            self.select_item(self.roots[filename])
+        self.restore_view(filename)
+        if self.show_deleted:
+            self.recover_deleted(filename)
+        self.hive_loaded.emit(filename)
+
+    def set_show_deleted(self, show: bool):
+        """Recover and show the deleted keys of every open hive, or hide them"""
+        self.show_deleted = show
+        if show:
+            for filename in self.roots:
+                self.recover_deleted(filename)
+            return
 
-        # Create new root KeyItem
-        self.roots[filename] = KeyItem(
-            "", filename, [f"{self.reg[filename].hive_type().name} ({filename})", str(self.reg[filename].root().subkeys_number()), self.reg[filename].root().timestamp().strftime("%Y-%m-%d %H:%M:%S")])
-
-        self.roots[filename].setIcon(0, self.hive_icon)
-        self.load_subkeys(self.roots[filename])
-
-        self.insertTopLevelItems(0, [self.roots[filename]])
-        self.clearSelection()
-        self.roots[filename].setSelected(True)
-        self.setFocus()
+        self.cancel_recovery()
+        selected = self.get_selected_key()
+        if selected is not None and selected.recovery is not None:
+            self.window().value_table.set_data()
+            self.get_uri_textbox().setText("")
+        for filename in list(self.key_model.deleted):
+            self.key_model.remove_deleted(filename)
+
+    def recover_deleted(self, filename: str):
+        """Search a hive for deleted keys and values on a worker thread, adding a row for them once it is done"""
+        if filename in self.recoveries or filename in self.key_model.deleted:
+            return
+        worker = RecoveryWorker(filename, self.reg[filename])
+        worker.signals.progress.connect(self.handle_recovery_progress)
+        worker.signals.finished.connect(self.handle_recovery_finished)
+        self.recoveries[filename] = worker
+        QtCore.QThreadPool.globalInstance().start(worker)
+
+    def cancel_recovery(self):
+        """Stop the searches for deleted keys that are still running"""
+        for worker in self.recoveries.values():
+            worker.cancel()
+        self.recoveries.clear()
+
+    def handle_recovery_progress(self, filename: str, done: int, total: int):
+        if filename in self.recoveries:
+            self.window().statusBar().showMessage(
+                f"Recovering deleted keys from {filename}: {done * 100 // max(total, 1)}%")
+
+    def handle_recovery_finished(self, filename: str, found: "recovery.Recovery"):
+        worker = self.recoveries.pop(filename, None)
+        if worker is None or worker.is_cancelled() or found is None or filename not in self.roots:
+            return
+        self.key_model.add_deleted(self.roots[filename], found)
+        self.window().statusBar().showMessage(
+            f"Recovered {found.key_count():,} deleted keys and {found.value_count():,} deleted values from {filename}", 5000)
+
+    def restore_session(self, state: dict):
+        """Reopen the hives of a session, restoring their expanded keys and the selection as each one is ready"""
+        hives = [hive for hive in state.get("hives", ()) if isinstance(hive, dict) and "filename" in hive]
+        self.pending_views = {hive["filename"]: hive for hive in hives}
+        self.pending_selection = state.get("selected")
+        self.open_hives([hive["filename"] for hive in hives])
+
+    def restore_view(self, filename: str):
+        view = self.pending_views.pop(filename, None)
+        if view is not None:
+            for offset in view.get("expanded", ()):
+                if not isinstance(offset, int):
+                    continue
+                item = self.reveal_key_at(filename, offset)
+                if item is not None:
+                    self.expand(self.key_model.index_for(item))
+
+        selection = self.pending_selection
+        if isinstance(selection, dict) and selection.get("filename") == filename:
+            self.pending_selection = None
+            if not isinstance(selection.get("offset"), int):
+                return
+            item = self.select_key_at(filename, selection["offset"])
+            if item is not None and selection.get("value") is not None:
+                self.window().value_table.select_value(selection["value"])
+
+    def session_hives(self) -> "list[dict]":
+        """Returns the open hives in the order they were opened, with their expanded keys and skeletons"""
+        hives = []
+        for root in reversed(self.key_model.hive_roots()):
+            expanded = []
+            stack = [root]
+            while stack:
+                item = stack.pop()
+                if len(item.children) > 0 and self.isExpanded(self.key_model.index_for(item)):
+                    expanded.append(item.offset)
+                    stack.extend(reversed(item.children))
+            try:
+                skeleton = {"fingerprint": session.fingerprint(root.filename, root.hive),
+                            "keys": self.key_model.skeleton(root)}
+            except OSError:
+                skeleton = None
+            hives.append({"filename": root.filename, "expanded": expanded, "skeleton": skeleton})
+        return hives
+
+    def handle_hive_loaded(self, filename: str, root: KeyItem):
+        loader = self.loaders.pop(filename, None)
+        if loader is not None and not loader.is_cancelled():
+            self.add_loaded_hive(filename, root)
+        self.loads_finished += 1
+        self.report_load_progress()
+
+    def handle_hive_failed(self, filename: str, message: str):
+        loader = self.loaders.pop(filename, None)
+        self.pending_views.pop(filename, None)
+        if loader is not None and not loader.is_cancelled():
+            self.load_errors.append((filename, message))
+        self.loads_finished += 1
+        self.report_load_progress()
+
+    def report_load_progress(self):
+        """Update the progress of the hives being opened, and report the ones that failed once all are done"""
+        self.load_progress.emit(self.loads_finished, self.loads_started)
+        if len(self.loaders) > 0:
+            return
+        self.loads_finished = self.loads_started = 0
+        if len(self.load_errors) > 0:
+            errors = self.load_errors
+            self.load_errors = []
+            heading = "Unable to open registry file" if len(errors) == 1 else "Unable to open registry files"
+            helpers.show_message_box(
+                heading + ":\n\n" + "\n".join(f"{filename}: {message}" for filename, message in errors),
+                alert_type=helpers.MessageBoxTypes.CRITICAL)
 
     def set_uri(self, index: QtCore.QModelIndex):
         """Set navbar full key path"""
-        if isinstance(self.itemFromIndex(index), KeyItem):
-            path = self.format_uri(self.itemFromIndex(index))
+        key = self.key_model.item(index)
+        if key is not None:
+            path = self.format_uri(key)
             self.get_uri_textbox().setText(path)
 
     def format_uri(self, key: KeyItem) -> str:
         """Format a URI path for the specified KeyItem"""
-        if key.path == "":
-            return self.reg[key.filename].hive_type().name
-        else:
-            return self.reg[key.filename].hive_type().name + "\\" + key.path
+        return formatting.format_path(self.reg[key.filename], key.path)
 
     def parse_uri(self, uri: str, hive_type: str = None, root: str = None) -> str:
         """Parses a user-specified URI into a registry path"""
-
-        # Sanitize URI
-        uri = uri.strip()
-        uri = uri.strip("\\")
-        if hive_type is not None:
-            uri = uri.replace(hive_type + "\\", "", 1)
-            uri = uri.strip("\\")
-        if root is not None:
-            uri = uri.replace(root + "\\", "", 1)
-            uri = uri.strip("\\")
-
-        if uri == "" or uri == hive_type:
-            return ""
-
-        return uri
-
-    def remove_hive_prefix(self, root_name: str, path: str) -> str:
-        prefix = root_name + "\\"
-        return path.replace(prefix, "", 1)
-
-    def load_subkeys(self, key: KeyItem):
-        for i in range(key.childCount()):
-            key.removeChild(key.child(0))
-
-        root_name = self.reg[key.filename].root().name()
-
-        if key.childCount() > 1:
-            return
-
-        num_subkeys = self.reg[key.filename].open(key.path).subkeys_number()
-
-        # Don't bother showing the progress bar if there aren't many items
-        display_progressbar = num_subkeys > 20
-
-        if display_progressbar:
-            self.window().progress_bar.setMaximum(num_subkeys)
-            self.window().progress_bar.setValue(0)
-            self.window().progress_bar.show()
-            i = 0
-
-        for subkey in self.reg[key.filename].open(key.path).subkeys():
-            if display_progressbar:
-                # Process events once in a while so the application doesn't "stop responding" on Windows
-                if i % 20 == 0:
-                    self.window().progress_bar.setValue(i)
-                # if i % 1000 == 0:
-                #     QtCore.QCoreApplication.processEvents()
-                # Removed for now because processEvents causes a TON of delay
-                i += 1
-
-            subkey_child = KeyItem(self.remove_hive_prefix(root_name, subkey.path()), key.filename, [
-                                   subkey.name(), str(subkey.subkeys_number()), subkey.timestamp().strftime("%Y-%m-%d %H:%M:%S")])
-            subkey_child.setIcon(0, self.key_icon)
-            key.addChild(subkey_child)
-
-            # Create a fake child so that the tree shows an arrow to drop down
-            if subkey.subkeys_number() > 0:
-                subkey_child.addChild(KeyItem("", ""))
-
-            # for subsubkey in subkey.subkeys():
-            #     subsubkey_child = KeyItem(
-            #         self.remove_hive_prefix(root_name, subsubkey.path()), subkey_child.filename, [subsubkey.name()])
-            #     subkey_child.addChild(subsubkey_child)
-
-        if display_progressbar:
-            self.window().progress_bar.hide()
+        return formatting.parse_path(uri, hive_type, root)
 
     def select_key_from_path(self, path: str) -> KeyItem:
         """Find a KeyItem from a given path and highlight it"""
         parent = self.get_selected_hive()
         if parent is None:
             return
-        levels = path.count("\\") + 1
 
         # Check if root is selected
         if path == parent.path:
-            self.clearSelection()
-            self.scrollToItem(parent)
-            parent.setSelected(True)
-            self.setFocus()
+            self.select_item(parent)
             return
 
-        for level in range(levels):
-            # Expand parent
-            parent.setExpanded(True)
-            for c in range(parent.childCount()):
-                subpath = "\\".join(path.split("\\")[:level+1])
-                child_path = parent.child(c).path
-                # Last level, should have match
-                if child_path == subpath:
-                    if level + 1 == levels:
-                        # Found!
-                        self.clearSelection()
-                        self.scrollToItem(parent.child(c))
-                        parent.child(c).setSelected(True)
-                        self.setFocus()
-                        return parent.child(c)
-
-                    # Set parent to new child
-                    parent = parent.child(c)
-                    break
+        try:
+            key = self.key_caches[parent.filename].open(path)
+        except Registry.RegistryKeyNotFoundException:
+            return
+        return self.select_key_at(parent.filename, key._nkrecord.offset())
+
+    def select_key_at(self, filename: str, offset: int) -> KeyItem:
+        """Find the KeyItem of the key whose nk record is at offset and highlight it"""
+        item = self.reveal_key_at(filename, offset)
+        if item is not None:
+            self.select_item(item)
+        return item
+
+    def reveal_key_at(self, filename: str, offset: int) -> KeyItem:
+        """Find the KeyItem of the key whose nk record is at offset, loading and expanding its ancestors.
+
+        The key's unloaded ancestors are found through the parent offsets of their nk records,
+        so no subkey names are compared on the way down."""
+        nodes = self.key_model.nodes[filename]
+        buf = regf.buffer(self.reg[filename])
+        missing = []
+        try:
+            while offset not in nodes:
+                if offset in missing:
+                    # The parent offsets of a damaged hive form a cycle
+                    return
+                regf.check_key(buf, offset)
+                missing.append(offset)
+                offset = regf.key_parent(buf, offset)
+        except (Registry.RegistryParse.ParseException, struct.error):
+            return
+
+        item = nodes[offset]
+        for offset in reversed(missing):
+            child = self.key_model.child_item(item, offset)
+            if child is None:
+                return
+            self.expand(self.key_model.index_for(item))
+            item = child
+        return item
 
     def handle_uri_change(self):
         root = self.get_selected_hive()
@@ -239,7 +930,7 @@ class KeyTree(QtWidgets.QTreeWidget):
             uri, self.reg[root.filename].hive_type().name)
 
         try:
-            self.reg[root.filename].open(parsed_uri)
+            self.key_caches[root.filename].open(parsed_uri)
         except Registry.RegistryKeyNotFoundException:
             helpers.show_message_box(
                 "Key was not found", alert_type=helpers.MessageBoxTypes.CRITICAL)
@@ -251,34 +942,16 @@ class KeyTree(QtWidgets.QTreeWidget):
         if len(selected.indexes()) < 1:
             return
 
-        index = selected.indexes()[0]
-
-        self.set_uri(index)
-
-        key: KeyItem = self.itemFromIndex(index)
-
-        self.window().hive_info.set_info(key.filename, self.reg[key.filename].hive_type(
-        ).name, self.reg[key.filename].hive_name(), self.reg[key.filename].root().name())
-
-        try:
-            self.window().value_table.set_data(
-                self.reg[key.filename].open(key.path).values())
-        except Registry.RegistryKeyNotFoundException:
-            self.window().value_table.set_data([])
+        with profiling.span("select_key"):
+            index = selected.indexes()[0]
 
-    def handle_expand(self, index: QtCore.QModelIndex):
-        self.window().statusBar().showMessage("Loading...")
-        self.window().statusBar().repaint()
-        self.setCursor(QtCore.Qt.CursorShape.BusyCursor)
+            self.set_uri(index)
 
-        key = self.itemFromIndex(index)
-        self.load_subkeys(key)
+            key = self.key_model.item(index)
 
-        self.window().statusBar().clearMessage()
-        self.unsetCursor()
+            self.window().hive_info.set_info(key.filename, self.reg[key.filename].hive_type(
+            ).name, self.reg[key.filename].hive_name(), self.reg[key.filename].root().name())
 
-    def handle_collapse(self, index: QtCore.QModelIndex):
-        key = self.itemFromIndex(index)
-        for i in range(key.childCount()):
-            key.removeChild(key.child(0))
-        key.addChild(KeyItem("", ""))
+            # Deleted keys only show the values that were recovered with them
+            offsets = key.recovery.value_offsets(key.offset) if key.recovery is not None else None
+            self.window().value_table.set_data(key.hive, key.offset, offsets)
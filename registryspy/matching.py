@@ -0,0 +1,168 @@
+import re
+import struct
+
+from Registry import Registry
+
+from . import regf
+
+
+STRING_TYPES = (Registry.RegSZ, Registry.RegExpandSZ)
+NUMBER_FORMATS = {
+    Registry.RegDWord: ("<I", "{0:#010x} ({0})"),
+    Registry.RegQWord: ("<Q", "{0:#018x} ({0})"),
+    Registry.RegBigEndian: (">I", "{0:#010x} ({0})"),
+}
+EMPTY_TEXT = "(value not set)"
+
+
+def string_end(raw: bytes) -> int:
+    """Returns the length of REG_SZ data up to its terminating null"""
+    end = raw.find(b"\x00\x00")
+    while end != -1 and end % 2 != 0:
+        end = raw.find(b"\x00\x00", end + 1)
+    if end == -1:
+        return len(raw) & ~1
+    return end
+
+
+def decode_string(raw: bytes) -> str:
+    """Decode REG_SZ data up to its terminating null"""
+    return raw[:string_end(raw)].decode("utf-16le", "replace")
+
+
+def decode_multi_string(raw: bytes) -> "list[str]":
+    """Decode REG_MULTI_SZ data into its strings"""
+    return [s for s in raw[:len(raw) & ~1].decode("utf-16le", "replace").split("\x00") if s != ""]
+
+
+def format_number(datatype: int, raw: bytes) -> str:
+    """Format numeric data the way the value table shows it, or return None if it is too short"""
+    fmt, text = NUMBER_FORMATS[datatype]
+    if len(raw) < struct.calcsize(fmt):
+        return None
+    return text.format(struct.unpack_from(fmt, raw)[0])
+
+
+def filetime_text(raw: bytes) -> str:
+    """Format REG_FILETIME data as a date and time"""
+    return str(regf.filetime_to_datetime(struct.unpack_from("<Q", raw)[0]))
+
+
+def parse_hex(term: str) -> bytes:
+    """Parse a term such as "0A 54 D3" as bytes, or return None if it isn't hex"""
+    digits = term.replace(" ", "")
+    if len(digits) < 2 or len(digits) % 2 != 0:
+        return None
+    try:
+        return bytes.fromhex(digits)
+    except ValueError:
+        return None
+
+
+def data_texts(datatype: int, raw: bytes) -> "list[str]":
+    """Returns the texts that data search can match in raw value data, for the search index"""
+    if len(raw) == 0:
+        return [EMPTY_TEXT]
+    if datatype in STRING_TYPES:
+        return [decode_string(raw)]
+    if datatype == Registry.RegMultiSZ:
+        strings = decode_multi_string(raw)
+        return strings + [" ".join(strings)]
+    if datatype in NUMBER_FORMATS:
+        text = format_number(datatype, raw)
+        if text is not None:
+            return [text]
+    texts = []
+    if datatype == Registry.RegFileTime and len(raw) >= 8:
+        # Shown as hex, so the date is only searched alongside the binary texts
+        texts.append(filetime_text(raw))
+    # UTF-16LE text can start at either byte of binary data
+    return texts + [raw.hex(" "),
+            raw.decode("windows-1252", "replace"),
+            raw[:len(raw) & ~1].decode("utf-16le", "replace"),
+            raw[1:len(raw) - (len(raw) + 1) % 2].decode("utf-16le", "replace")]
+
+
+class Matcher:
+    """Compiled search term that matches names and raw value data.
+
+    String data is searched for the UTF-16LE encoding of the term and binary data for its hex,
+    ANSI and UTF-16LE encodings, so data is never formatted for display just to be searched.
+    Raises re.error if a regular expression doesn't compile."""
+
+    def __init__(self, term: str, case_sensitive=False, exact_match=False, regex=False):
+        self.term = term
+        self.case_sensitive = case_sensitive
+        self.exact_match = exact_match
+        self.regex = regex
+        flags = 0 if case_sensitive else re.IGNORECASE
+
+        self.text_pattern = re.compile(term if regex else re.escape(term), flags)
+
+        # Byte patterns are only case-insensitive for ASCII, so other terms fall back to decoding
+        self.utf16_pattern = None
+        if not regex and (case_sensitive or term.isascii()):
+            self.utf16_pattern = re.compile(
+                re.escape(term.encode("utf-16le")), flags)
+
+        self.hex_needle = None if regex else parse_hex(term)
+        self.needles = set()
+        self.bytes_pattern = None
+        if regex:
+            try:
+                self.bytes_pattern = re.compile(term.encode("latin-1"), flags)
+            except UnicodeEncodeError:
+                pass
+        else:
+            self.needles.add(term.encode("utf-16le"))
+            try:
+                self.needles.add(term.encode("windows-1252"))
+            except UnicodeEncodeError:
+                pass
+            self.bytes_pattern = re.compile(
+                b"|".join(re.escape(needle) for needle in self.needles), flags)
+            if self.hex_needle is not None:
+                self.needles.add(self.hex_needle)
+
+    def match_text(self, text: str) -> bool:
+        if self.exact_match:
+            return self.text_pattern.fullmatch(text) is not None
+        return self.text_pattern.search(text) is not None
+
+    def match_data(self, datatype: int, raw: bytes) -> bool:
+        """Check if the raw data of a value matches"""
+        if len(raw) == 0:
+            return self.match_text(EMPTY_TEXT)
+
+        if datatype in STRING_TYPES or datatype == Registry.RegMultiSZ:
+            if self.utf16_pattern is not None and not self.exact_match:
+                if datatype != Registry.RegMultiSZ:
+                    raw = raw[:string_end(raw)]
+                return self._search_utf16(raw)
+            return any(self.match_text(text) for text in data_texts(datatype, raw))
+
+        if datatype in NUMBER_FORMATS:
+            text = format_number(datatype, raw)
+            if text is not None:
+                return self.match_text(text)
+        if datatype == Registry.RegFileTime and len(raw) >= 8 and self.match_text(filetime_text(raw)):
+            return True
+
+        if self.exact_match:
+            if self.regex:
+                return self.bytes_pattern is not None and self.bytes_pattern.fullmatch(raw) is not None
+            return raw in self.needles
+        if self.hex_needle is not None and raw.find(self.hex_needle) != -1:
+            return True
+        return self.bytes_pattern is not None and self.bytes_pattern.search(raw) is not None
+
+    def _search_utf16(self, raw: bytes) -> bool:
+        """Search UTF-16LE data, only accepting matches that start on a character boundary"""
+        pos = 0
+        while True:
+            match = self.utf16_pattern.search(raw, pos)
+            if match is None:
+                return False
+            if match.start() % 2 == 0:
+                return True
+            pos = match.start() + 1
@@ -0,0 +1,136 @@
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+
+# Set to cprofile or trace to profile a whole session
+PROFILE_VARIABLE = "REGISTRYSPY_PROFILE"
+# File the profile is written to, in the current directory by default
+PROFILE_FILE_VARIABLE = "REGISTRYSPY_PROFILE_FILE"
+PROFILE_MODES = ["cprofile", "trace"]
+
+
+class Span:
+    """A timed operation and the number of keys and values it read"""
+
+    __slots__ = ("name", "start", "duration", "keys", "values")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+        self.duration = 0.0
+        self.keys = 0
+        self.values = 0
+
+    def add(self, keys=0, values=0):
+        self.keys += keys
+        self.values += values
+
+
+_local = threading.local()
+# Called with every finished top level Span, from the thread that ran it
+_listeners = []
+_origin = time.perf_counter()
+
+_trace_events: "list[dict]" = None
+_trace_lock = threading.Lock()
+_profiler: cProfile.Profile = None
+_output: str = None
+
+
+def add_listener(listener):
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    _listeners.remove(listener)
+
+
+def _stack() -> "list[Span]":
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextlib.contextmanager
+def span(name: str):
+    """Time the operation in the with block, yielding its Span to count keys and values on.
+
+    The counts of a span nested in another are added to the outer span too."""
+    stack = _stack()
+    current = Span(name)
+    stack.append(current)
+    current.start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - current.start
+        stack.pop()
+        if stack:
+            stack[-1].add(current.keys, current.values)
+        _finish(current, top_level=not stack)
+
+
+def decoded(keys=0, values=0):
+    """Count keys and values decoded by the innermost span running on this thread, if any"""
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1].add(keys, values)
+
+
+def _finish(current: Span, top_level: bool):
+    if _trace_events is not None:
+        event = {"name": current.name, "cat": "registryspy", "ph": "X",
+                 "ts": (current.start - _origin) * 1e6, "dur": current.duration * 1e6,
+                 "pid": os.getpid(), "tid": threading.get_ident(),
+                 "args": {"keys": current.keys, "values": current.values}}
+        with _trace_lock:
+            _trace_events.append(event)
+    if top_level:
+        for listener in _listeners:
+            listener(current)
+
+
+def start_from_environment() -> str:
+    """Start profiling the session if asked to by the environment, returning the output filename"""
+    global _trace_events, _profiler, _output
+    mode = os.environ.get(PROFILE_VARIABLE, "").strip().lower()
+    if not mode:
+        return None
+    if mode not in PROFILE_MODES:
+        print(f"Unknown {PROFILE_VARIABLE} {mode!r}, expected one of {', '.join(PROFILE_MODES)}",
+              file=sys.stderr)
+        return None
+
+    default = f"registryspy-{os.getpid()}.{'prof' if mode == 'cprofile' else 'json'}"
+    _output = os.path.abspath(os.environ.get(PROFILE_FILE_VARIABLE) or default)
+    if mode == "cprofile":
+        # Only covers the main thread, the find workers show up in the trace instead
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    else:
+        _trace_events = []
+    return _output
+
+
+def stop() -> str:
+    """Stop profiling and write the profile, returning its filename"""
+    global _trace_events, _profiler, _output
+    if _output is None:
+        return None
+    output, _output = _output, None
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(output)
+        _profiler = None
+    if _trace_events is not None:
+        with _trace_lock:
+            events, _trace_events = _trace_events, None
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    print(f"Profile written to {output}", file=sys.stderr)
+    return output
@@ -0,0 +1,208 @@
+import struct
+
+from Registry import Registry
+
+from . import regf
+from . import timeline
+
+
+# Stands in for the parent of recovered keys whose own parent wasn't recovered, and for the owner of orphaned values
+ROOT = -1
+# Bytes of the hive searched between progress reports
+CHUNK_SIZE = 16 * 1024 * 1024
+# A free cell starts with its positive size, so the top byte of its size is zero, followed by
+# the signature of the record in it. Allocated cells have negative sizes, a top byte of 0xFF.
+NK_NEEDLE = b"\x00nk"
+VK_NEEDLE = b"\x00vk"
+# Smallest cells that can hold an nk or vk record with a one character name, including the size
+NK_MIN_SIZE = 4 + 0x4C + 1
+VK_MIN_SIZE = 4 + 0x14
+# Longest key and value names Windows allows, in bytes of UTF-16
+MAX_KEY_NAME = 255 * 2
+MAX_VALUE_NAME = 16383 * 2
+
+
+class Recovery:
+    """Deleted keys and values found in the free cells of a hive, rebuilt into subtrees by the parent offsets of the keys"""
+
+    def __init__(self, subkeys: "dict[int, list[int]]", values: "dict[int, list[int]]", locations: "dict[int, str]"):
+        # Cell offsets of the recovered subkeys of each recovered key by the offset of its nk record,
+        # with the keys whose parent wasn't recovered under ROOT
+        self.subkeys = subkeys
+        # Cell offsets of the values of each recovered key, with the values no recovered key refers to under ROOT
+        self.values = values
+        # Paths of the existing keys that keys under ROOT were deleted from, relative to the root key
+        self.locations = locations
+
+    def key_count(self) -> int:
+        return len(self.subkeys) - 1
+
+    def value_count(self) -> int:
+        return sum(len(values) for values in self.values.values())
+
+    def subkey_offsets(self, offset: int) -> "list[int]":
+        return self.subkeys.get(offset, ())
+
+    def value_offsets(self, offset: int) -> "list[int]":
+        return self.values.get(offset, ())
+
+    def location(self, offset: int) -> str:
+        """Returns the path of the existing key a key under ROOT was deleted from, or None if its parent is gone"""
+        return self.locations.get(offset)
+
+
+def hbins_end(buf) -> int:
+    """Returns the absolute offset of the end of the last hbin, as recorded in the base block"""
+    size, = struct.unpack_from("<I", buf, 0x28)
+    return min(len(buf), regf.FIRST_HBIN_OFFSET + size)
+
+
+def free_cells(buf, needle: bytes, start: int, stop: int, end: int) -> "list[int]":
+    """Returns the offsets of the free cells starting between start and stop whose record begins with needle.
+
+    The hive is searched with bytes.find rather than cell by cell, so only matches reach Python."""
+    cells = []
+    # The needle starts at the last byte of the cell size. A cell starting at stop belongs to the
+    # next chunk, so its needle must not fit before limit.
+    limit = min(stop + 2 + len(needle), end)
+    position = buf.find(needle, start + 3, limit)
+    while position >= 0:
+        cell = position - 3
+        # Cells are 8 byte aligned, anything else is a match inside a record
+        if (cell - regf.FIRST_HBIN_OFFSET) % 8 == 0:
+            cells.append(cell)
+        position = buf.find(needle, position + 1, limit)
+    return cells
+
+
+def _cell_size(buf, cell: int, min_size: int, end: int) -> int:
+    """Returns the size of a free cell, or 0 if it can't be a cell of at least min_size bytes"""
+    size, = struct.unpack_from("<i", buf, cell)
+    if size < min_size or size % 8 != 0 or cell + size > end:
+        return 0
+    return size
+
+
+def _deleted_key(buf, cell: int, end: int) -> bool:
+    """Check that a free cell holds what could be an nk record, ruling out matches in the data of other cells"""
+    size = _cell_size(buf, cell, NK_MIN_SIZE, end)
+    if size == 0:
+        return False
+    parent, = struct.unpack_from("<I", buf, cell + 4 + 0x10)
+    name_length, = struct.unpack_from("<H", buf, cell + 4 + 0x48)
+    return (parent % 8 == 0 and regf.FIRST_HBIN_OFFSET + parent < end and
+            0 < name_length <= MAX_KEY_NAME and 4 + 0x4C + name_length <= size)
+
+
+def _deleted_value(buf, cell: int, end: int) -> bool:
+    size = _cell_size(buf, cell, VK_MIN_SIZE, end)
+    if size == 0:
+        return False
+    name_length, = struct.unpack_from("<H", buf, cell + 4 + 0x2)
+    return name_length <= MAX_VALUE_NAME and 4 + 0x14 + name_length <= size
+
+
+def _is_value(buf, offset: int, end: int) -> bool:
+    return offset + 2 <= end and buf[offset:offset + 2] == b"vk"
+
+
+def _key_values(buf, offset: int, end: int) -> "list[int]":
+    """Returns the cell offsets of the vk records in the value list of a deleted key that are still vk records"""
+    try:
+        count = regf.key_value_count(buf, offset)
+        if count == 0:
+            return []
+        list_offset, = struct.unpack_from("<I", buf, offset + 0x28)
+        list_cell = regf.cell_data_offset(list_offset) - 4
+        if list_cell + 4 + 4 * count > end or abs(struct.unpack_from("<i", buf, list_cell)[0]) < 4 + 4 * count:
+            # The list was overwritten since the key was deleted
+            return []
+        offsets = regf.value_offsets(buf, offset)
+    except (Registry.RegistryParse.ParseException, struct.error):
+        return []
+    return [value for value in offsets if _is_value(buf, regf.cell_data_offset(value), end)]
+
+
+def _location(buf, resolver: timeline.PathResolver, parent: int, end: int) -> str:
+    """Returns the path of the existing key at parent relative to the root key, or None if there isn't one"""
+    if parent < regf.FIRST_HBIN_OFFSET + 4 or parent + 2 > end or buf[parent:parent + 2] != b"nk":
+        return None
+    if struct.unpack_from("<i", buf, parent - 4)[0] >= 0:
+        # Deleted too, but too damaged to be recovered
+        return None
+    if regf.is_root_key(buf, parent):
+        return ""
+    path = resolver.path(parent)
+    if path.startswith("[") or "\\" not in path:
+        return None
+    return path.split("\\", 1)[1]
+
+
+def rebuild(hive: Registry.Registry, keys: "list[int]", values: "list[int]") -> Recovery:
+    """Arrange the deleted keys and values in the free cells at the given offsets into subtrees"""
+    buf = regf.buffer(hive)
+    end = hbins_end(buf)
+    # Cell offsets relative to the first hbin by the absolute offset of the nk record in the cell
+    recovered = {cell + 4: cell - regf.FIRST_HBIN_OFFSET for cell in keys}
+
+    children: "dict[int, list[int]]" = {}
+    top = []
+    for offset in recovered:
+        parent = regf.key_parent(buf, offset)
+        if parent in recovered and parent != offset:
+            children.setdefault(parent, []).append(offset)
+        else:
+            top.append(offset)
+
+    # Walk down from the keys whose parent is gone, then from any key not reached yet, which
+    # happens when parents form a cycle, so that every key is shown exactly once
+    subkeys: "dict[int, list[int]]" = {ROOT: []}
+    for offset in top + list(recovered):
+        if offset in subkeys:
+            continue
+        subkeys[ROOT].append(recovered[offset])
+        subkeys[offset] = []
+        stack = [offset]
+        while stack:
+            parent = stack.pop()
+            for child in children.get(parent, ()):
+                if child not in subkeys:
+                    subkeys[child] = []
+                    subkeys[parent].append(recovered[child])
+                    stack.append(child)
+
+    resolver = timeline.PathResolver(hive)
+    locations = {}
+    for cell in subkeys[ROOT]:
+        offset = regf.cell_data_offset(cell)
+        locations[offset] = _location(buf, resolver, regf.key_parent(buf, offset), end)
+
+    key_values = {}
+    owned = set()
+    for offset in recovered:
+        key_values[offset] = _key_values(buf, offset, end)
+        owned.update(key_values[offset])
+    key_values[ROOT] = [cell - regf.FIRST_HBIN_OFFSET for cell in values
+                        if cell - regf.FIRST_HBIN_OFFSET not in owned]
+    return Recovery(subkeys, key_values, locations)
+
+
+def scan(hive: Registry.Registry, progress=None, cancelled=None) -> Recovery:
+    """Find the deleted keys and values left in the free cells of a hive.
+
+    progress is called with the number of bytes searched so far and in total, and the scan stops
+    early, returning None, once cancelled returns True."""
+    buf = regf.buffer(hive)
+    start = regf.FIRST_HBIN_OFFSET
+    end = hbins_end(buf)
+    keys = []
+    values = []
+    for chunk in range(start, end, CHUNK_SIZE):
+        stop = min(chunk + CHUNK_SIZE, end)
+        keys.extend(cell for cell in free_cells(buf, NK_NEEDLE, chunk, stop, end) if _deleted_key(buf, cell, end))
+        values.extend(cell for cell in free_cells(buf, VK_NEEDLE, chunk, stop, end) if _deleted_value(buf, cell, end))
+        if progress is not None:
+            progress(stop - start, end - start)
+        if cancelled is not None and cancelled():
+            return None
+    return rebuild(hive, keys, values)
@@ -0,0 +1,368 @@
+import array
+import bisect
+import datetime
+import io
+import mmap
+import os
+import struct
+import sys
+
+from Registry import Registry
+from Registry import RegistryParse
+
+
+# Offsets stored inside cells are relative to the first hbin, which follows the 4k header
+FIRST_HBIN_OFFSET = 0x1000
+FILETIME_EPOCH = datetime.datetime(1601, 1, 1)
+# Number of FILETIME intervals in a second
+FILETIME_RESOLUTION = 10000000
+# Start of an nk record up to its subkey count: signature, flags, timestamp, access bits, parent and subkey count
+NK_HEADER = struct.Struct("<2sHQIII")
+# Longest value data stored in a single cell, longer data is split into the segments of a db record
+BIG_DATA_SEGMENT_SIZE = 0x3FD8
+
+
+class _BufferSource:
+    """File-like object that hands an existing buffer to Registry.Registry without copying it"""
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def read(self):
+        return self.buf
+
+
+def open_hive(filename: str) -> Registry.Registry:
+    """Open a hive backed by a read-only memory map of its file.
+
+    Nothing is read up front, pages are only faulted in when their cells are used, and every
+    process viewing the file shares them through the page cache. Files that can't be mapped,
+    such as empty files, are read into memory instead."""
+    with open(filename, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            buf = f.read()
+    # The map keeps its own handle to the file, so it stays valid after the file is closed
+    return Registry.Registry(_BufferSource(buf))
+
+
+def close_hive(hive: Registry.Registry) -> bool:
+    """Unmap the file of a hive opened by open_hive, rather than leaving it mapped and locked until the hive is collected.
+
+    Returns False if views of the map are still in use, in which case it is unmapped once they are collected."""
+    buf = buffer(hive)
+    if isinstance(buf, mmap.mmap):
+        try:
+            buf.close()
+        except BufferError:
+            return False
+    return True
+
+
+def fingerprint(filename: str, hive: Registry.Registry, version: int) -> dict:
+    """Identify a hive file by its size, modification time and header sequence numbers, for data cached
+    from it in the given format version"""
+    stat = os.stat(filename)
+    return {
+        "version": version,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sequence1": hive._regf.hive_sequence1(),
+        "sequence2": hive._regf.hive_sequence2(),
+    }
+
+
+def buffer(hive: Registry.Registry):
+    """Returns the raw buffer a hive was parsed from"""
+    return hive._buf
+
+
+def cell_data_offset(cell_offset: int) -> int:
+    """Convert an hbin-relative cell offset into the absolute offset of the cell's data"""
+    return FIRST_HBIN_OFFSET + cell_offset + 4
+
+
+def root_offset(hive: Registry.Registry) -> int:
+    """Returns the absolute offset of the root key's nk record"""
+    return hive.root()._nkrecord.offset()
+
+
+def open_key(hive: Registry.Registry, offset: int) -> Registry.RegistryKey:
+    """Open the key whose nk record starts at offset without walking its path from the root"""
+    first_hbin = next(hive._regf.hbins())
+    return Registry.RegistryKey(RegistryParse.NKRecord(buffer(hive), offset, first_hbin))
+
+
+def check_key(buf, offset: int):
+    """Raise a ParseException if there is no nk record at offset"""
+    if buf[offset:offset + 2] != b"nk":
+        raise RegistryParse.ParseException("Invalid NK Record ID")
+
+
+def key_name(buf, offset: int) -> str:
+    """Decode the name of the nk record at offset"""
+    flags, = struct.unpack_from("<H", buf, offset + 0x2)
+    return _key_name(buf, offset, flags)
+
+
+def _key_name(buf, offset: int, flags: int) -> str:
+    length, = struct.unpack_from("<H", buf, offset + 0x48)
+    name = bytes(buf[offset + 0x4C:offset + 0x4C + length])
+    if flags & 0x0020:
+        return name.decode("windows-1252", "replace")
+    return name.decode("utf-16le", "replace")
+
+
+class KeyRecord:
+    """Name, subkey count and raw last write FILETIME of a key, decoded from its nk record"""
+
+    __slots__ = ("offset", "name", "subkey_count", "timestamp")
+
+    def __init__(self, offset: int, name: str, subkey_count: int, timestamp: int):
+        self.offset = offset
+        self.name = name
+        self.subkey_count = subkey_count
+        self.timestamp = timestamp
+
+
+def key_record(buf, offset: int) -> KeyRecord:
+    """Decode the nk record at offset with a single read of its fixed fields.
+
+    Raises a ParseException if there is no nk record at offset."""
+    signature, flags, timestamp, _, _, count = NK_HEADER.unpack_from(buf, offset)
+    if signature != b"nk":
+        raise RegistryParse.ParseException("Invalid NK Record ID")
+    if count == 0xFFFFFFFF:
+        count = 0
+    return KeyRecord(offset, _key_name(buf, offset, flags), count, timestamp)
+
+
+def subkey_records(buf, offset: int, start: int = 0, end: int = None) -> "list[KeyRecord]":
+    """Decode the subkeys of the nk record at offset from row start up to end in one pass over its subkey list.
+
+    Subkeys that aren't valid nk records are None, so the rows stay in list order."""
+    records = []
+    for subkey in subkey_offsets(buf, offset)[start:end]:
+        subkey = cell_data_offset(subkey)
+        try:
+            records.append(key_record(buf, subkey))
+        except (RegistryParse.ParseException, struct.error):
+            records.append(None)
+    return records
+
+
+def key_parent(buf, offset: int) -> int:
+    """Returns the absolute offset of the parent nk record of the nk record at offset"""
+    return cell_data_offset(struct.unpack_from("<I", buf, offset + 0x10)[0])
+
+
+def key_subkey_count(buf, offset: int) -> int:
+    """Returns the number of subkeys recorded in the nk record at offset"""
+    count, = struct.unpack_from("<I", buf, offset + 0x14)
+    if count == 0xFFFFFFFF:
+        return 0
+    return count
+
+
+def key_timestamp(buf, offset: int) -> int:
+    """Returns the raw last-write FILETIME of the nk record at offset"""
+    return struct.unpack_from("<Q", buf, offset + 0x4)[0]
+
+
+def filetime_to_datetime(filetime: int) -> datetime.datetime:
+    """Convert a FILETIME to a datetime, rounding the same way as python-registry"""
+    microseconds, remainder = divmod(filetime, 10)
+    if remainder > 5 or (remainder == 5 and microseconds % 2 == 1):
+        microseconds += 1
+    return FILETIME_EPOCH + datetime.timedelta(microseconds=microseconds)
+
+
+def datetime_to_filetime(value: datetime.datetime) -> int:
+    """Convert a naive UTC datetime to a FILETIME"""
+    delta = value - FILETIME_EPOCH
+    return (delta.days * 86400 + delta.seconds) * FILETIME_RESOLUTION + delta.microseconds * 10
+
+
+def is_root_key(buf, offset: int) -> bool:
+    """Returns whether the nk record at offset is the root key of its hive"""
+    flags, = struct.unpack_from("<H", buf, offset + 0x2)
+    return flags & 0x0004 != 0
+
+
+def subkey_offsets(buf, offset: int) -> "list[int]":
+    """Returns the hbin-relative cell offsets of the subkeys of the nk record at offset.
+
+    Direct lists are returned as views over the buffer, so nothing is decoded until indexed."""
+    if key_subkey_count(buf, offset) == 0:
+        return ()
+    list_offset, = struct.unpack_from("<I", buf, offset + 0x1C)
+    return _list_offsets(buf, cell_data_offset(list_offset))
+
+
+def _list_offsets(buf, offset: int):
+    list_type = bytes(buf[offset:offset + 2])
+    count, = struct.unpack_from("<H", buf, offset + 0x2)
+
+    if list_type == b"lf" or list_type == b"lh":
+        # Each entry is an offset followed by a name hint or hash
+        return _dwords(buf, offset + 0x4, count, 2)
+    if list_type == b"li":
+        return _dwords(buf, offset + 0x4, count)
+    if list_type == b"ri":
+        offsets = array.array("I")
+        for sublist in _dwords(buf, offset + 0x4, count):
+            # Copied as bytes, extending from a strided view would convert every entry on its own
+            offsets.frombytes(_list_offsets(buf, cell_data_offset(sublist)).tobytes())
+        return offsets
+
+    raise RegistryParse.ParseException(
+        "Subkey list with type %r encountered, but not yet supported." % list_type)
+
+
+def _dwords(buf, offset: int, count: int, stride: int = 1):
+    end = offset + 4 * count * stride
+    if end > len(buf):
+        raise RegistryParse.ParseException("Offset list runs past the end of the hive")
+    if sys.byteorder != "little":
+        dwords = array.array("I", bytes(buf[offset:end]))
+        dwords.byteswap()
+        return dwords[::stride]
+    return memoryview(buf)[offset:end].cast("I")[::stride]
+
+
+def key_value_count(buf, offset: int) -> int:
+    """Returns the number of values recorded in the nk record at offset"""
+    count, = struct.unpack_from("<I", buf, offset + 0x24)
+    if count == 0xFFFFFFFF:
+        return 0
+    return count
+
+
+def value_offsets(buf, offset: int) -> "list[int]":
+    """Returns the hbin-relative cell offsets of the values of the nk record at offset"""
+    count = key_value_count(buf, offset)
+    if count == 0:
+        return ()
+    list_offset, = struct.unpack_from("<I", buf, offset + 0x28)
+    return _dwords(buf, cell_data_offset(list_offset), count)
+
+
+def open_value(hive: Registry.Registry, offset: int) -> Registry.RegistryValue:
+    """Open the python-registry value whose vk record starts at offset"""
+    first_hbin = next(hive._regf.hbins())
+    return Registry.RegistryValue(RegistryParse.VKRecord(buffer(hive), offset, first_hbin))
+
+
+def value_offset(value: Registry.RegistryValue) -> int:
+    """Returns the absolute offset of the vk record of a python-registry value"""
+    return value._vkrecord.offset()
+
+
+def value_name(buf, offset: int) -> str:
+    """Decode the name of the vk record at offset, which is empty for the default value"""
+    length, = struct.unpack_from("<H", buf, offset + 0x2)
+    flags, = struct.unpack_from("<H", buf, offset + 0x10)
+    name = bytes(buf[offset + 0x14:offset + 0x14 + length])
+    if flags & 0x0001:
+        return name.decode("windows-1252", "replace")
+    return name.decode("utf-16le", "replace")
+
+
+def value_type(buf, offset: int) -> int:
+    """Returns the data type of the vk record at offset, without the device property flags like python-registry"""
+    return struct.unpack_from("<I", buf, offset + 0xC)[0] & 0x0FFF
+
+
+class DataReader:
+    """Seekable, read-only view of the data of a vk record that only reads the big data segments it is asked for.
+
+    Slicing it returns bytes, like slicing the data itself would."""
+
+    def __init__(self, buf, segments: "list[tuple[int, int]]"):
+        self.buf = buf
+        # Absolute offsets and sizes of the pieces of the data, in order
+        self.segments = segments
+        self.starts = []
+        self.size = 0
+        for _, size in segments:
+            self.starts.append(self.size)
+            self.size += size
+        self.position = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step != 1:
+                return self.read_at(start, max(0, stop - start))[::step]
+            return self.read_at(start, max(0, stop - start))
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("data index out of range")
+        return self.read_at(index, 1)[0]
+
+    def read_at(self, start: int, length: int) -> bytes:
+        """Returns up to length bytes of the data from start, reading only the segments they are in"""
+        end = min(start + length, self.size)
+        if start >= end:
+            return b""
+        pieces = []
+        segment = bisect.bisect_right(self.starts, start) - 1
+        while start < end:
+            offset, size = self.segments[segment]
+            at = start - self.starts[segment]
+            count = min(size - at, end - start)
+            pieces.append(self.buf[offset + at:offset + at + count])
+            start += count
+            segment += 1
+        if len(pieces) == 1:
+            return bytes(pieces[0])
+        return b"".join(pieces)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self.position
+        data = self.read_at(self.position, size)
+        self.position += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+
+def value_reader(buf, offset: int) -> DataReader:
+    """Returns a reader of the data of the vk record at offset, without reading any of the data yet"""
+    length, = struct.unpack_from("<I", buf, offset + 0x4)
+    if length >= 0x80000000 or length < 5:
+        # Small data is stored in place of the data offset
+        return DataReader(buf, [(offset + 0x8, min(length & 0x7FFFFFFF, 4))])
+
+    data_offset = cell_data_offset(struct.unpack_from("<I", buf, offset + 0x8)[0])
+    if length > BIG_DATA_SEGMENT_SIZE and buf[data_offset:data_offset + 2] == b"db":
+        count, segment_list = struct.unpack_from("<HI", buf, data_offset + 0x2)
+        segments = []
+        remaining = length
+        for segment in _dwords(buf, cell_data_offset(segment_list), count):
+            size = min(remaining, BIG_DATA_SEGMENT_SIZE)
+            start = cell_data_offset(segment)
+            segments.append((start, max(0, min(size, len(buf) - start))))
+            remaining -= size
+        return DataReader(buf, segments)
+    return DataReader(buf, [(data_offset, max(0, min(length, len(buf) - data_offset)))])
+
+
+def value_data(buf, offset: int) -> bytes:
+    """Returns the raw data of the vk record at offset, following big data segments like python-registry"""
+    return value_reader(buf, offset).read()
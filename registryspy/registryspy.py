@@ -1,5 +1,11 @@
 import sys
+import threading
+import time
 
+# Taken before Qt and the rest of the app are imported, for --startup-profile
+IMPORT_STARTED = time.perf_counter()
+
+from Registry import Registry
 import PySide6.QtGui as QtGui
 import PySide6.QtWidgets as QtWidgets
 import PySide6.QtCore as QtCore
@@ -8,9 +14,12 @@ from . import data_viewer
 from . import value_table
 from . import key_tree
 from . import hive_info_table
-from . import license_dialog
-from . import find_dialog
+from . import results_panel
 from . import helpers
+from . import profiling
+from . import session
+
+# The find and license dialogs, the diff and timeline panels and the exporter are imported when first used
 
 
 # Set the app ID on windows (helps with making sure icon is used)
@@ -22,6 +31,57 @@ except (AttributeError, OSError):
     pass
 
 
+class ExportWorkerSignals(QtCore.QObject):
+    progress = QtCore.Signal(int, int)
+    finished = QtCore.Signal(bool)
+    error = QtCore.Signal(str)
+
+
+class ExportWorker(QtCore.QRunnable):
+    """Exports a key and everything below it to a file on a worker thread"""
+
+    def __init__(self, filename: str, hive: Registry.Registry, key: Registry.RegistryKey, export_format: str):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.filename = filename
+        self.hive = hive
+        self.key = key
+        self.export_format = export_format
+        self.signals = ExportWorkerSignals()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        from . import export
+
+        try:
+            try:
+                completed = export.export_file(self.filename, self.hive, self.key, self.export_format,
+                                               progress=self.signals.progress.emit,
+                                               cancelled=self.is_cancelled)
+            except OSError as e:
+                self.signals.error.emit(str(e))
+                return
+            self.signals.finished.emit(completed)
+        finally:
+            self._finished.set()
+
+
+class LatencySignals(QtCore.QObject):
+    # Span name, seconds, keys and values
+    measured = QtCore.Signal(str, float, int, int)
+
+
 class RegViewer(QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__()
@@ -46,7 +106,10 @@ class RegViewer(QtWidgets.QMainWindow):
             "view/geometry", QtCore.QByteArray()))
 
         self.tree = key_tree.KeyTree(self)
-        self.find_dialog = find_dialog.FindDialog(self)
+        self._find_dialog = None
+        self._diff_panel = None
+        self._timeline_panel = None
+        self.export_worker: ExportWorker = None
 
         # Set up file menu
         file_menu = QtWidgets.QMenu("&File", self)
@@ -65,6 +128,30 @@ class RegViewer(QtWidgets.QMainWindow):
         close_all_action.triggered.connect(self.tree.remove_all_hives)
         file_menu.addAction(close_all_action)
         file_menu.addSeparator()
+        open_session_action = QtGui.QAction("Open Session...", self)
+        open_session_action.triggered.connect(self.show_open_session)
+        file_menu.addAction(open_session_action)
+        save_session_action = QtGui.QAction("Save Session...", self)
+        save_session_action.triggered.connect(self.show_save_session)
+        file_menu.addAction(save_session_action)
+        self.restore_session_action = QtGui.QAction("Restore Last Session on Startup", self)
+        self.restore_session_action.setCheckable(True)
+        self.restore_session_action.setChecked(self.settings.value(
+            "session/restore", False, bool))
+        self.restore_session_action.toggled.connect(
+            lambda checked: self.settings.setValue("session/restore", checked))
+        file_menu.addAction(self.restore_session_action)
+        file_menu.addSeparator()
+        export_action = QtGui.QAction("Export Selected Key...", self)
+        export_action.triggered.connect(self.show_export)
+        file_menu.addAction(export_action)
+        compare_action = QtGui.QAction("Compare Hives...", self)
+        compare_action.triggered.connect(self.show_diff)
+        file_menu.addAction(compare_action)
+        timeline_action = QtGui.QAction("Timeline...", self)
+        timeline_action.triggered.connect(self.show_timeline)
+        file_menu.addAction(timeline_action)
+        file_menu.addSeparator()
         quit_action = QtGui.QAction("Quit", self)
         quit_action.triggered.connect(self.close)
         file_menu.addAction(quit_action)
@@ -78,8 +165,11 @@ class RegViewer(QtWidgets.QMainWindow):
         find_menu.addAction(find_action)
         find_next_action = QtGui.QAction("Find Next", self)
         find_next_action.setShortcut(QtGui.QKeySequence.FindNext)
-        find_next_action.triggered.connect(self.find_dialog.handle_find)
+        find_next_action.triggered.connect(self.find_next)
         find_menu.addAction(find_next_action)
+        find_all_action = QtGui.QAction("Find All", self)
+        find_all_action.triggered.connect(self.find_all)
+        find_menu.addAction(find_all_action)
         # find_previous_action = QtGui.QAction("Find Previous", self)
         # find_previous_action.setShortcut(QtGui.QKeySequence.FindPrevious)
         # find_menu.addAction(find_previous_action)
@@ -92,7 +182,16 @@ class RegViewer(QtWidgets.QMainWindow):
         self.native_style_action.setChecked(use_native_style)
         self.native_style_action.toggled.connect(self.toggle_style)
         view_menu.addAction(self.native_style_action)
+        self.latency_action = QtGui.QAction("Show Latency", self)
+        self.latency_action.setCheckable(True)
+        self.latency_action.toggled.connect(self.toggle_latency)
+        view_menu.addAction(self.latency_action)
+        self.show_deleted_action = QtGui.QAction("Show Deleted Keys", self)
+        self.show_deleted_action.setCheckable(True)
+        self.show_deleted_action.toggled.connect(self.toggle_deleted)
+        view_menu.addAction(self.show_deleted_action)
         self.menuBar().addMenu(view_menu)
+        self.view_menu = view_menu
 
         # Set up help menu
         help_menu = QtWidgets.QMenu("&Help", self)
@@ -114,26 +213,24 @@ class RegViewer(QtWidgets.QMainWindow):
         toolbar.setFloatable(False)
         toolbar.toggleViewAction().setEnabled(False)
         toolbar.setContextMenuPolicy(QtCore.Qt.PreventContextMenu)
-        open_action = QtGui.QAction(
-            QtGui.QIcon(helpers.resource_path("img/open.png")), "Open Hive", toolbar)
+        open_action = QtGui.QAction("Open Hive", toolbar)
         open_action.triggered.connect(self.show_open_file)
         toolbar.addAction(open_action)
-        close_action = QtGui.QAction(
-            QtGui.QIcon(helpers.resource_path("img/close.png")), "Close Selected Hive", toolbar)
+        close_action = QtGui.QAction("Close Selected Hive", toolbar)
         close_action.triggered.connect(self.tree.remove_selected_hive)
         toolbar.addAction(close_action)
-        close_all_action = QtGui.QAction(
-            QtGui.QIcon(helpers.resource_path("img/close_all.png")), "Close All Hives", toolbar)
+        close_all_action = QtGui.QAction("Close All Hives", toolbar)
         close_all_action.triggered.connect(self.tree.remove_all_hives)
         toolbar.addAction(close_all_action)
-        find_action = QtGui.QAction(
-            QtGui.QIcon(helpers.resource_path("img/find.png")), "Find", toolbar)
+        find_action = QtGui.QAction("Find", toolbar)
         find_action.triggered.connect(self.show_find)
         toolbar.addAction(find_action)
-        find_next_action = QtGui.QAction(
-            QtGui.QIcon(helpers.resource_path("img/find_next.png")), "Find Next", toolbar)
-        find_next_action.triggered.connect(self.find_dialog.handle_find)
+        find_next_action = QtGui.QAction("Find Next", toolbar)
+        find_next_action.triggered.connect(self.find_next)
         toolbar.addAction(find_next_action)
+        # Icons of the toolbar actions by image name, decoded when the window is first shown
+        self.toolbar_icons = [(open_action, "open"), (close_action, "close"), (close_all_action, "close_all"),
+                              (find_action, "find"), (find_next_action, "find_next")]
         self.addToolBar(toolbar)
 
         # Set up main layout
@@ -185,38 +282,270 @@ class RegViewer(QtWidgets.QMainWindow):
         main_layout.addWidget(main_splitter)
         self.setCentralWidget(main_widget)
 
+        self.open_progress = QtWidgets.QProgressBar(self.statusBar())
+        self.open_progress.setMaximumWidth(200)
+        self.open_progress.hide()
+        self.statusBar().addPermanentWidget(self.open_progress)
+        self.tree.hive_loaded.connect(self.handle_hive_loaded)
+        self.tree.load_progress.connect(self.show_load_progress)
+
         self.progress_bar = QtWidgets.QProgressBar(self.statusBar())
         self.progress_bar.setMaximumWidth(100)
         self.progress_bar.hide()
         self.statusBar().addPermanentWidget(self.progress_bar)
 
+        self.cancel_button = QtWidgets.QPushButton("Cancel", self.statusBar())
+        self.cancel_button.clicked.connect(self.cancel_find)
+        self.cancel_button.hide()
+        self.statusBar().addPermanentWidget(self.cancel_button)
+
+        # Spans can finish on worker threads, so they reach the label through a signal
+        self.latency_signals = LatencySignals()
+        self.latency_signals.measured.connect(self.show_latency)
+        self.latency_label = QtWidgets.QLabel(self.statusBar())
+        self.latency_label.hide()
+        self.statusBar().addPermanentWidget(self.latency_label)
+        self.latency_action.setChecked(self.settings.value(
+            "view/show_latency", False, bool))
+        self.show_deleted_action.setChecked(self.settings.value(
+            "view/show_deleted", False, bool))
+
+        self.results_panel = results_panel.ResultsPanel(self)
+        self.results_panel.activated.connect(self.select_result)
+        self.results_panel.hide()
+        self.addDockWidget(QtCore.Qt.DockWidgetArea.BottomDockWidgetArea,
+                           self.results_panel)
+        view_menu.addAction(self.results_panel.toggleViewAction())
+
     def show_about(self):
         QtWidgets.QMessageBox().about(
             self, f"About {helpers.APP_NAME}", helpers.ABOUT_TEXT)
 
     def show_licenses(self):
+        from . import license_dialog
+
         license = license_dialog.LicenseDialog(self)
         license.exec()
 
+    @property
+    def find_dialog(self):
+        """The find dialog, which is only created the first time it is needed"""
+        if self._find_dialog is None:
+            from . import find_dialog
+
+            self._find_dialog = find_dialog.FindDialog(self)
+        return self._find_dialog
+
+    def find_dialog_created(self) -> bool:
+        return self._find_dialog is not None
+
     def show_find(self):
         self.find_dialog.exec()
 
+    def find_next(self):
+        self.find_dialog.handle_find()
+
+    def find_all(self):
+        self.find_dialog.handle_find_all()
+
+    def cancel_find(self):
+        if self.find_dialog_created():
+            self.find_dialog.cancel_find()
+
+    def select_result(self, filename: str, result: tuple):
+        self.find_dialog.select_result(filename, result)
+
+    @property
+    def diff_panel(self):
+        """The hive differences panel, which is only created the first time it is needed"""
+        if self._diff_panel is None:
+            from . import diff_panel
+
+            self._diff_panel = diff_panel.DiffPanel(self)
+            self._diff_panel.activated.connect(self.select_change)
+            self._diff_panel.changes_shown.connect(self.show_changes)
+            self.addDockWidget(QtCore.Qt.DockWidgetArea.BottomDockWidgetArea,
+                               self._diff_panel)
+            self.view_menu.addAction(self._diff_panel.toggleViewAction())
+        return self._diff_panel
+
+    def diff_panel_created(self) -> bool:
+        return self._diff_panel is not None
+
+    def show_diff(self):
+        self.diff_panel.set_hives(self.tree.reg)
+        self.diff_panel.show()
+        self.diff_panel.raise_()
+
+    def select_change(self, filename: str, offset: int, value: str):
+        """Select the key, and the value if there is one, of a difference between two hives"""
+        if filename not in self.tree.reg:
+            return
+        item = self.tree.select_key_at(filename, offset)
+        if item is not None and value is not None:
+            self.value_table.select_value(value)
+
+    def show_changes(self, keys: dict, values: dict):
+        """Highlight the keys and values that differ between the compared hives"""
+        self.tree.set_highlights(keys)
+        self.value_table.set_highlights(values)
+
+    @property
+    def timeline_panel(self):
+        """The timeline panel, which is only created the first time it is needed"""
+        if self._timeline_panel is None:
+            from . import timeline_panel
+
+            self._timeline_panel = timeline_panel.TimelinePanel(self)
+            self._timeline_panel.activated.connect(self.tree.select_key_at)
+            self.addDockWidget(QtCore.Qt.DockWidgetArea.BottomDockWidgetArea,
+                               self._timeline_panel)
+            self.view_menu.addAction(self._timeline_panel.toggleViewAction())
+        return self._timeline_panel
+
+    def timeline_panel_created(self) -> bool:
+        return self._timeline_panel is not None
+
+    def show_timeline(self):
+        self.timeline_panel.set_hives(self.tree.reg)
+        self.timeline_panel.show()
+        self.timeline_panel.raise_()
+
     def show_open_file(self):
         """Show the open file dialog"""
         file_selection = QtWidgets.QFileDialog.getOpenFileNames(
             self, "Open Registry File")
 
-        self.statusBar().showMessage("Loading...")
-        self.statusBar().repaint()
-
         if isinstance(file_selection, tuple) and len(file_selection) > 0 and len(file_selection[0]) > 0:
-            for file in file_selection[0]:
-                self.open_file(file)
+            self.open_files(file_selection[0])
 
-        self.statusBar().clearMessage()
+    def open_files(self, filenames: "list[str]"):
+        """Open hives in the background, each one is added to the tree as soon as it is ready"""
+        self.tree.open_hives(filenames)
 
     def open_file(self, filename: str):
-        self.tree.load_hive(filename)
+        self.open_files([filename])
+
+    def session_state(self) -> dict:
+        """Returns the open hives, their expanded keys and cached skeletons, and the selection"""
+        selected = None
+        key = self.tree.get_selected_key()
+        if key is not None and key.recovery is None:
+            row = self.value_table.get_selected_row()
+            value = self.value_table.value_model.row_data(row).name if row >= 0 else None
+            selected = {"filename": key.filename, "offset": key.offset, "value": value}
+        return {"hives": self.tree.session_hives(), "selected": selected}
+
+    def last_session_path(self) -> str:
+        return session.default_path(QtCore.QStandardPaths.writableLocation(
+            QtCore.QStandardPaths.StandardLocation.AppDataLocation))
+
+    def restore_last_session(self):
+        state = session.load(self.last_session_path())
+        if state is not None:
+            self.tree.restore_session(state)
+
+    def open_session(self, path: str):
+        """Close the open hives and restore the hives, expanded keys and selection of a session file"""
+        state = session.load(path)
+        if state is None:
+            helpers.show_message_box(
+                "Unable to read session file", alert_type=helpers.MessageBoxTypes.CRITICAL)
+            return
+        self.tree.remove_all_hives()
+        self.tree.restore_session(state)
+
+    def show_open_session(self):
+        filename, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Open Session", "", session.SESSION_FILTER)
+        if filename != "":
+            self.open_session(filename)
+
+    def show_save_session(self):
+        filename, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Save Session", "", session.SESSION_FILTER)
+        if filename == "":
+            return
+        try:
+            session.save(filename, self.session_state())
+        except OSError as e:
+            helpers.show_message_box(
+                f"Could not save session: {e.strerror}", alert_type=helpers.MessageBoxTypes.CRITICAL)
+
+    def show_load_progress(self, finished: int, total: int):
+        """Show how many of the hives being opened are ready, and which ones are still being opened"""
+        if finished >= total:
+            self.open_progress.hide()
+            return
+        self.open_progress.setRange(0, total)
+        self.open_progress.setValue(finished)
+        self.open_progress.setFormat(f"Opening hives: {finished} of {total}")
+        self.open_progress.setToolTip("\n".join(self.tree.loaders))
+        self.open_progress.show()
+
+    def handle_hive_loaded(self, filename: str):
+        # Only the search index needs the find dialog as soon as a hive is open
+        if self.find_dialog_created() or self.settings.value("find/use_index", False, bool):
+            self.find_dialog.add_hive(filename)
+        if self.diff_panel_created():
+            self.diff_panel.set_hives(self.tree.reg)
+        if self.timeline_panel_created():
+            self.timeline_panel.set_hives(self.tree.reg)
+
+    def show_export(self):
+        """Ask for a file and export the selected key and everything below it to it"""
+        key = self.tree.get_selected_key()
+        if key is None:
+            helpers.show_message_box(
+                "No key selected, select a key first.", alert_type=helpers.MessageBoxTypes.CRITICAL)
+            return
+        if key.recovery is not None:
+            helpers.show_message_box(
+                "Deleted keys can't be exported, select a key that is still in the hive.", alert_type=helpers.MessageBoxTypes.CRITICAL)
+            return
+        if self.export_worker is not None:
+            helpers.show_message_box(
+                "An export is already running, wait for it to finish first.", alert_type=helpers.MessageBoxTypes.CRITICAL)
+            return
+
+        filename, selected_filter = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export Selected Key", "", "JSON Lines Files (*.jsonl);;CSV Files (*.csv)")
+        if filename == "":
+            return
+
+        from . import export
+
+        self.export_worker = ExportWorker(filename, key.hive, key.open(),
+                                          export.format_for(filename, selected_filter))
+        self.export_worker.signals.progress.connect(self.handle_export_progress)
+        self.export_worker.signals.finished.connect(self.handle_export_finished)
+        self.export_worker.signals.error.connect(self.handle_export_error)
+
+        self.export_progress = QtWidgets.QProgressDialog(
+            "Exporting...", "Cancel", 0, 0, self)
+        self.export_progress.setWindowTitle("Export Selected Key")
+        self.export_progress.setMinimumDuration(500)
+        self.export_progress.canceled.connect(self.export_worker.cancel)
+        QtCore.QThreadPool.globalInstance().start(self.export_worker)
+
+    def end_export(self):
+        self.export_worker = None
+        self.export_progress.reset()
+
+    def handle_export_progress(self, keys: int, values: int):
+        if self.export_worker is not None:
+            self.export_progress.setLabelText(
+                f"Exported {keys:,} keys and {values:,} values...")
+
+    def handle_export_finished(self, completed: bool):
+        self.end_export()
+        self.statusBar().showMessage(
+            "Export finished" if completed else "Export cancelled", 5000)
+
+    def handle_export_error(self, message: str):
+        self.end_export()
+        helpers.show_message_box(
+            f"Could not export key: {message}", alert_type=helpers.MessageBoxTypes.CRITICAL)
 
     def toggle_style(self):
         if self.native_style_action.isChecked():
@@ -226,13 +555,102 @@ class RegViewer(QtWidgets.QMainWindow):
             self.app.setStyle("fusion")
             self.settings.setValue("view/native_style", False)
 
+    def toggle_latency(self, checked: bool):
+        self.settings.setValue("view/show_latency", checked)
+        if checked:
+            profiling.add_listener(self.report_latency)
+        else:
+            profiling.remove_listener(self.report_latency)
+            self.latency_label.hide()
+
+    def toggle_deleted(self, checked: bool):
+        self.settings.setValue("view/show_deleted", checked)
+        self.tree.set_show_deleted(checked)
+
+    def report_latency(self, span: profiling.Span):
+        self.latency_signals.measured.emit(span.name, span.duration, span.keys, span.values)
+
+    def show_latency(self, name: str, seconds: float, keys: int, values: int):
+        """Show how long the last operation took and how much it read"""
+        if not self.latency_action.isChecked():
+            return
+        self.latency_label.setText(
+            f"{name}: {seconds * 1000:.1f} ms, {keys:,} keys, {values:,} values")
+        self.latency_label.show()
+
+    def showEvent(self, event: QtGui.QShowEvent):
+        if self.toolbar_icons:
+            for action, name in self.toolbar_icons:
+                action.setIcon(QtGui.QIcon(helpers.resource_path(f"img/{name}.png")))
+            self.toolbar_icons = []
+        super().showEvent(event)
+
     def closeEvent(self, event):
         """Save the current geometry of the application"""
         self.settings.setValue("view/geometry", self.saveGeometry())
+        if self.restore_session_action.isChecked():
+            try:
+                session.save(self.last_session_path(), self.session_state())
+            except OSError:
+                pass
+        if self.latency_action.isChecked():
+            profiling.remove_listener(self.report_latency)
+        if self.find_dialog_created():
+            self.find_dialog.cancel_find()
+            self.find_dialog.shutdown_pool()
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+        self.tree.cancel_loading()
+        self.tree.cancel_recovery()
+        if self.diff_panel_created():
+            self.diff_panel.cancel()
+        if self.timeline_panel_created():
+            self.timeline_panel.cancel()
         event.accept()
 
 
+class StartupProfile(QtCore.QObject):
+    """Times each stage of startup up to the first paint and prints them, for --startup-profile"""
+
+    def __init__(self):
+        super().__init__()
+        self.last = IMPORT_STARTED
+        self.stages: "list[tuple[str, float]]" = []
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def eventFilter(self, watched: QtCore.QObject, event: QtCore.QEvent) -> bool:
+        if event.type() == QtCore.QEvent.Type.Paint:
+            QtWidgets.QApplication.instance().removeEventFilter(self)
+            self.mark("First paint")
+            self.report()
+        return False
+
+    def report(self):
+        for stage, seconds in self.stages:
+            print(f"{stage + ':':<16}{seconds * 1000:8.1f} ms", file=sys.stderr)
+        total = sum(seconds for stage, seconds in self.stages)
+        print(f"{'Total:':<16}{total * 1000:8.1f} ms", file=sys.stderr)
+
+
 def main():
+    if getattr(sys, "frozen", False):
+        # Needed by the search process pool in frozen builds
+        import multiprocessing
+        multiprocessing.freeze_support()
+
+    # Profile the whole session if REGISTRYSPY_PROFILE is set
+    profiling.start_from_environment()
+
+    profile = None
+    if "--startup-profile" in sys.argv:
+        sys.argv.remove("--startup-profile")
+        profile = StartupProfile()
+        profile.mark("Imports")
+
     app = QtWidgets.QApplication(sys.argv)
 
     app.setOrganizationName(helpers.ORGANIZATION_NAME)
@@ -276,11 +694,18 @@ def main():
     #                  QtGui.QPalette.Highlight, QtGui.QColor(68, 68, 68))
     # app.setPalette(palette)
 
+    if profile is not None:
+        profile.mark("QApplication")
     reg_viewer = RegViewer()
 
     app.setWindowIcon(QtGui.QIcon(helpers.resource_path("img/icon.ico")))
 
+    if profile is not None:
+        profile.mark("Main window")
+        app.installEventFilter(profile)
     reg_viewer.show()
+    if profile is not None:
+        profile.mark("Show")
 
     # Close the splash screen
     try:
@@ -291,10 +716,13 @@ def main():
 
     # Process command-line file(s)
     if len(sys.argv) > 1:
-        for filename in sys.argv[1:]:
-            reg_viewer.open_file(filename)
+        reg_viewer.open_files(sys.argv[1:])
+    elif reg_viewer.restore_session_action.isChecked():
+        reg_viewer.restore_last_session()
 
-    sys.exit(app.exec())
+    exit_code = app.exec()
+    profiling.stop()
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
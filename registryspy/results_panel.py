@@ -0,0 +1,170 @@
+import csv
+import json
+
+import PySide6.QtCore as QtCore
+import PySide6.QtWidgets as QtWidgets
+
+from . import helpers
+
+
+class ResultsModel(QtCore.QAbstractTableModel):
+    """Table model of the matches found by Find All"""
+
+    HEADERS = ["Hive", "Type", "Key", "Value"]
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        # (hive filename, ResultType, key path, value name)
+        self.results: "list[tuple]" = []
+
+    def clear(self):
+        self.beginResetModel()
+        self.results = []
+        self.endResetModel()
+
+    def add_results(self, filename: str, results: list):
+        """Append a batch of (ResultType, key, value) matches from a hive"""
+        if len(results) == 0:
+            return
+        first = len(self.results)
+        self.beginInsertRows(QtCore.QModelIndex(), first,
+                             first + len(results) - 1)
+        self.results.extend((filename, result_type, key, value)
+                            for result_type, key, value in results)
+        self.endInsertRows()
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.results)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return len(self.HEADERS)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        filename, result_type, key, value = self.results[index.row()]
+        column = index.column()
+        if column == 0:
+            return filename
+        if column == 1:
+            return result_type.name.capitalize()
+        if column == 2:
+            return key
+        return value or ""
+
+    def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def rows(self):
+        """Yield the results as plain (hive, type, key, value) rows"""
+        for filename, result_type, key, value in self.results:
+            yield filename, result_type.name, key, value or ""
+
+
+class ResultsPanel(QtWidgets.QDockWidget):
+    """Dockable list of the matches found by Find All"""
+
+    # (hive filename, (ResultType, key, value))
+    activated = QtCore.Signal(str, object)
+
+    def __init__(self, *args):
+        super().__init__("Find Results", *args)
+        self.setObjectName("find_results")
+
+        container = QtWidgets.QWidget(self)
+        layout = QtWidgets.QVBoxLayout(container)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.results_model = ResultsModel(self)
+        self.table = QtWidgets.QTableView(container)
+        self.table.setModel(self.results_model)
+        self.table.setSelectionBehavior(
+            QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(
+            QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(
+            QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setWordWrap(False)
+        self.table.verticalHeader().setVisible(False)
+        self.table.verticalHeader().setSectionResizeMode(
+            QtWidgets.QHeaderView.ResizeMode.Fixed)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.clicked.connect(self.handle_click)
+        self.table.activated.connect(self.handle_click)
+        layout.addWidget(self.table)
+
+        buttons = QtWidgets.QHBoxLayout()
+        self.status = QtWidgets.QLabel(container)
+        buttons.addWidget(self.status)
+        buttons.addStretch()
+        self.export_button = QtWidgets.QPushButton("Export...", container)
+        self.export_button.clicked.connect(self.show_export)
+        buttons.addWidget(self.export_button)
+        clear_button = QtWidgets.QPushButton("Clear", container)
+        clear_button.clicked.connect(self.clear)
+        buttons.addWidget(clear_button)
+        layout.addLayout(buttons)
+
+        self.setWidget(container)
+        self.clear()
+
+    def clear(self):
+        self.term = ""
+        self.results_model.clear()
+        self.update_status()
+
+    def start(self, term: str):
+        """Clear the results for a new search for term and show the panel"""
+        self.clear()
+        self.term = term
+        self.update_status()
+        self.show()
+        self.raise_()
+
+    def add_results(self, filename: str, results: list):
+        self.results_model.add_results(filename, results)
+        self.update_status()
+
+    def update_status(self):
+        count = self.results_model.rowCount()
+        if self.term:
+            self.status.setText(f"{count:,} matches for \"{self.term}\"")
+        else:
+            self.status.setText("")
+        self.export_button.setEnabled(count > 0)
+
+    def handle_click(self, index: QtCore.QModelIndex):
+        filename, result_type, key, value = self.results_model.results[index.row()]
+        self.activated.emit(filename, (result_type, key, value))
+
+    def show_export(self):
+        """Ask for a file and export the results to it as CSV or JSON"""
+        filename, selected_filter = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export Results", "", "CSV Files (*.csv);;JSON Files (*.json)")
+        if filename == "":
+            return
+
+        try:
+            if filename.lower().endswith(".json") or (not filename.lower().endswith(".csv") and "json" in selected_filter.lower()):
+                self.export_json(filename)
+            else:
+                self.export_csv(filename)
+        except OSError as e:
+            helpers.show_message_box(
+                f"Could not export results: {e}", alert_type=helpers.MessageBoxTypes.CRITICAL)
+
+    def export_csv(self, filename: str):
+        with open(filename, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow([header.lower() for header in ResultsModel.HEADERS])
+            writer.writerows(self.results_model.rows())
+
+    def export_json(self, filename: str):
+        keys = [header.lower() for header in ResultsModel.HEADERS]
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump([dict(zip(keys, row)) for row in self.results_model.rows()],
+                      f, indent=2)
@@ -0,0 +1,248 @@
+import collections
+import enum
+import os
+import struct
+
+from Registry import Registry
+
+from . import matching
+from . import regf
+from . import search_index
+from . import value_cache
+
+
+class ResultType(enum.Enum):
+    KEY = 0
+    VALUE = 1
+    DATA = 2
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+class Search:
+    """Walks a hive in tree order, yielding (ResultType, key, value) for every match.
+
+    scanned is called with the number of keys and values checked, and can stop the search by raising
+    SearchCancelled. Values already in cache, if given, aren't decoded again, but a search never adds
+    to it, so searching a whole hive doesn't push out the values the table has shown."""
+
+    def __init__(self, matcher: matching.Matcher, search_keys=True, search_values=True, search_data=True, scanned=None,
+                 cache: value_cache.ValueCache = None):
+        self.matcher = matcher
+        self.search_keys = search_keys
+        self.search_values = search_values
+        self.search_data = search_data
+        self.scanned = scanned or (lambda keys=0, values=0: None)
+        self.cache = cache
+        # Hive being searched by matches, the cache is keyed by it
+        self.hive: Registry.Registry = None
+
+    def matches(self, hive: Registry.Registry, starting_key: Registry.RegistryKey, start_at_value=0, include_start=False, index: search_index.SearchIndex = None):
+        """Yield every match after the starting key, in tree order.
+
+        The starting key's name is only checked if include_start is set, and its values before
+        start_at_value are skipped."""
+        self.hive = hive
+        start_offset = starting_key._nkrecord.offset()
+        # A regular expression can't be looked up in the trigram index
+        if index is not None and not self.matcher.regex and start_offset in index.key_positions:
+            start = index.key_positions[start_offset]
+            terms = [self.matcher.term]
+            if self.matcher.hex_needle is not None:
+                terms.append(self.matcher.hex_needle.hex(" "))
+            candidates = index.candidates_any(
+                terms, start if include_start else start + 1)
+            if candidates is not None:
+                yield from self.indexed(hive, index, candidates, start_offset, start_at_value)
+                return
+
+        yield from self.subtree(starting_key, start_at_value=start_at_value,
+                                skip_start_key_name=not include_start)
+
+        current_key = starting_key
+        try:
+            while current_key.parent():
+                subkeys = current_key.parent().subkeys()
+                position = next((i for i, subkey in enumerate(subkeys)
+                                 if subkey.name() == current_key.name()))
+                subkeys = subkeys[position+1:]
+                for subkey in subkeys:
+                    yield from self.subtree(subkey)
+                current_key = current_key.parent()
+        except Registry.RegistryKeyHasNoParentException:
+            pass
+
+    def subtree(self, start_key: Registry.RegistryKey, start_at_value=0, skip_start_key_name=False, recurse=True):
+        """Yield every match in the subtree of start_key, or only in start_key itself if recurse isn't set"""
+        self.scanned(keys=1)
+        matcher = self.matcher
+
+        # Check the start key name if asked (i.e. if the search has just started)
+        if self.search_keys and not skip_start_key_name:
+            if matcher.match_text(start_key.name()):
+                yield ResultType.KEY, start_key.path(), None
+
+        # Skip extra looping if values and data are not searched for
+        if self.search_values or self.search_data:
+            for value in self.key_values(start_key)[start_at_value:]:
+                self.scanned(values=1)
+                # Check through the value
+                if self.search_values and matcher.match_text(self.value_name(value)):
+                    yield ResultType.VALUE, start_key.path(), self.value_name(value)
+                # Check through the value's data
+                elif self.search_data and matcher.match_data(*self.value_data(value)):
+                    yield ResultType.DATA, start_key.path(), self.value_name(value)
+
+        if recurse:
+            for subkey in start_key.subkeys():
+                yield from self.subtree(subkey)
+
+    def open_value(self, offset: int):
+        """Returns the cached fields of the value whose vk record is at offset, or its python-registry value if they
+        aren't cached with its data"""
+        if self.cache is not None:
+            entry = self.cache.peek(self.hive, offset)
+            # Empty data is also how values that couldn't be parsed are cached
+            if entry is not None and entry.raw:
+                return entry
+        return regf.open_value(self.hive, offset)
+
+    def key_values(self, key: Registry.RegistryKey) -> list:
+        """Returns the values of a key, as cached fields for the ones in the value cache"""
+        if self.cache is None or self.hive is None:
+            return key.values()
+        return [self.open_value(regf.cell_data_offset(offset))
+                for offset in regf.value_offsets(regf.buffer(self.hive), key._nkrecord.offset())]
+
+    def value_name(self, value) -> str:
+        """Returns the name of a value from key_values"""
+        if isinstance(value, value_cache.ValueData):
+            return value.name
+        return value.name()
+
+    def value_data(self, value) -> "tuple[int, bytes]":
+        """Returns the type and data of a value from key_values"""
+        if isinstance(value, value_cache.ValueData):
+            return value.datatype, value.raw
+        return value.value_type(), value.raw_data()
+
+    def indexed(self, hive: Registry.Registry, index: search_index.SearchIndex, candidates, start_offset: int, start_at_value: int):
+        """Confirm the candidates from the search index against the hive"""
+        matcher = self.matcher
+        buf = regf.buffer(hive)
+        last_value = None
+        for record in candidates:
+            kind, key_offset, value_index = index.record(record)
+            if kind == search_index.KEY:
+                self.scanned(keys=1)
+            else:
+                self.scanned(values=1)
+            if key_offset == start_offset and kind != search_index.KEY and value_index < start_at_value:
+                continue
+            if not (self.search_keys, self.search_values, self.search_data)[kind]:
+                continue
+            # A value whose name matched isn't reported again for its data
+            if kind == search_index.DATA and last_value == (key_offset, value_index):
+                continue
+
+            key = regf.open_key(hive, key_offset)
+            try:
+                if kind == search_index.KEY:
+                    if matcher.match_text(key.name()):
+                        yield ResultType.KEY, key.path(), None
+                    continue
+
+                value = self.open_value(regf.cell_data_offset(regf.value_offsets(buf, key_offset)[value_index]))
+                if kind == search_index.VALUE:
+                    matched = matcher.match_text(self.value_name(value))
+                else:
+                    matched = matcher.match_data(*self.value_data(value))
+            except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError):
+                continue
+            if matched:
+                if kind == search_index.VALUE:
+                    last_value = (key_offset, value_index)
+                yield ResultType(kind), key.path(), self.value_name(value)
+
+
+# Hives larger than this are split into one job per subkey of the root
+SPLIT_SIZE = 16 * 1024 * 1024
+# Number of parsed hives each pool process keeps open between jobs
+HIVE_CACHE_SIZE = 4
+# Keys and values a pool process scans between updates of the shared counters
+COUNTER_BATCH = 1000
+
+SearchJob = collections.namedtuple(
+    "SearchJob", ["filename", "path", "recurse"])
+
+_cancel_event = None
+_counters = None
+_hives = collections.OrderedDict()
+
+
+def plan_jobs(filenames: "list[str]", hives: "dict[str, Registry.Registry]") -> "list[SearchJob]":
+    """Split a search of several hives into jobs whose results concatenate in tree order.
+
+    Large hives get a job for the root key's own name and values followed by one job per root subkey."""
+    jobs = []
+    for filename in filenames:
+        root = hives[filename].root()
+        if os.path.getsize(filename) < SPLIT_SIZE or root.subkeys_number() < 2:
+            jobs.append(SearchJob(filename, "", True))
+            continue
+        jobs.append(SearchJob(filename, "", False))
+        jobs.extend(SearchJob(filename, subkey.name(), True)
+                    for subkey in root.subkeys())
+    return jobs
+
+
+def init_pool_process(cancel_event, counters):
+    """Pool initializer, sharing the cancel flag and the scanned keys and values counters"""
+    global _cancel_event, _counters
+    _cancel_event = cancel_event
+    _counters = counters
+
+
+def _open_hive(filename: str) -> Registry.Registry:
+    stat = os.stat(filename)
+    cache_key = (filename, stat.st_size, stat.st_mtime_ns)
+    hive = _hives.get(cache_key)
+    if hive is None:
+        hive = regf.open_hive(filename)
+        _hives[cache_key] = hive
+        if len(_hives) > HIVE_CACHE_SIZE:
+            regf.close_hive(_hives.popitem(last=False)[1])
+    else:
+        _hives.move_to_end(cache_key)
+    return hive
+
+
+def run_job(job: SearchJob, term: str, case_sensitive: bool, exact_match: bool, regex: bool, search_keys: bool, search_values: bool, search_data: bool) -> "list[tuple[ResultType, str, str]]":
+    """Run a search job in a pool process, returning its matches"""
+    pending = [0, 0]
+
+    def flush():
+        with _counters.get_lock():
+            _counters[0] += pending[0]
+            _counters[1] += pending[1]
+        pending[0] = pending[1] = 0
+
+    def scanned(keys=0, values=0):
+        pending[0] += keys
+        pending[1] += values
+        if pending[0] + pending[1] >= COUNTER_BATCH:
+            if _cancel_event.is_set():
+                raise SearchCancelled()
+            flush()
+
+    matcher = matching.Matcher(term, case_sensitive=case_sensitive,
+                               exact_match=exact_match, regex=regex)
+    search = Search(matcher, search_keys, search_values, search_data, scanned)
+    hive = _open_hive(job.filename)
+    key = hive.open(job.path) if job.path else hive.root()
+    try:
+        return list(search.subtree(key, recurse=job.recurse))
+    finally:
+        flush()
@@ -0,0 +1,252 @@
+import array
+import bisect
+import hashlib
+import heapq
+import json
+import os
+import struct
+import sys
+
+from Registry import Registry
+
+from . import matching
+from . import regf
+
+
+# Record kinds, matching the values of search.ResultType
+KEY = 0
+VALUE = 1
+DATA = 2
+
+INDEX_VERSION = 3
+MAGIC = b"RSIDX"
+SIDECAR_EXTENSION = ".rsidx"
+# Longer texts are not split into trigrams, they are always checked against the hive instead
+MAX_INDEXED_LENGTH = 16384
+
+
+def sidecar_paths(filename: str) -> "list[str]":
+    """Returns the candidate index paths for a hive, next to the hive first and then in the user cache"""
+    cache_dir = os.environ.get("LOCALAPPDATA") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    digest = hashlib.sha1(os.path.abspath(filename).encode("utf-8")).hexdigest()
+    return [filename + SIDECAR_EXTENSION,
+            os.path.join(cache_dir, "registryspy", digest + SIDECAR_EXTENSION)]
+
+
+def trigrams(text: str) -> "set[str]":
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _write_array(f, values: array.array):
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    f.write(struct.pack("<I", len(values)))
+    values.tofile(f)
+
+
+def _read_array(f, typecode: str) -> array.array:
+    count, = struct.unpack("<I", f.read(4))
+    values = array.array(typecode)
+    values.fromfile(f, count)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class SearchIndex:
+    """Trigram index of the key names, value names and data of a hive.
+
+    Records are numbered in the same depth-first order Find walks the hive in, so the next match
+    after a position is the first confirmed candidate with a higher record number."""
+
+    def __init__(self, fingerprint: dict):
+        self.fingerprint = fingerprint
+        self.kinds = array.array("B")
+        self.key_offsets = array.array("I")
+        self.value_indexes = array.array("I")
+        self.unindexed = array.array("I")
+        self.postings: "dict[str, array.array]" = {}
+        self.key_positions: "dict[int, int]" = {}
+
+    def add(self, kind: int, key_offset: int, value_index: int, texts: "list[str]"):
+        """Add a record whose texts should be found by the index"""
+        record = len(self.kinds)
+        self.kinds.append(kind)
+        self.key_offsets.append(key_offset)
+        self.value_indexes.append(value_index)
+        if kind == KEY:
+            self.key_positions[key_offset] = record
+
+        if any(len(text) > MAX_INDEXED_LENGTH for text in texts):
+            self.unindexed.append(record)
+            return
+
+        grams = set()
+        for text in texts:
+            grams |= trigrams(text.upper())
+        for gram in grams:
+            postings = self.postings.get(gram)
+            if postings is None:
+                postings = self.postings[gram] = array.array("I")
+            postings.append(record)
+
+    def record(self, record: int) -> "tuple[int, int, int]":
+        """Returns (kind, key offset, value index) of a record"""
+        return self.kinds[record], self.key_offsets[record], self.value_indexes[record]
+
+    def candidates_any(self, terms: "list[str]", start: int = 0):
+        """Yield the records at or after start that may contain any of terms, in order.
+
+        Returns None if any of the terms is too short to be looked up in the index."""
+        lookups = [self.candidates(term, start) for term in terms]
+        if any(lookup is None for lookup in lookups):
+            return None
+
+        def unique():
+            last = None
+            for record in heapq.merge(*lookups):
+                if record != last:
+                    last = record
+                    yield record
+        return unique()
+
+    def candidates(self, term: str, start: int = 0):
+        """Yield the records at or after start that may contain term, in order.
+
+        Returns None if the term is too short to be looked up in the index."""
+        grams = sorted((self.postings.get(gram, array.array("I")) for gram in trigrams(term.upper())),
+                       key=len)
+        if len(grams) == 0:
+            return None
+
+        def matching_positions():
+            rarest = grams[0]
+            for i in range(bisect.bisect_left(rarest, start), len(rarest)):
+                record = rarest[i]
+                if all(self._contains(postings, record) for postings in grams[1:]):
+                    yield record
+
+        unindexed = self.unindexed[bisect.bisect_left(self.unindexed, start):]
+        return heapq.merge(matching_positions(), unindexed)
+
+    @staticmethod
+    def _contains(postings: array.array, record: int) -> bool:
+        i = bisect.bisect_left(postings, record)
+        return i < len(postings) and postings[i] == record
+
+    def save(self, path: str):
+        """Write the index to path, replacing any existing file only once it has been fully written"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            header = json.dumps(self.fingerprint).encode("utf-8")
+            f.write(MAGIC + struct.pack("<I", len(header)) + header)
+            for values in (self.kinds, self.key_offsets, self.value_indexes, self.unindexed):
+                _write_array(f, values)
+            f.write(struct.pack("<I", len(self.postings)))
+            for gram, postings in self.postings.items():
+                encoded = gram.encode("utf-8")
+                f.write(struct.pack("<B", len(encoded)) + encoded)
+                _write_array(f, postings)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, expected: dict) -> "SearchIndex":
+        """Read an index from path, returning None if it is missing, damaged or for a different hive state"""
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    return None
+                length, = struct.unpack("<I", f.read(4))
+                if json.loads(f.read(length).decode("utf-8")) != expected:
+                    return None
+
+                index = cls(expected)
+                index.kinds = _read_array(f, "B")
+                index.key_offsets = _read_array(f, "I")
+                index.value_indexes = _read_array(f, "I")
+                index.unindexed = _read_array(f, "I")
+                count, = struct.unpack("<I", f.read(4))
+                for _ in range(count):
+                    length, = struct.unpack("<B", f.read(1))
+                    gram = f.read(length).decode("utf-8")
+                    index.postings[gram] = _read_array(f, "I")
+        except (OSError, EOFError, ValueError, struct.error):
+            return None
+
+        index.key_positions = {index.key_offsets[i]: i for i in range(len(index.kinds))
+                               if index.kinds[i] == KEY}
+        return index
+
+
+def build_index(filename: str, hive: Registry.Registry, progress=None, cancelled=None) -> SearchIndex:
+    """Build the index of a hive in a single pass.
+
+    progress is called with the number of keys indexed so far, and the build stops early,
+    returning None, once cancelled returns True."""
+    index = SearchIndex(regf.fingerprint(filename, hive, INDEX_VERSION))
+    buf = regf.buffer(hive)
+
+    stack = [regf.root_offset(hive)]
+    keys = 0
+    while len(stack) > 0:
+        if cancelled is not None and cancelled():
+            return None
+
+        offset = stack.pop()
+        if offset in index.key_positions:
+            # Don't loop forever on a damaged hive whose subkey lists form a cycle
+            continue
+        try:
+            regf.check_key(buf, offset)
+            index.add(KEY, offset, 0, [regf.key_name(buf, offset)])
+            value_offsets = regf.value_offsets(buf, offset)
+        except (Registry.RegistryParse.ParseException, struct.error):
+            continue
+
+        for value_index, value_offset in enumerate(value_offsets):
+            try:
+                value = regf.open_value(hive, regf.cell_data_offset(value_offset))
+                index.add(VALUE, offset, value_index, [value.name()])
+            except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError):
+                continue
+            try:
+                index.add(DATA, offset, value_index,
+                          matching.data_texts(value.value_type(), value.raw_data()))
+            except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError):
+                pass
+
+        try:
+            subkeys = regf.subkey_offsets(buf, offset)
+        except (Registry.RegistryParse.ParseException, struct.error):
+            subkeys = ()
+        # Reversed so that subkeys are popped, and numbered, in list order
+        stack.extend(regf.cell_data_offset(subkey) for subkey in reversed(subkeys))
+
+        keys += 1
+        if progress is not None and keys % 1000 == 0:
+            progress(keys)
+
+    return index
+
+
+def load_index(filename: str, hive: Registry.Registry) -> SearchIndex:
+    """Load a previously saved index of a hive if it still matches the file"""
+    expected = regf.fingerprint(filename, hive, INDEX_VERSION)
+    for path in sidecar_paths(filename):
+        index = SearchIndex.load(path, expected)
+        if index is not None:
+            return index
+    return None
+
+
+def save_index(filename: str, index: SearchIndex):
+    """Save an index next to its hive, or in the user cache if that location isn't writable"""
+    for path in sidecar_paths(filename):
+        try:
+            index.save(path)
+            return
+        except OSError:
+            continue
@@ -0,0 +1,58 @@
+import json
+import os
+
+from Registry import Registry
+
+from . import regf
+
+
+SESSION_VERSION = 1
+# Version of the key metadata cached in sessions, part of each hive's fingerprint
+SKELETON_VERSION = 1
+SESSION_EXTENSION = ".rssession"
+SESSION_FILTER = f"Registry Spy Sessions (*{SESSION_EXTENSION})"
+
+# A session is a JSON object:
+#
+#     {"version": SESSION_VERSION,
+#      "hives": [{"filename": str,
+#                 "expanded": [nk record offsets of the expanded keys, parents first],
+#                 "skeleton": {"fingerprint": dict,
+#                              "keys": [[offset, parent position, name, subkeys, timestamp], ...]}}],
+#      "selected": {"filename": str, "offset": int, "value": str or null} or null}
+#
+# The skeleton holds every key that was loaded into the key tree in tree order, each one after its
+# parent, with the position of the parent in the list, or -1 for the root key.
+
+
+def fingerprint(filename: str, hive: Registry.Registry) -> dict:
+    """Identify the state of a hive file that a skeleton was cached from"""
+    return regf.fingerprint(filename, hive, SKELETON_VERSION)
+
+
+def default_path(directory: str) -> str:
+    """Returns the path of the session that is saved on exit and restored on startup"""
+    return os.path.join(directory, "last" + SESSION_EXTENSION)
+
+
+def save(path: str, session: dict):
+    """Write a session to path, replacing any existing file only once it has been fully written"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(session, version=SESSION_VERSION), f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def load(path: str) -> dict:
+    """Read a session from path, returning None if it is missing, damaged or from another version"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            session = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(session, dict) or session.get("version") != SESSION_VERSION:
+        return None
+    if not isinstance(session.get("hives"), list):
+        return None
+    return session
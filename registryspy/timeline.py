@@ -0,0 +1,263 @@
+import array
+import bisect
+import csv
+import heapq
+import os
+import struct
+
+from Registry import Registry
+
+from . import regf
+
+
+FORMATS = ["body", "csv"]
+# Columns of the CSV format
+FIELDS = ["timestamp", "hive", "path"]
+# FILETIME of the Unix epoch, which bodyfile times are relative to
+UNIX_EPOCH_FILETIME = 116444736000000000
+# Size of the write buffer of exported files
+BUFFER_SIZE = 1024 * 1024
+# Keys indexed or written between progress reports
+PROGRESS_INTERVAL = 1000
+# Ancestor paths remembered while resolving the paths of keys
+PATH_CACHE_SIZE = 4096
+# Keys sorted at a time while building an index, before the sorted runs are merged
+SORT_RUN_SIZE = 65536
+
+
+def format_for(filename: str, selected_filter: str = "") -> str:
+    """Pick the timeline format from a file extension, falling back to the selected file dialog filter"""
+    lower = filename.lower()
+    if lower.endswith(".csv") or (not lower.endswith((".body", ".txt")) and "csv" in selected_filter.lower()):
+        return "csv"
+    return "body"
+
+
+class TimelineIndex:
+    """Last write timestamps of every key of a hive in ascending order, with the offsets of their nk records.
+
+    Each key takes 12 bytes, and a time range is found with two binary searches."""
+
+    def __init__(self, timestamps: array.array, offsets: array.array):
+        self.timestamps = timestamps
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def first(self) -> int:
+        """Returns the earliest timestamp, or None if the index is empty"""
+        return self.timestamps[0] if self.timestamps else None
+
+    def last(self) -> int:
+        """Returns the latest timestamp, or None if the index is empty"""
+        return self.timestamps[-1] if self.timestamps else None
+
+    def range(self, start: int = None, end: int = None) -> "tuple[int, int]":
+        """Returns the positions of the first key written at or after start and after the last key written at or before end"""
+        low = 0 if start is None else bisect.bisect_left(self.timestamps, start)
+        high = len(self.timestamps) if end is None else bisect.bisect_right(self.timestamps, end)
+        return low, max(low, high)
+
+    def count(self, start: int = None, end: int = None) -> int:
+        low, high = self.range(start, end)
+        return high - low
+
+    def entries(self, start: int = None, end: int = None):
+        """Yield (timestamp, offset) of the keys written between start and end, in order"""
+        low, high = self.range(start, end)
+        return zip(self.timestamps[low:high], self.offsets[low:high])
+
+
+def build_index(hive: Registry.Registry, progress=None, cancelled=None) -> TimelineIndex:
+    """Read the timestamp of every key of a hive in a single pass and sort them.
+
+    progress is called with the number of keys read so far, and the build stops early,
+    returning None, once cancelled returns True."""
+    buf = regf.buffer(hive)
+    timestamps = array.array("Q")
+    offsets = array.array("I")
+
+    # One bit per 8 byte aligned cell
+    seen = bytearray(len(buf) // 64 + 1)
+    stack = [regf.root_offset(hive)]
+    while stack:
+        offset = stack.pop()
+        cell = offset >> 3
+        if offset >= len(buf) or seen[cell >> 3] & (1 << (cell & 7)):
+            # Don't loop forever on a damaged hive whose subkey lists form a cycle
+            continue
+        seen[cell >> 3] |= 1 << (cell & 7)
+        try:
+            regf.check_key(buf, offset)
+            timestamp = regf.key_timestamp(buf, offset)
+        except (Registry.RegistryParse.ParseException, struct.error):
+            continue
+        timestamps.append(timestamp)
+        offsets.append(offset)
+        try:
+            stack.extend(regf.cell_data_offset(subkey) for subkey in regf.subkey_offsets(buf, offset))
+        except (Registry.RegistryParse.ParseException, struct.error):
+            pass
+
+        if len(timestamps) % PROGRESS_INTERVAL == 0:
+            if progress is not None:
+                progress(len(timestamps))
+            if cancelled is not None and cancelled():
+                return None
+    del seen
+
+    # Sort runs of keys so that only one run is ever held as ints, then merge them. Keys written at
+    # the same time stay in the order they were read
+    runs = []
+    for low in range(0, len(timestamps), SORT_RUN_SIZE):
+        order = sorted(range(low, min(low + SORT_RUN_SIZE, len(timestamps))), key=timestamps.__getitem__)
+        runs.append((array.array("Q", map(timestamps.__getitem__, order)), array.array("I", order)))
+    del timestamps
+
+    sorted_timestamps = array.array("Q")
+    sorted_offsets = array.array("I")
+    for timestamp, position in heapq.merge(*(zip(*run) for run in runs)):
+        sorted_timestamps.append(timestamp)
+        sorted_offsets.append(offsets[position])
+    return TimelineIndex(sorted_timestamps, sorted_offsets)
+
+
+class Entries:
+    """Keys of one or more hives written in a time range, in timestamp order"""
+
+    def __init__(self, timestamps: array.array, offsets: array.array, sources: array.array):
+        self.timestamps = timestamps
+        self.offsets = offsets
+        # Position of each key's hive in the list of hives that was queried
+        self.sources = sources
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, row: int) -> "tuple[int, int, int]":
+        """Returns (timestamp, offset, source) of a key"""
+        return self.timestamps[row], self.offsets[row], self.sources[row]
+
+
+def _tagged(index: TimelineIndex, source: int, start: int, end: int):
+    for timestamp, offset in index.entries(start, end):
+        yield timestamp, source, offset
+
+
+def query(indexes: "list[TimelineIndex]", start: int = None, end: int = None, cancelled=None) -> Entries:
+    """Merge the keys of several hives that were written between start and end.
+
+    A single hive is sliced straight out of its index. Returns None once cancelled returns True."""
+    if len(indexes) == 1:
+        low, high = indexes[0].range(start, end)
+        return Entries(indexes[0].timestamps[low:high], indexes[0].offsets[low:high],
+                       array.array("H", bytes(2 * (high - low))))
+
+    timestamps = array.array("Q")
+    offsets = array.array("I")
+    sources = array.array("H")
+    merged = heapq.merge(*(_tagged(index, source, start, end) for source, index in enumerate(indexes)))
+    for count, (timestamp, source, offset) in enumerate(merged, 1):
+        timestamps.append(timestamp)
+        offsets.append(offset)
+        sources.append(source)
+        if count % PROGRESS_INTERVAL == 0 and cancelled is not None and cancelled():
+            return None
+    return Entries(timestamps, offsets, sources)
+
+
+class PathResolver:
+    """Builds the paths of keys from the parent offsets of their nk records, remembering the paths of their ancestors"""
+
+    def __init__(self, hive: Registry.Registry, size: int = PATH_CACHE_SIZE):
+        self.buf = regf.buffer(hive)
+        self.size = size
+        self.paths: "dict[int, str]" = {}
+
+    def path(self, offset: int) -> str:
+        """Returns the path of the key whose nk record is at offset, starting with the name of the root key"""
+        names = []
+        visited = set()
+        prefix = None
+        try:
+            while True:
+                prefix = self.paths.get(offset)
+                if prefix is not None:
+                    break
+                if offset in visited:
+                    prefix = "[path cycle]"
+                    break
+                visited.add(offset)
+                regf.check_key(self.buf, offset)
+                names.append((offset, regf.key_name(self.buf, offset)))
+                if regf.is_root_key(self.buf, offset):
+                    break
+                offset = regf.key_parent(self.buf, offset)
+        except (Registry.RegistryParse.ParseException, struct.error):
+            prefix = "[invalid key]"
+
+        if len(self.paths) > self.size:
+            self.paths.clear()
+        path = prefix
+        for i, (offset, name) in enumerate(reversed(names)):
+            path = name if path is None else path + "\\" + name
+            if i < len(names) - 1:
+                # Only ancestors are likely to be looked up again
+                self.paths[offset] = path
+        return path
+
+
+def unix_time(filetime: int) -> int:
+    """Convert a FILETIME to whole seconds since the Unix epoch, as bodyfiles store times"""
+    return max(0, (filetime - UNIX_EPOCH_FILETIME) // regf.FILETIME_RESOLUTION)
+
+
+def rows(hives: "list[tuple[str, Registry.Registry]]", entries: Entries, progress=None, cancelled=None):
+    """Yield (timestamp, hive filename, path) of each entry, stopping early once cancelled returns True"""
+    resolvers = [PathResolver(hive) for _, hive in hives]
+    for row in range(len(entries)):
+        timestamp, offset, source = entries[row]
+        yield timestamp, hives[source][0], resolvers[source].path(offset)
+        if (row + 1) % PROGRESS_INTERVAL == 0:
+            if progress is not None:
+                progress(row + 1)
+            if cancelled is not None and cancelled():
+                return
+
+
+def write_body(f, rows):
+    """Write rows in the TSK 3 bodyfile format read by mactime, with the last write time as the modification time"""
+    for timestamp, filename, path in rows:
+        # The bodyfile format has no way to escape its separator
+        name = f"{os.path.basename(filename)}\\{path}".replace("|", "_")
+        f.write(f"0|{name}|0|0|0|0|0|0|{unix_time(timestamp)}|0|0\n")
+
+
+def write_csv(f, rows):
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    for timestamp, filename, path in rows:
+        try:
+            formatted = regf.filetime_to_datetime(timestamp).isoformat()
+        except OverflowError:
+            formatted = None
+        writer.writerow((formatted, filename, path))
+
+
+WRITERS = {"body": write_body, "csv": write_csv}
+
+
+def export(f, hives: "list[tuple[str, Registry.Registry]]", entries: Entries, export_format="body", progress=None, cancelled=None):
+    """Write the timeline of one or more hives to an open text file"""
+    WRITERS[export_format](f, rows(hives, entries, progress, cancelled))
+
+
+def export_file(filename: str, hives: "list[tuple[str, Registry.Registry]]", entries: Entries, export_format="body", progress=None, cancelled=None) -> bool:
+    """Export a timeline to a file, returning False and removing the file if cancelled"""
+    with open(filename, "w", newline="", encoding="utf-8", buffering=BUFFER_SIZE) as f:
+        export(f, hives, entries, export_format, progress, cancelled)
+    if cancelled is not None and cancelled():
+        os.remove(filename)
+        return False
+    return True
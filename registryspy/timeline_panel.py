@@ -0,0 +1,539 @@
+import datetime
+import struct
+import threading
+
+from Registry import Registry
+import PySide6.QtCore as QtCore
+import PySide6.QtGui as QtGui
+import PySide6.QtWidgets as QtWidgets
+
+from . import helpers
+from . import regf
+from . import timeline
+
+ALL_HIVES = "All Hives"
+# Number of bars in the histogram of the shown range
+HISTOGRAM_BUCKETS = 120
+DATETIME_FORMAT = "yyyy-MM-dd HH:mm:ss"
+
+
+def to_qdatetime(filetime: int) -> QtCore.QDateTime:
+    value = regf.filetime_to_datetime(filetime)
+    return QtCore.QDateTime(QtCore.QDate(value.year, value.month, value.day),
+                            QtCore.QTime(value.hour, value.minute, value.second),
+                            QtCore.Qt.TimeSpec.UTC)
+
+
+def to_filetime(value: QtCore.QDateTime) -> int:
+    date = value.date()
+    time = value.time()
+    return regf.datetime_to_filetime(datetime.datetime(
+        date.year(), date.month(), date.day(), time.hour(), time.minute(), time.second()))
+
+
+class TimelineWorkerSignals(QtCore.QObject):
+    progress = QtCore.Signal(str)
+    # Indexes by filename, so they can be reused, and the timeline.Entries in the range
+    finished = QtCore.Signal(object, object)
+    cancelled = QtCore.Signal()
+    error = QtCore.Signal(str)
+
+
+class TimelineWorker(QtCore.QRunnable):
+    """Indexes the timestamps of hives, unless they are already indexed, and queries a range on a worker thread"""
+
+    def __init__(self, hives: "list[tuple[str, Registry.Registry]]", indexes: "dict[str, timeline.TimelineIndex]", start: int, end: int):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.hives = hives
+        self.filenames = {filename for filename, _ in hives}
+        self.indexes = {filename: indexes.get(filename) for filename, _ in hives}
+        self.start = start
+        self.end = end
+
+        self.signals = TimelineWorkerSignals()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        try:
+            try:
+                for filename, hive in self.hives:
+                    if self.indexes[filename] is None:
+                        self.indexes[filename] = timeline.build_index(
+                            hive, lambda keys: self.signals.progress.emit(f"Indexing {filename}: {keys:,} keys"),
+                            self.is_cancelled)
+                    if self.indexes[filename] is None:
+                        self.signals.cancelled.emit()
+                        return
+
+                entries = timeline.query([self.indexes[filename] for filename, _ in self.hives],
+                                         self.start, self.end, self.is_cancelled)
+            except (Registry.RegistryParse.RegistryException, struct.error) as e:
+                self.signals.error.emit(str(e))
+                return
+            if entries is None:
+                self.signals.cancelled.emit()
+                return
+            self.signals.finished.emit(self.indexes, entries)
+        finally:
+            self._finished.set()
+
+
+class TimelineExportWorkerSignals(QtCore.QObject):
+    progress = QtCore.Signal(int)
+    finished = QtCore.Signal(bool)
+    error = QtCore.Signal(str)
+
+
+class TimelineExportWorker(QtCore.QRunnable):
+    """Writes the shown keys to a bodyfile or CSV file on a worker thread"""
+
+    def __init__(self, filename: str, hives: "list[tuple[str, Registry.Registry]]", entries: timeline.Entries, export_format: str):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.filename = filename
+        self.hives = hives
+        self.entries = entries
+        self.export_format = export_format
+        self.signals = TimelineExportWorkerSignals()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self):
+        try:
+            try:
+                completed = timeline.export_file(self.filename, self.hives, self.entries, self.export_format,
+                                                 progress=self.signals.progress.emit,
+                                                 cancelled=self.is_cancelled)
+            except OSError as e:
+                self.signals.error.emit(str(e))
+                return
+            self.signals.finished.emit(completed)
+        finally:
+            self._finished.set()
+
+
+class TimelineModel(QtCore.QAbstractTableModel):
+    """Table model of the keys written in a time range, whose paths are only built when shown"""
+
+    HEADERS = ["Last Write Time", "Hive", "Key"]
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.hives: "list[tuple[str, Registry.Registry]]" = []
+        self.entries = timeline.Entries([], [], [])
+        self.resolvers: "list[timeline.PathResolver]" = []
+
+    def set_entries(self, hives: "list[tuple[str, Registry.Registry]]", entries: timeline.Entries):
+        self.beginResetModel()
+        self.hives = hives
+        self.entries = entries
+        self.resolvers = [timeline.PathResolver(hive) for _, hive in hives]
+        self.endResetModel()
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.entries)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return len(self.HEADERS)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        timestamp, offset, source = self.entries[index.row()]
+        column = index.column()
+        if column == 0:
+            try:
+                return regf.filetime_to_datetime(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+            except OverflowError:
+                return ""
+        if column == 1:
+            return self.hives[source][0]
+        return self.resolvers[source].path(offset)
+
+    def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+
+class TimelineHistogram(QtWidgets.QWidget):
+    """Bar chart of the number of keys written over the shown range, clicking a bar zooms into it"""
+
+    # First and last FILETIME of the clicked bar
+    bucket_clicked = QtCore.Signal(object, object)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.setMinimumHeight(48)
+        self.setSizePolicy(QtWidgets.QSizePolicy.Policy.Expanding, QtWidgets.QSizePolicy.Policy.Fixed)
+        self.setMouseTracking(True)
+        self.start = 0
+        self.width_per_bucket = 0
+        self.counts: "list[int]" = []
+
+    def set_range(self, indexes: "list[timeline.TimelineIndex]", start: int, end: int):
+        """Count the keys of each bucket between start and end with a binary search per bucket"""
+        self.counts = []
+        if start is None or end is None or end < start:
+            self.update()
+            return
+        self.start = start
+        self.width_per_bucket = max(1, -(-(end - start + 1) // HISTOGRAM_BUCKETS))
+        for bucket in range(HISTOGRAM_BUCKETS):
+            bucket_start = start + bucket * self.width_per_bucket
+            if bucket_start > end:
+                break
+            bucket_end = min(end, bucket_start + self.width_per_bucket - 1)
+            self.counts.append(sum(index.count(bucket_start, bucket_end) for index in indexes))
+        self.update()
+
+    def bucket_at(self, x: float) -> int:
+        if len(self.counts) == 0 or self.width() == 0:
+            return None
+        return min(len(self.counts) - 1, max(0, int(x * len(self.counts) / self.width())))
+
+    def bucket_range(self, bucket: int) -> "tuple[int, int]":
+        bucket_start = self.start + bucket * self.width_per_bucket
+        return bucket_start, bucket_start + self.width_per_bucket - 1
+
+    def paintEvent(self, event: QtGui.QPaintEvent):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        if len(self.counts) == 0:
+            return
+        highest = max(self.counts) or 1
+        bar_width = self.width() / len(self.counts)
+        color = self.palette().highlight().color()
+        for bucket, count in enumerate(self.counts):
+            if count == 0:
+                continue
+            height = max(1, round(count / highest * (self.height() - 2)))
+            painter.fillRect(QtCore.QRectF(bucket * bar_width, self.height() - height,
+                                           max(1.0, bar_width - 1), height), color)
+
+    def mouseMoveEvent(self, event: QtGui.QMouseEvent):
+        bucket = self.bucket_at(event.position().x())
+        if bucket is None:
+            return
+        bucket_start, bucket_end = self.bucket_range(bucket)
+        try:
+            text = f"{regf.filetime_to_datetime(bucket_start):%Y-%m-%d %H:%M:%S} to " \
+                f"{regf.filetime_to_datetime(bucket_end):%Y-%m-%d %H:%M:%S}: {self.counts[bucket]:,} keys"
+        except OverflowError:
+            return
+        QtWidgets.QToolTip.showText(event.globalPosition().toPoint(), text, self)
+
+    def mousePressEvent(self, event: QtGui.QMouseEvent):
+        bucket = self.bucket_at(event.position().x())
+        if bucket is not None and self.counts[bucket] > 0:
+            self.bucket_clicked.emit(*self.bucket_range(bucket))
+
+
+class TimelinePanel(QtWidgets.QDockWidget):
+    """Dockable timeline of the keys of the open hives by last write time"""
+
+    # (hive filename, nk record offset)
+    activated = QtCore.Signal(str, object)
+
+    def __init__(self, *args):
+        super().__init__("Timeline", *args)
+        self.setObjectName("timeline")
+
+        self.hives: "dict[str, Registry.Registry]" = {}
+        # Timestamp indexes of the hives shown so far, by filename
+        self.indexes: "dict[str, timeline.TimelineIndex]" = {}
+        self.worker: TimelineWorker = None
+        self.export_worker: TimelineExportWorker = None
+
+        container = QtWidgets.QWidget(self)
+        layout = QtWidgets.QVBoxLayout(container)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        controls = QtWidgets.QHBoxLayout()
+        self.hive = QtWidgets.QComboBox(container)
+        self.hive.setSizeAdjustPolicy(QtWidgets.QComboBox.SizeAdjustPolicy.AdjustToMinimumContentsLengthWithIcon)
+        self.hive.currentTextChanged.connect(self.reset_range)
+        controls.addWidget(self.hive, 1)
+        controls.addWidget(QtWidgets.QLabel("From:", container))
+        self.start_edit = self.create_edit(container)
+        controls.addWidget(self.start_edit)
+        controls.addWidget(QtWidgets.QLabel("To:", container))
+        self.end_edit = self.create_edit(container)
+        controls.addWidget(self.end_edit)
+        self.show_button = QtWidgets.QPushButton("Show", container)
+        self.show_button.clicked.connect(self.show_range)
+        controls.addWidget(self.show_button)
+        self.all_button = QtWidgets.QPushButton("Show All", container)
+        self.all_button.clicked.connect(self.show_all)
+        controls.addWidget(self.all_button)
+        self.cancel_button = QtWidgets.QPushButton("Cancel", container)
+        self.cancel_button.clicked.connect(self.cancel)
+        self.cancel_button.hide()
+        controls.addWidget(self.cancel_button)
+        layout.addLayout(controls)
+
+        self.histogram = TimelineHistogram(container)
+        self.histogram.bucket_clicked.connect(self.zoom)
+        layout.addWidget(self.histogram)
+
+        self.timeline_model = TimelineModel(self)
+        self.table = QtWidgets.QTableView(container)
+        self.table.setModel(self.timeline_model)
+        self.table.setSelectionBehavior(
+            QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(
+            QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(
+            QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setWordWrap(False)
+        self.table.verticalHeader().setVisible(False)
+        self.table.verticalHeader().setSectionResizeMode(
+            QtWidgets.QHeaderView.ResizeMode.Fixed)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.clicked.connect(self.handle_click)
+        self.table.activated.connect(self.handle_click)
+        layout.addWidget(self.table)
+
+        buttons = QtWidgets.QHBoxLayout()
+        self.status = QtWidgets.QLabel(container)
+        buttons.addWidget(self.status)
+        buttons.addStretch()
+        self.export_button = QtWidgets.QPushButton("Export...", container)
+        self.export_button.clicked.connect(self.show_export)
+        buttons.addWidget(self.export_button)
+        clear_button = QtWidgets.QPushButton("Clear", container)
+        clear_button.clicked.connect(self.clear)
+        buttons.addWidget(clear_button)
+        layout.addLayout(buttons)
+
+        self.setWidget(container)
+        self.update_buttons()
+
+    def create_edit(self, parent: QtWidgets.QWidget) -> QtWidgets.QDateTimeEdit:
+        edit = QtWidgets.QDateTimeEdit(parent)
+        edit.setTimeSpec(QtCore.Qt.TimeSpec.UTC)
+        edit.setDisplayFormat(DATETIME_FORMAT)
+        edit.setCalendarPopup(True)
+        edit.setMinimumDateTime(to_qdatetime(0))
+        edit.setDateTime(to_qdatetime(0))
+        return edit
+
+    def selected_hives(self) -> "list[tuple[str, Registry.Registry]]":
+        selected = self.hive.currentText()
+        if selected == ALL_HIVES:
+            return list(self.hives.items())
+        if selected in self.hives:
+            return [(selected, self.hives[selected])]
+        return []
+
+    def selected_indexes(self) -> "list[timeline.TimelineIndex]":
+        """Returns the indexes of the selected hives, or None if any of them hasn't been indexed yet"""
+        indexes = [self.indexes.get(filename) for filename, _ in self.selected_hives()]
+        if len(indexes) == 0 or any(index is None for index in indexes):
+            return None
+        return indexes
+
+    def set_hives(self, hives: "dict[str, Registry.Registry]"):
+        """Offer the open hives, keeping the current choice if it is still open"""
+        self.hives = dict(hives)
+        current = self.hive.currentText()
+        self.hive.blockSignals(True)
+        self.hive.clear()
+        if len(self.hives) > 1:
+            self.hive.addItem(ALL_HIVES)
+        self.hive.addItems(list(self.hives))
+        if current in self.hives or (current == ALL_HIVES and len(self.hives) > 1):
+            self.hive.setCurrentText(current)
+        self.hive.blockSignals(False)
+        if self.hive.currentText() != current:
+            self.reset_range()
+        self.update_buttons()
+
+    def remove_hive(self, filename: str) -> "list[QtCore.QRunnable]":
+        """Stop indexing and forget the index and keys of a hive that is being closed.
+
+        Returns the workers that may still be reading the hive"""
+        workers = []
+        if self.worker is not None and filename in self.worker.filenames:
+            self.worker.cancel()
+            workers.append(self.worker)
+        if self.export_worker is not None and any(name == filename for name, _ in self.export_worker.hives):
+            self.export_worker.cancel()
+            workers.append(self.export_worker)
+        self.indexes.pop(filename, None)
+        if any(name == filename for name, _ in self.timeline_model.hives):
+            self.clear()
+        hives = dict(self.hives)
+        hives.pop(filename, None)
+        self.set_hives(hives)
+        return workers
+
+    def clear(self):
+        self.timeline_model.set_entries([], timeline.Entries([], [], []))
+        self.histogram.set_range([], None, None)
+        self.status.setText("")
+        self.update_buttons()
+
+    def update_buttons(self):
+        busy = self.worker is not None or self.export_worker is not None
+        self.show_button.setEnabled(not busy and len(self.hives) > 0)
+        self.all_button.setEnabled(not busy and len(self.hives) > 0)
+        self.export_button.setEnabled(not busy and len(self.timeline_model.entries) > 0)
+        self.cancel_button.setVisible(busy)
+
+    def reset_range(self):
+        """Set the range to the first and last timestamps of the selected hives, if they are indexed"""
+        indexes = self.selected_indexes()
+        if indexes is None:
+            return
+        firsts = [index.first() for index in indexes if len(index) > 0]
+        lasts = [index.last() for index in indexes if len(index) > 0]
+        if firsts:
+            self.set_range(min(firsts), max(lasts))
+
+    def set_range(self, start: int, end: int):
+        try:
+            self.start_edit.setDateTime(to_qdatetime(start))
+            self.end_edit.setDateTime(to_qdatetime(end))
+        except OverflowError:
+            pass
+
+    def show_range(self):
+        """Show the keys of the selected hives written between the two times, indexing the hives first if needed"""
+        if self.selected_indexes() is None:
+            # The range can only be chosen once the first and last timestamps are known
+            self.show_all()
+            return
+        start = to_filetime(self.start_edit.dateTime())
+        # The end is shown to the second, so include everything written during that second
+        end = to_filetime(self.end_edit.dateTime()) + regf.FILETIME_RESOLUTION - 1
+        self.query(start, end)
+
+    def show_all(self):
+        self.query(None, None)
+
+    def zoom(self, start: int, end: int):
+        self.set_range(start, end)
+        self.query(start, end)
+
+    def query(self, start: int, end: int):
+        hives = self.selected_hives()
+        if self.worker is not None or len(hives) == 0:
+            return
+        self.worker = TimelineWorker(hives, self.indexes, start, end)
+        self.worker.signals.progress.connect(self.status.setText)
+        self.worker.signals.finished.connect(self.handle_finished)
+        self.worker.signals.cancelled.connect(self.handle_cancelled)
+        self.worker.signals.error.connect(self.handle_error)
+        self.status.setText("Loading...")
+        QtCore.QThreadPool.globalInstance().start(self.worker)
+        self.update_buttons()
+
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+
+    def end_query(self):
+        self.worker = None
+        self.update_buttons()
+
+    def handle_finished(self, indexes: "dict[str, timeline.TimelineIndex]", entries: timeline.Entries):
+        worker = self.worker
+        self.end_query()
+        if worker.is_cancelled():
+            self.status.setText("")
+            return
+        for filename, index in indexes.items():
+            if filename in self.hives:
+                self.indexes[filename] = index
+        hives = [(filename, hive) for filename, hive in worker.hives if filename in self.hives]
+        if len(hives) != len(worker.hives):
+            self.status.setText("")
+            return
+
+        all_indexes = [indexes[filename] for filename, _ in hives]
+        start, end = worker.start, worker.end
+        if start is None:
+            self.reset_range()
+            start = entries.timestamps[0] if len(entries) > 0 else None
+            end = entries.timestamps[-1] if len(entries) > 0 else None
+        self.histogram.set_range(all_indexes, start, end)
+        self.timeline_model.set_entries(hives, entries)
+        self.status.setText(f"{len(entries):,} keys")
+        self.update_buttons()
+
+    def handle_cancelled(self):
+        self.end_query()
+        self.status.setText("Cancelled")
+
+    def handle_error(self, message: str):
+        self.end_query()
+        self.status.setText("")
+        helpers.show_message_box(
+            f"Could not build the timeline: {message}", alert_type=helpers.MessageBoxTypes.CRITICAL)
+
+    def show_export(self):
+        """Ask for a file and write the shown keys to it"""
+        if len(self.timeline_model.entries) == 0 or self.export_worker is not None:
+            return
+        filename, selected_filter = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export Timeline", "", "Bodyfiles (*.body);;CSV Files (*.csv)")
+        if filename == "":
+            return
+
+        self.export_worker = TimelineExportWorker(filename, self.timeline_model.hives, self.timeline_model.entries,
+                                                  timeline.format_for(filename, selected_filter))
+        self.export_worker.signals.progress.connect(self.handle_export_progress)
+        self.export_worker.signals.finished.connect(self.handle_export_finished)
+        self.export_worker.signals.error.connect(self.handle_export_error)
+        self.status.setText("Exporting...")
+        QtCore.QThreadPool.globalInstance().start(self.export_worker)
+        self.update_buttons()
+
+    def end_export(self):
+        self.export_worker = None
+        self.update_buttons()
+
+    def handle_export_progress(self, keys: int):
+        if self.export_worker is not None:
+            self.status.setText(f"Exported {keys:,} of {len(self.export_worker.entries):,} keys...")
+
+    def handle_export_finished(self, completed: bool):
+        self.end_export()
+        self.status.setText("Export finished" if completed else "Export cancelled")
+
+    def handle_export_error(self, message: str):
+        self.end_export()
+        self.status.setText("")
+        helpers.show_message_box(
+            f"Could not export the timeline: {message}", alert_type=helpers.MessageBoxTypes.CRITICAL)
+
+    def handle_click(self, index: QtCore.QModelIndex):
+        _, offset, source = self.timeline_model.entries[index.row()]
+        self.activated.emit(self.timeline_model.hives[source][0], offset)
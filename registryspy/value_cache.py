@@ -0,0 +1,151 @@
+import collections
+import struct
+import threading
+
+from Registry import Registry
+
+from . import formatting
+from . import profiling
+from . import regf
+
+
+# Bytes of decoded names, data and display text kept across all open hives
+CACHE_SIZE = 32 * 1024 * 1024
+# Values with more data than fits in a single cell are never read whole to be shown. They keep their
+# size and a preview of their first bytes, and their data is read through a regf.DataReader when needed.
+MAX_DATA_SIZE = regf.BIG_DATA_SEGMENT_SIZE
+# Bytes counted for each value on top of its strings and data
+ENTRY_OVERHEAD = 200
+# Number of bytes of binary data formatted for display, the data viewer shows the rest
+PREVIEW_BYTES = 1024
+
+
+class ValueData:
+    """Decoded fields of a single value, with its display text once it has been formatted"""
+
+    __slots__ = ("name", "datatype", "raw", "data", "empty")
+
+    def __init__(self, name: str, datatype: int, raw: bytes, data: str = None, empty: bool = False):
+        self.name = name
+        self.datatype = datatype
+        # None if the data is larger than MAX_DATA_SIZE
+        self.raw = raw
+        self.data = data
+        self.empty = empty
+
+    def size(self) -> int:
+        return (ENTRY_OVERHEAD + len(self.name) + len(self.raw or b"") +
+                (len(self.data) if self.data is not None else 0))
+
+
+class ValueCache:
+    """LRU cache of decoded values by (hive, vk record offset), bounded by the total size of their fields.
+
+    Filled by the value table and the data viewer and read by searches on worker threads, so every
+    access holds a lock, but values are decoded outside of it."""
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.used = 0
+        self.entries: "collections.OrderedDict[tuple, tuple[ValueData, int]]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, cache_key: tuple) -> ValueData:
+        with self.lock:
+            cached = self.entries.get(cache_key)
+            if cached is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(cache_key)
+            return cached[0]
+
+    def peek(self, hive: Registry.Registry, offset: int) -> ValueData:
+        """Returns the cached value whose vk record is at offset, or None, without decoding it or making it recent"""
+        with self.lock:
+            cached = self.entries.get((hive, offset))
+        return cached[0] if cached is not None else None
+
+    def _store(self, cache_key: tuple, entry: ValueData):
+        size = entry.size()
+        with self.lock:
+            previous = self.entries.pop(cache_key, None)
+            if previous is not None:
+                self.used -= previous[1]
+            self.entries[cache_key] = (entry, size)
+            self.used += size
+            while self.used > self.size and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.used -= evicted
+
+    def _decode(self, hive: Registry.Registry, offset: int) -> ValueData:
+        profiling.decoded(values=1)
+        value = regf.open_value(hive, offset)
+        name = value.name()
+        datatype = value.value_type()
+        try:
+            reader = regf.value_reader(regf.buffer(hive), offset)
+            if len(reader) > MAX_DATA_SIZE:
+                entry = ValueData(name, datatype, None,
+                                  formatting.format_preview(datatype, reader[:PREVIEW_BYTES], len(reader)))
+            else:
+                entry = ValueData(name, datatype, value.raw_data())
+        except (Registry.RegistryParse.RegistryException, struct.error):
+            # Shown the way formatting.format_value shows data it can't parse
+            entry = ValueData(name, datatype, b"", "(unable to parse data)", True)
+        self._store((hive, offset), entry)
+        return entry
+
+    def get(self, hive: Registry.Registry, offset: int) -> ValueData:
+        """Returns the name, type and data of the value whose vk record is at offset, decoding it on first use.
+
+        Raises the python-registry errors of a value that can't be parsed."""
+        entry = self._lookup((hive, offset))
+        if entry is None:
+            entry = self._decode(hive, offset)
+        return entry
+
+    def raw_data(self, hive: Registry.Registry, offset: int) -> bytes:
+        """Returns all of the data of the value whose vk record is at offset, reading it if it was too large to keep"""
+        entry = self.get(hive, offset)
+        if entry.raw is None:
+            return regf.open_value(hive, offset).raw_data()
+        return entry.raw
+
+    def reader(self, hive: Registry.Registry, offset: int) -> "bytes | regf.DataReader":
+        """Returns the data of the value whose vk record is at offset if it was kept, or a reader that reads it on demand"""
+        entry = self.get(hive, offset)
+        if entry.raw is None:
+            return regf.value_reader(regf.buffer(hive), offset)
+        return entry.raw
+
+    def formatted(self, hive: Registry.Registry, offset: int) -> ValueData:
+        """Like get, with the display text of the value's data formatted too"""
+        entry = self.get(hive, offset)
+        if entry.data is None:
+            entry.data, entry.empty = formatting.format_value(
+                regf.open_value(hive, offset), limit=PREVIEW_BYTES, raw_data=entry.raw)
+            # Stored again so that the text counts towards the size of the cache
+            self._store((hive, offset), entry)
+        return entry
+
+    def remove_hive(self, hive: Registry.Registry):
+        """Drop the values of a hive that is being closed"""
+        with self.lock:
+            for cache_key in [k for k in self.entries if k[0] is hive]:
+                self.used -= self.entries.pop(cache_key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used = 0
+
+
+_shared = ValueCache()
+
+
+def shared() -> ValueCache:
+    """Returns the cache shared by the value table, the data viewer and the searches run in this process"""
+    return _shared
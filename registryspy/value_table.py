@@ -5,24 +5,123 @@ import PySide6.QtWidgets as QtWidgets
 import PySide6.QtGui as QtGui
 import PySide6.QtCore as QtCore
 
+from . import formatting
 from . import helpers
+from . import profiling
+from . import regf
+from . import value_cache
 
 
-class ValueData(QtWidgets.QTableWidgetItem):
-    def __init__(self, raw_data: bytes, value, *args, **kwargs):
+class ValueTableModel(QtCore.QAbstractTableModel):
+    """Table model of the values of a key that only keeps the offsets of their vk records.
+
+    Rows are decoded through the shared value cache, so going back to a key doesn't decode its values again."""
+
+    def __init__(self, table: "ValueTable", *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.table = table
+        self.hive: Registry.Registry = None
+        self.offset: int = None
+        self.offsets = ()
+        self.rows: "list[value_cache.ValueData]" = []
+        self.cache = value_cache.shared()
+        # Background colors of values by lowercase name, by (hive, nk record offset) of their key
+        self.highlights: "dict[tuple, dict[str, QtGui.QColor]]" = {}
+        self.key_highlights: "dict[str, QtGui.QColor]" = {}
+
+        self.empty_font = QtGui.QFont()
+        self.empty_font.setItalic(True)
+
+    def set_key(self, hive: Registry.Registry, offset: int, offsets: "list[int]" = None):
+        """Show the values of the key whose nk record starts at offset, or the values with the given cell offsets"""
+        self.beginResetModel()
+        self.hive = hive
+        self.offset = offset
+        self.offsets = ()
+        self.rows = []
+        self.key_highlights = self.highlights.get((hive, offset), {})
+        if hive is not None:
+            if offsets is not None:
+                self.offsets = offsets
+            else:
+                try:
+                    self.offsets = regf.value_offsets(regf.buffer(hive), offset)
+                except (Registry.RegistryParse.ParseException, struct.error):
+                    pass
+            self.rows = [None] * len(self.offsets)
+        self.endResetModel()
+
+    def remove_hive(self, hive: Registry.Registry):
+        """Drop the cached values of a hive that is being closed"""
+        self.cache.remove_hive(hive)
+        for highlight_key in [k for k in self.highlights if k[0] is hive]:
+            del self.highlights[highlight_key]
+
+    def value(self, row: int) -> Registry.RegistryValue:
+        """Open the python-registry value of a row"""
+        return regf.open_value(self.hive, regf.cell_data_offset(self.offsets[row]))
+
+    def row_data(self, row: int) -> value_cache.ValueData:
+        """Returns the decoded fields of a row, decoding them on first use"""
+        if self.rows[row] is None:
+            try:
+                self.rows[row] = self.cache.formatted(self.hive, regf.cell_data_offset(self.offsets[row]))
+            except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError):
+                self.rows[row] = value_cache.ValueData("(invalid value)", -1, b"", "", True)
+        return self.rows[row]
+
+    def reader(self, row: int) -> "bytes | regf.DataReader":
+        """Returns the data of a row, as a reader that reads it on demand if it is too large to be kept"""
+        return self.cache.reader(self.hive, regf.cell_data_offset(self.offsets[row]))
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.offsets)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return 3
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        if role == QtCore.Qt.ItemDataRole.DisplayRole:
+            value = self.row_data(index.row())
+            if index.column() == 0:
+                return value.name
+            if index.column() == 1:
+                return formatting.reg_type_to_str(value.datatype)
+            if index.column() == 2:
+                return value.data
+
+        if role == QtCore.Qt.ItemDataRole.DecorationRole and index.column() == 0:
+            return self.table.get_icon(self.row_data(index.row()).datatype)
+
+        if role == QtCore.Qt.ItemDataRole.FontRole and index.column() == 2:
+            if self.row_data(index.row()).empty:
+                return self.empty_font
+
+        if role == QtCore.Qt.ItemDataRole.BackgroundRole and self.key_highlights:
+            return self.key_highlights.get(self.row_data(index.row()).name.lower())
 
-        self.raw_data = raw_data
-        self.value = value
+        return None
 
+    def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.ItemDataRole.DisplayRole):
+        if orientation == QtCore.Qt.Orientation.Horizontal and role == QtCore.Qt.ItemDataRole.DisplayRole:
+            return ["Name", "Type", "Data"][section]
+        return None
 
-class ValueTable(QtWidgets.QTableWidget):
+
+class ValueTable(QtWidgets.QTableView):
     """Value table that shows the values of the selected registry key"""
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.setColumnCount(3)
-        self.setHorizontalHeaderLabels(["Name", "Type", "Data"])
+        self.value_model = ValueTableModel(self, self)
+        self.setModel(self.value_model)
         self.horizontalHeader().setStretchLastSection(True)
         self.setColumnWidth(0, 180)
         self.setColumnWidth(1, 120)
@@ -30,10 +129,10 @@ class ValueTable(QtWidgets.QTableWidget):
             QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
         self.setSelectionBehavior(
             QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
-        self.data = None
         self.verticalHeader().setVisible(False)
+        # Rows all have the same height, so size them once rather than measuring every row
+        self.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.ResizeMode.Fixed)
         self.horizontalHeader().setDefaultAlignment(QtCore.Qt.AlignmentFlag.AlignLeft)
-        self.resizeRowsToContents()
         self.setAutoScroll(False)
         self.setVerticalScrollMode(
             QtWidgets.QAbstractItemView.ScrollMode.ScrollPerPixel)
@@ -45,139 +144,84 @@ class ValueTable(QtWidgets.QTableWidget):
 
         self.selectionModel().selectionChanged.connect(self.handle_selection_change)
 
-        self.REG_BIN_ICON = QtGui.QIcon(
-            helpers.resource_path("img/reg_bin.png"))
-        self.REG_NUM_ICON = QtGui.QIcon(
-            helpers.resource_path("img/reg_num.png"))
-        self.REG_STR_ICON = QtGui.QIcon(
-            helpers.resource_path("img/reg_str.png"))
+        # Type icons by image name, loaded the first time a value of the type is shown
+        self.icons: "dict[str, QtGui.QIcon]" = {}
 
     def handle_selection_change(self, selected: QtCore.QItemSelection, deselected: QtCore.QItemSelection):
         if len(selected.indexes()) < 1:
             return
 
-        index = selected.indexes()[2]
-
-        value: ValueData = self.itemFromIndex(index)
-        self.window().data_viewer.set_value(value.raw_data)
-
-    def set_data(self, reg_values: "list[Registry.RegistryValue]"):
-        self.clearContents()
-        self.setRowCount(0)
-        self.window().data_viewer.set_value(b"")
-
-        for value in reg_values:
-            index = self.rowCount()
-            self.insertRow(index)
-            value_name = QtWidgets.QTableWidgetItem(value.name())
-            value_name.setFlags(value_name.flags() & ~
-                                QtCore.Qt.ItemFlag.ItemIsEditable)
-            value_name.setIcon(self.get_icon(value.value_type()))
-            value_type = QtWidgets.QTableWidgetItem(
-                self.reg_type_to_str(value.value_type()))
-            value_type.setFlags(value_type.flags() & ~
-                                QtCore.Qt.ItemFlag.ItemIsEditable)
-            value_data = ValueData(value.raw_data(), value.value(), self.reg_data_to_str(
-                value.value_type(), value.raw_data(), value.value()))
-            if len(value.raw_data()) == 0:
-                font = QtGui.QFont()
-                font.setItalic(True)
-                value_data.setFont(font)
-            value_data.setFlags(value_data.flags() & ~
-                                QtCore.Qt.ItemFlag.ItemIsEditable)
-            self.setItem(index, 0, value_name)
-            self.setItem(index, 1, value_type)
-            self.setItem(index, 2, value_data)
-
-        self.resizeRowsToContents()
+        row = selected.indexes()[0].row()
 
-    def get_icon(self, datatype: int) -> QtGui.QIcon:
-        if datatype == Registry.RegBin:
-            return self.REG_BIN_ICON
-        if datatype == Registry.RegDWord:
-            return self.REG_NUM_ICON
-        if datatype == Registry.RegQWord:
-            return self.REG_NUM_ICON
-        if datatype == Registry.RegBigEndian:
-            return self.REG_NUM_ICON
-        if datatype == Registry.RegExpandSZ:
-            return self.REG_STR_ICON
-        if datatype == Registry.RegLink:
-            return self.REG_STR_ICON
-        if datatype == Registry.RegMultiSZ:
-            return self.REG_STR_ICON
-        if datatype == Registry.RegNone:
-            return self.REG_NUM_ICON
-        if datatype == Registry.RegResourceList:
-            return self.REG_STR_ICON
-        if datatype == Registry.RegSZ:
-            return self.REG_STR_ICON
-        return self.REG_BIN_ICON
+        try:
+            data = self.value_model.reader(row)
+        except (Registry.RegistryParse.RegistryException, struct.error, UnicodeDecodeError):
+            data = b""
+        self.window().data_viewer.set_value(data)
+
+    def set_data(self, hive: Registry.Registry = None, offset: int = None, offsets: "list[int]" = None):
+        """Show the values of the key at offset in hive, or clear the table if hive is None.
+
+        offsets are the cell offsets of the values to show instead of the ones in the key's value list."""
+        with profiling.span("set_data") as span:
+            self.window().data_viewer.set_value(b"")
+            self.value_model.set_key(hive, offset, offsets)
+            span.add(values=len(self.value_model.offsets))
+
+            if self.value_model.rowCount() > 0:
+                self.verticalHeader().setDefaultSectionSize(self.sizeHintForRow(0))
 
-    def reg_type_to_str(self, datatype: int) -> str:
+    def remove_hive(self, hive: Registry.Registry):
+        """Forget everything cached for a hive that is being closed"""
+        self.value_model.remove_hive(hive)
+
+    def set_highlights(self, highlights: "dict[tuple, dict[str, QtGui.QColor]]"):
+        """Color the background of values, by lowercase name, by (hive, nk record offset) of their key"""
+        model = self.value_model
+        model.highlights = highlights
+        model.key_highlights = highlights.get((model.hive, model.offset), {})
+        self.viewport().update()
+
+    def icon(self, name: str) -> QtGui.QIcon:
+        if name not in self.icons:
+            self.icons[name] = QtGui.QIcon(
+                helpers.resource_path(f"img/{name}.png"))
+        return self.icons[name]
+
+    def get_icon(self, datatype: int) -> QtGui.QIcon:
         if datatype == Registry.RegBin:
-            return "REG_BINARY"
+            return self.icon("reg_bin")
         if datatype == Registry.RegDWord:
-            return "REG_DWORD"
+            return self.icon("reg_num")
         if datatype == Registry.RegQWord:
-            return "REG_QWORD"
+            return self.icon("reg_num")
         if datatype == Registry.RegBigEndian:
-            return "REG_DWORD_BIG_ENDIAN"
+            return self.icon("reg_num")
         if datatype == Registry.RegExpandSZ:
-            return "REG_EXPAND_SZ"
+            return self.icon("reg_str")
         if datatype == Registry.RegLink:
-            return "REG_LINK"
+            return self.icon("reg_str")
         if datatype == Registry.RegMultiSZ:
-            return "REG_MULTI_SZ"
+            return self.icon("reg_str")
         if datatype == Registry.RegNone:
-            return "REG_NONE"
+            return self.icon("reg_num")
         if datatype == Registry.RegResourceList:
-            return "REG_RESOURCE_LIST"
+            return self.icon("reg_str")
         if datatype == Registry.RegSZ:
-            return "REG_SZ"
-        return "UNKNOWN"
-
-    def reg_data_to_str(self, datatype: int, raw_data: bytes, value) -> str:
-        if len(raw_data) == 0:
-            return "(value not set)"
-        if datatype == Registry.RegDWord:
-            try:
-                return "{0:#010x} ({0})".format(value)
-            except (struct.error, IndexError):
-                pass
-        if datatype == Registry.RegQWord:
-            try:
-                return "{0:#018x} ({0})".format(value)
-            except (struct.error, IndexError):
-                pass
-        if datatype == Registry.RegBigEndian:
-            try:
-                return "{0:#010x} ({0})".format(value)
-            except (struct.error, IndexError):
-                pass
-        if datatype == Registry.RegLink:
-            # Not sure what format this will actually be
-            return str(value)
-        if datatype == Registry.RegMultiSZ:
-            return " ".join(value)
-        if datatype == Registry.RegResourceList:
-            # Not sure what format this will actually be
-            return str(value)
-        if datatype == Registry.RegSZ or datatype == Registry.RegExpandSZ:
-            return value
-        else:
-            return " ".join(["{:02x}".format(x) for x in raw_data])
+            return self.icon("reg_str")
+        return self.icon("reg_bin")
 
     def select_value(self, value: str):
-        for i in range(self.rowCount()):
-            if (value == self.item(i, 0).text()):
+        for i in range(self.value_model.rowCount()):
+            if (value == self.value_model.row_data(i).name):
                 self.clearSelection()
                 self.selectRow(i)
-                self.scrollToItem(self.item(i, 0))
+                self.scrollTo(self.value_model.index(i, 0))
                 self.setFocus()
 
     def get_selected_row(self):
-        if len(self.selectedItems()) > 0:
-            return self.selectedItems()[0].row()
+        selected = self.selectionModel().selectedRows()
+        if len(selected) > 0:
+            return selected[0].row()
         else:
             return -1
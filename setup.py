@@ -29,7 +29,10 @@ setup(
     python_requires=">=3.8",
     install_requires=["PySide6>=6.5", "python-registry>=1.3.1"],
     entry_points={
-        "console_scripts": ["registryspy=registryspy.registryspy:main"],
+        "console_scripts": [
+            "registryspy=registryspy.registryspy:main",
+            "registryspy-cli=registryspy.cli:main",
+        ],
     },
     include_package_data=True,
 )
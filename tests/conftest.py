@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# The hives the tests read are written by the benchmarks' generator
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks"))
+
+import regf_generator  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def write_hive(tmp_path_factory):
+    """Returns a function that generates a hive of a shape and returns its filename"""
+    directory = tmp_path_factory.mktemp("hives")
+
+    def write(name: str, shape: regf_generator.HiveShape) -> str:
+        return regf_generator.write_hive(str(directory / f"{name}.hiv"), shape)
+
+    return write
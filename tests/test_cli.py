@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import regf_generator
+
+SHAPE = regf_generator.HiveShape(depth=2, fanout=3, values_per_key=3)
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_cli(*args: str) -> subprocess.CompletedProcess:
+    """Run the command-line interface in a new interpreter that lists every module it imports on stderr"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO, os.environ.get("PYTHONPATH")])),
+               PYTHONIOENCODING="utf-8")
+    return subprocess.run([sys.executable, "-X", "importtime", "-m", "registryspy.cli", *args],
+                          capture_output=True, text=True, encoding="utf-8", env=env, cwd=REPO)
+
+
+def imported_modules(result: subprocess.CompletedProcess) -> "set[str]":
+    # Lines of -X importtime end with the module name, indented by its depth in the import tree
+    return {line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines()
+            if line.startswith("import time:")}
+
+
+def test_commands_do_not_load_qt(write_hive):
+    filename = write_hive("cli", SHAPE)
+
+    ls = run_cli("ls", filename)
+    assert ls.returncode == 0, ls.stderr
+    assert ls.stdout.splitlines() == ["Key1_00000", "Key1_00001", "Key1_00002"]
+
+    cat = run_cli("cat", filename, "Key1_00001")
+    assert cat.returncode == 0, cat.stderr
+    assert [line.split("\t")[0] for line in cat.stdout.splitlines()] == ["Value0", "Value1", "Value2"]
+
+    find = run_cli("find", "Key2_00002", filename, "--keys")
+    assert find.returncode == 0, find.stderr
+    assert len(find.stdout.splitlines()) == SHAPE.fanout
+
+    for result in (ls, cat, find):
+        modules = imported_modules(result)
+        assert "registryspy.search" in modules
+        assert not any(module.split(".")[0] == "PySide6" for module in modules)
@@ -0,0 +1,69 @@
+import regf_generator
+from Registry import Registry
+
+from registryspy import diff
+from registryspy import regf
+
+SHAPE = regf_generator.HiveShape(depth=3, fanout=4, values_per_key=3)
+# The key whose value is changed, three levels down
+CHANGED_PATH = "Key1_00001\\Key2_00002\\Key3_00003"
+
+
+def compare(old_filename: str, new_filename: str) -> "tuple[list[diff.Change], int]":
+    """Returns the changes between two hives and the number of keys that were compared"""
+    old_hive = regf.open_hive(old_filename)
+    new_hive = regf.open_hive(new_filename)
+    compared = []
+    changes = list(diff.diff(old_hive, diff.hash_hive(old_hive), new_hive, diff.hash_hive(new_hive),
+                             progress=compared.append))
+    return changes, compared[-1]
+
+
+def test_identical_hives(write_hive):
+    changes, compared = compare(write_hive("old", SHAPE), write_hive("new", SHAPE))
+    assert changes == []
+    assert compared == 0
+
+
+def test_only_changed_branch_is_compared(write_hive, tmp_path):
+    old_filename = write_hive("old", SHAPE)
+    hive = regf.open_hive(old_filename)
+    value = next(value for value in hive.open(CHANGED_PATH).values()
+                 if value.value_type() == Registry.RegDWord)
+    data = bytearray(regf.buffer(hive))
+    # DWORD data is stored in place of the data offset
+    offset = regf.value_offset(value) + 0x8
+    data[offset:offset + 4] = (value.value() + 1).to_bytes(4, "little")
+    new_filename = str(tmp_path / "new.hiv")
+    with open(new_filename, "wb") as f:
+        f.write(data)
+
+    changes, compared = compare(old_filename, new_filename)
+    assert [(change.change_type, change.path, change.value) for change in changes] == [
+        (diff.ChangeType.MODIFIED, CHANGED_PATH, None),
+        (diff.ChangeType.MODIFIED, CHANGED_PATH, value.name()),
+    ]
+    # The root and the keys above the changed key, out of 85
+    assert compared == 4
+
+
+def test_added_and_removed_keys(write_hive, tmp_path):
+    old_filename = write_hive("old", SHAPE)
+    hive = regf.open_hive(old_filename)
+    buf = regf.buffer(hive)
+    parent = hive.open("Key1_00001")._nkrecord.offset()
+    data = bytearray(buf)
+    # Drop the last entry of the key's subkey list, leaving its subkey out of the tree
+    list_offset = regf.cell_data_offset(int.from_bytes(buf[parent + 0x1C:parent + 0x20], "little"))
+    data[list_offset + 0x2:list_offset + 0x4] = (SHAPE.fanout - 1).to_bytes(2, "little")
+    new_filename = str(tmp_path / "new.hiv")
+    with open(new_filename, "wb") as f:
+        f.write(data)
+
+    # Keys below a removed key aren't reported on their own
+    removed, _ = compare(old_filename, new_filename)
+    assert [(change.change_type, change.path) for change in removed] == [
+        (diff.ChangeType.REMOVED, "Key1_00001\\Key2_00003")]
+    added, _ = compare(new_filename, old_filename)
+    assert [(change.change_type, change.path) for change in added] == [
+        (diff.ChangeType.ADDED, "Key1_00001\\Key2_00003")]
@@ -0,0 +1,82 @@
+import csv
+import json
+import os
+
+import regf_generator
+from Registry import Registry
+
+from registryspy import export
+from registryspy import formatting
+from registryspy import regf
+
+SHAPE = regf_generator.HiveShape(depth=2, fanout=3, values_per_key=5, value_sizes=(4, 64, 512))
+# The key whose first subkey is replaced by the root, which is its parent
+CYCLE_PATH = "Key1_00001"
+
+
+def walk(key: Registry.RegistryKey) -> "list[tuple]":
+    """Returns the records of a key and everything below it, read through python-registry"""
+    timestamp = key.timestamp().isoformat()
+    rows = [(key.path(), timestamp, None, None, None, None)]
+    for value in key.values():
+        rows.append((key.path(), timestamp, value.name(), formatting.reg_type_to_str(value.value_type()),
+                     formatting.format_value(value)[0], value.raw_data().hex()))
+    for subkey in key.subkeys():
+        rows.extend(walk(subkey))
+    return rows
+
+
+def test_jsonl_and_csv_match_the_hive(write_hive, tmp_path):
+    hive = regf.open_hive(write_hive("export", SHAPE))
+    expected = walk(hive.root())
+    assert len(expected) == SHAPE.key_count() * (1 + SHAPE.values_per_key)
+
+    jsonl_filename = str(tmp_path / "hive.jsonl")
+    assert export.export_file(jsonl_filename, hive, export_format="jsonl")
+    with open(jsonl_filename, encoding="utf-8") as f:
+        rows = [tuple(json.loads(line)[field] for field in export.FIELDS) for line in f]
+    assert rows == expected
+
+    csv_filename = str(tmp_path / "hive.csv")
+    assert export.export_file(csv_filename, hive, export_format="csv")
+    with open(csv_filename, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == export.FIELDS
+    assert rows[1:] == [["" if field is None else field for field in row] for row in expected]
+
+
+def test_subkey_cycle_is_not_followed(write_hive, tmp_path):
+    hive = regf.open_hive(write_hive("export", SHAPE))
+    buf = regf.buffer(hive)
+    parent = hive.open(CYCLE_PATH)._nkrecord.offset()
+    data = bytearray(buf)
+    # Point the first entry of the key's lh list back at the root
+    list_offset = regf.cell_data_offset(int.from_bytes(buf[parent + 0x1C:parent + 0x20], "little"))
+    root_cell = regf.root_offset(hive) - regf.cell_data_offset(0)
+    data[list_offset + 0x4:list_offset + 0x8] = root_cell.to_bytes(4, "little")
+    filename = str(tmp_path / "cycle.hiv")
+    with open(filename, "wb") as f:
+        f.write(data)
+
+    cycle_hive = regf.open_hive(filename)
+    paths = [row[0] for row in export.records(cycle_hive) if row[2] is None]
+    # Every key once, except the subkey that the root took the place of
+    assert len(paths) == len(set(paths)) == SHAPE.key_count() - 1
+    cycle_path = cycle_hive.root().path() + "\\" + CYCLE_PATH
+    assert cycle_path + "\\Key2_00000" not in paths
+    assert cycle_path + "\\Key2_00001" in paths
+
+
+def test_cancelled_export_removes_the_file(write_hive, tmp_path):
+    hive = regf.open_hive(write_hive("export", SHAPE))
+    filename = str(tmp_path / "cancelled.jsonl")
+    checks = []
+
+    def cancelled() -> bool:
+        checks.append(None)
+        return len(checks) > 3
+
+    assert not export.export_file(filename, hive, export_format="jsonl", cancelled=cancelled)
+    # Stopped after the fourth key rather than going through the rest of the hive
+    assert len(checks) < SHAPE.key_count()
+    assert not os.path.exists(filename)
@@ -0,0 +1,75 @@
+import re
+import struct
+
+import pytest
+from Registry import Registry
+
+from registryspy import matching
+
+
+def test_string_data_is_searched_as_utf16():
+    raw = "Hello World\x00".encode("utf-16le")
+    assert matching.Matcher("world").match_data(Registry.RegSZ, raw)
+    assert not matching.Matcher("world", case_sensitive=True).match_data(Registry.RegSZ, raw)
+    assert matching.Matcher("World", case_sensitive=True).match_data(Registry.RegSZ, raw)
+    assert matching.Matcher("hello world", exact_match=True).match_data(Registry.RegSZ, raw)
+    assert not matching.Matcher("hello", exact_match=True).match_data(Registry.RegSZ, raw)
+
+
+def test_string_data_ends_at_its_null():
+    raw = "visible\x00hidden\x00".encode("utf-16le")
+    assert not matching.Matcher("hidden").match_data(Registry.RegSZ, raw)
+    assert matching.Matcher("hidden").match_data(Registry.RegMultiSZ, raw)
+
+
+def test_utf16_matches_start_on_a_character():
+    # "ab" in UTF-16LE only appears one byte into the data
+    raw = b"\x41" + "ab".encode("utf-16le") + b"\x00"
+    assert not matching.Matcher("ab").match_data(Registry.RegMultiSZ, raw)
+    # Binary data is searched at either byte
+    assert matching.Matcher("ab").match_data(Registry.RegBin, raw)
+
+
+def test_binary_data_is_searched_as_hex():
+    raw = b"\x01\xde\xad\xbe\xef\x02"
+    assert matching.Matcher("DE AD BE").match_data(Registry.RegBin, raw)
+    assert matching.Matcher("deadbeef").match_data(Registry.RegBin, raw)
+    assert not matching.Matcher("AD DE").match_data(Registry.RegBin, raw)
+
+
+def test_binary_data_is_searched_as_ansi():
+    raw = b"\x00\x00caf\xe9 au lait\x00"
+    assert matching.Matcher("café").match_data(Registry.RegBin, raw)
+    assert matching.Matcher("AU LAIT").match_data(Registry.RegBin, raw)
+    assert matching.Matcher("au lait", exact_match=True).match_data(Registry.RegBin, b"au lait")
+
+
+def test_numbers_are_matched_as_shown():
+    raw = struct.pack("<I", 42)
+    assert matching.Matcher("42").match_data(Registry.RegDWord, raw)
+    assert matching.Matcher("0x0000002a").match_data(Registry.RegDWord, raw)
+    assert matching.Matcher("0x0000002a (42)", exact_match=True).match_data(Registry.RegDWord, raw)
+    assert not matching.Matcher("42", exact_match=True).match_data(Registry.RegDWord, raw)
+
+
+def test_empty_data_matches_value_not_set():
+    assert matching.Matcher("not set").match_data(Registry.RegBin, b"")
+    assert not matching.Matcher("00").match_data(Registry.RegBin, b"")
+
+
+def test_regular_expressions():
+    assert matching.Matcher(r"v\d+\.\d", regex=True).match_text("Build v10.2")
+    assert matching.Matcher(r"v\d+", regex=True, exact_match=True).match_text("v10")
+    assert not matching.Matcher(r"v\d+", regex=True, exact_match=True).match_text("v10.2")
+    assert matching.Matcher(r"build \d+", regex=True).match_data(
+        Registry.RegSZ, "Build 19045\x00".encode("utf-16le"))
+    assert matching.Matcher(r"MZ.\x00", regex=True).match_data(Registry.RegBin, b"\x00MZ\x90\x00\x03")
+    with pytest.raises(re.error):
+        matching.Matcher("(unclosed", regex=True)
+
+
+def test_filetime_data_is_searched_as_date_and_hex():
+    raw = bytes.fromhex("00 80 3e d5 de b1 9d 01")
+    assert matching.Matcher("3e d5 de").match_data(Registry.RegFileTime, raw)
+    assert matching.Matcher("1970-01-01").match_data(Registry.RegFileTime, raw)
+    assert not matching.Matcher("3e de").match_data(Registry.RegFileTime, raw)
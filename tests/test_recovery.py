@@ -0,0 +1,42 @@
+import regf_generator
+
+from registryspy import recovery
+from registryspy import regf
+
+SHAPE = regf_generator.HiveShape(depth=2, fanout=6, values_per_key=2, deleted_every=3)
+
+
+def test_scan_finds_deleted_keys(write_hive):
+    hive = regf.open_hive(write_hive("deleted", SHAPE))
+    found = recovery.scan(hive)
+    buf = regf.buffer(hive)
+    names = {regf.key_name(buf, regf.cell_data_offset(cell)) for cell in found.subkey_offsets(recovery.ROOT)}
+    assert names == {f"Deleted{index}" for index in range(3, SHAPE.key_count() + 1, 3)}
+    for cell in found.subkey_offsets(recovery.ROOT):
+        offset = regf.cell_data_offset(cell)
+        children = [regf.key_name(buf, regf.cell_data_offset(child)) for child in found.subkey_offsets(offset)]
+        assert children == [regf.key_name(buf, offset) + "Child"]
+        assert [regf.value_name(buf, regf.cell_data_offset(value))
+                for value in found.value_offsets(offset)] == ["DeletedValue"]
+        assert found.location(offset) is not None
+    orphans = [regf.value_name(buf, regf.cell_data_offset(value)) for value in found.value_offsets(recovery.ROOT)]
+    assert orphans == ["OrphanedValue"] * len(names)
+
+
+def test_scan_cell_on_chunk_boundary(write_hive, monkeypatch):
+    """A free cell starting exactly where a chunk ends is found once, by the next chunk"""
+    hive = regf.open_hive(write_hive("deleted", SHAPE))
+    expected = recovery.scan(hive)
+    # A deleted key and an orphaned value, which would be listed twice if found by both chunks
+    for cell in (expected.subkey_offsets(recovery.ROOT)[0], expected.value_offsets(recovery.ROOT)[0]):
+        monkeypatch.setattr(recovery, "CHUNK_SIZE", cell)
+        found = recovery.scan(hive)
+        assert found.subkeys == expected.subkeys
+        assert found.values == expected.values
+
+
+def test_free_cells_stop_is_exclusive():
+    buf = bytes(16) + b"\x20\x00\x00\x00vk" + bytes(26)
+    cell = 16
+    assert recovery.free_cells(buf, recovery.VK_NEEDLE, 0, cell, len(buf)) == []
+    assert recovery.free_cells(buf, recovery.VK_NEEDLE, cell, len(buf), len(buf)) == [cell]
@@ -0,0 +1,90 @@
+import pytest
+import regf_generator
+
+from registryspy import regf
+
+
+@pytest.mark.parametrize("list_type", regf_generator.LIST_TYPES)
+def test_subkey_records(write_hive, list_type):
+    """Subkeys decoded from each kind of subkey list match python-registry's"""
+    shape = regf_generator.HiveShape(depth=2, fanout=40, values_per_key=0, list_type=list_type, ri_chunk=16)
+    hive = regf.open_hive(write_hive(f"subkeys_{list_type}", shape))
+    buf = regf.buffer(hive)
+    root = regf.root_offset(hive)
+
+    records = regf.subkey_records(buf, root)
+    subkeys = hive.root().subkeys()
+    assert [record.offset for record in records] == [subkey._nkrecord.offset() for subkey in subkeys]
+    assert [record.name for record in records] == [subkey.name() for subkey in subkeys]
+    assert [record.subkey_count for record in records] == [subkey.subkeys_number() for subkey in subkeys]
+    assert [regf.filetime_to_datetime(record.timestamp) for record in records] == [
+        subkey.timestamp() for subkey in subkeys]
+    assert [record.offset for record in regf.subkey_records(buf, root, 10, 20)] == [
+        record.offset for record in records[10:20]]
+
+
+def test_subkey_records_of_damaged_list(write_hive):
+    hive = regf.open_hive(write_hive("subkeys_damaged", regf_generator.HiveShape(depth=1, fanout=3, values_per_key=0)))
+    data = bytearray(regf.buffer(hive))
+    root = regf.root_offset(hive)
+    first = regf.cell_data_offset(regf.subkey_offsets(data, root)[0])
+    data[first:first + 2] = b"xx"
+    records = regf.subkey_records(data, root)
+    assert records[0] is None
+    assert [record.name for record in records[1:]] == ["Key1_00001", "Key1_00002"]
+
+
+# Big data values span two full segments and a few bytes of a third
+BIG_DATA_SIZE = 2 * regf.BIG_DATA_SEGMENT_SIZE + 3
+
+
+@pytest.fixture(scope="module")
+def big_values(tmp_path_factory):
+    """Returns a hive with big data values and the vk record offsets and python-registry data of its values"""
+    shape = regf_generator.HiveShape(depth=1, fanout=1, values_per_key=8, value_sizes=(0, 64, 2048),
+                                     big_data_every=2, big_data_size=BIG_DATA_SIZE)
+    hive = regf.open_hive(regf_generator.write_hive(str(tmp_path_factory.mktemp("hives") / "big.hiv"), shape))
+    values = [(regf.value_offset(value), value.raw_data()) for value in hive.root().subkeys()[0].values()]
+    return hive, values
+
+
+def test_reader_reads_whole_values(big_values):
+    hive, values = big_values
+    assert any(len(raw) == BIG_DATA_SIZE for _, raw in values)
+    for offset, raw in values:
+        if len(raw) <= 4:
+            # python-registry pads data stored in the vk record, which the reader doesn't
+            continue
+        reader = regf.value_reader(regf.buffer(hive), offset)
+        assert len(reader) == len(raw)
+        assert reader.read() == raw
+        assert reader.read() == b""
+        assert regf.value_data(regf.buffer(hive), offset) == raw
+
+
+def test_reader_slices_across_segments(big_values):
+    hive, values = big_values
+    offset, raw = next(value for value in values if len(value[1]) == BIG_DATA_SIZE)
+    reader = regf.value_reader(regf.buffer(hive), offset)
+    boundary = regf.BIG_DATA_SEGMENT_SIZE
+    for start, stop in [(0, 16), (boundary - 3, boundary + 3), (boundary - 1, 2 * boundary + 1),
+                        (0, len(raw)), (-5, None), (None, -boundary), (len(raw) - 2, len(raw) + 10), (10, 5)]:
+        assert reader[start:stop] == raw[start:stop]
+    assert reader[boundary - 8:boundary + 8:3] == raw[boundary - 8:boundary + 8:3]
+    assert reader[boundary] == raw[boundary]
+    assert reader[-1] == raw[-1]
+    with pytest.raises(IndexError):
+        reader[len(raw)]
+
+
+def test_reader_seeks(big_values):
+    hive, values = big_values
+    offset, raw = next(value for value in values if len(value[1]) == BIG_DATA_SIZE)
+    reader = regf.value_reader(regf.buffer(hive), offset)
+    reader.seek(regf.BIG_DATA_SEGMENT_SIZE - 2)
+    assert reader.read(4) == raw[regf.BIG_DATA_SEGMENT_SIZE - 2:regf.BIG_DATA_SEGMENT_SIZE + 2]
+    assert reader.tell() == regf.BIG_DATA_SEGMENT_SIZE + 2
+    reader.seek(-2, 1)
+    assert reader.read(2) == raw[regf.BIG_DATA_SEGMENT_SIZE:regf.BIG_DATA_SEGMENT_SIZE + 2]
+    reader.seek(-3, 2)
+    assert reader.read() == raw[-3:]
@@ -0,0 +1,50 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+import pytest
+import regf_generator
+
+from registryspy import regf
+from registryspy import search
+
+SHAPE = regf_generator.HiveShape(depth=2, fanout=3, values_per_key=2)
+
+
+def mapped(pid: int, filename: str) -> bool:
+    """Whether a process has a file mapped"""
+    with open(f"/proc/{pid}/maps") as f:
+        return any(line.rstrip("\n").endswith(filename) for line in f)
+
+
+def test_evicted_hive_is_closed(write_hive, monkeypatch):
+    monkeypatch.setattr(search, "HIVE_CACHE_SIZE", 1)
+    monkeypatch.setattr(search, "_hives", search._hives.__class__())
+    first = search._open_hive(write_hive("first", SHAPE))
+    search._open_hive(write_hive("second", SHAPE))
+    assert regf.buffer(first).closed
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc")
+def test_pool_releases_hive_on_shutdown(write_hive, tmp_path):
+    filename = str(tmp_path / "searched.hiv")
+    os.rename(write_hive("searched", SHAPE), filename)
+    context = multiprocessing.get_context("spawn")
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=1, mp_context=context, initializer=search.init_pool_process,
+        initargs=(context.Event(), context.Array("q", 2)))
+    try:
+        job = search.SearchJob(filename, "", True)
+        results = pool.submit(search.run_job, job, "Key2_00001", False, False, False,
+                              True, False, False).result()
+        assert len(results) > 0
+        pid = pool.submit(os.getpid).result()
+        # The process keeps the hive mapped for the next search
+        assert mapped(pid, filename)
+    finally:
+        pool.shutdown(wait=True)
+
+    renamed = filename + ".old"
+    os.rename(filename, renamed)
+    os.remove(renamed)
+    assert not os.path.exists(f"/proc/{pid}") or not mapped(pid, renamed)
@@ -0,0 +1,109 @@
+import os
+import shutil
+
+import pytest
+import regf_generator
+from Registry import Registry
+
+from registryspy import matching
+from registryspy import regf
+from registryspy import search
+from registryspy import search_index
+
+SHAPE = regf_generator.HiveShape(depth=3, fanout=4, values_per_key=3)
+MID_TREE_PATH = "Key1_00001\\Key2_00002"
+
+
+@pytest.fixture
+def hive_file(write_hive, tmp_path) -> str:
+    """A generated hive in its own directory, so that its saved index doesn't outlive the test"""
+    filename = str(tmp_path / "hive.hiv")
+    shutil.copyfile(write_hive("search_index", SHAPE), filename)
+    return filename
+
+
+def binary_text(hive: Registry.Registry, encode) -> str:
+    """Returns a three byte run of some binary data, as text made by encode"""
+    for key in [hive.root()] + hive.root().subkeys():
+        for value in key.values():
+            raw = value.raw_data()
+            if value.value_type() != Registry.RegBin:
+                continue
+            for i in range(len(raw) - 2):
+                text = encode(raw[i:i + 3])
+                if text is not None:
+                    return text
+    raise AssertionError("No binary data to take a term from")
+
+
+def non_ascii(chunk: bytes) -> str:
+    """Decode three ANSI letters of which at least one is outside ASCII"""
+    text = chunk.decode("windows-1252", "replace")
+    if text.isalpha() and not text.isascii():
+        return text
+    return None
+
+
+def matches(hive: Registry.Registry, term: str, index: search_index.SearchIndex = None, path: str = "",
+            start_at_value=0) -> list:
+    starting_key = hive.open(path) if path else hive.root()
+    return list(search.Search(matching.Matcher(term)).matches(
+        hive, starting_key, start_at_value=start_at_value, include_start=not path, index=index))
+
+
+def test_indexed_search_finds_the_same_matches(hive_file):
+    hive = regf.open_hive(hive_file)
+    index = search_index.build_index(hive_file, hive)
+    terms = ["ke", "Key2_00001", "value1", "data 5.1", "item3",
+             binary_text(hive, lambda chunk: chunk.hex(" ")),
+             binary_text(hive, non_ascii)]
+    for term in terms:
+        expected = matches(hive, term)
+        assert len(expected) > 0, term
+        assert matches(hive, term, index) == expected, term
+        # Starting in the middle of the tree, after the first value of the starting key
+        assert matches(hive, term, index, MID_TREE_PATH, 1) == matches(hive, term, None, MID_TREE_PATH, 1), term
+
+
+def test_saved_index_loads_back(hive_file):
+    hive = regf.open_hive(hive_file)
+    index = search_index.build_index(hive_file, hive)
+    search_index.save_index(hive_file, index)
+    assert os.path.exists(hive_file + search_index.SIDECAR_EXTENSION)
+
+    loaded = search_index.load_index(hive_file, hive)
+    assert loaded is not None
+    assert loaded.kinds == index.kinds
+    assert loaded.key_offsets == index.key_offsets
+    assert loaded.value_indexes == index.value_indexes
+    assert loaded.postings == index.postings
+    assert loaded.key_positions == index.key_positions
+    assert matches(hive, "Key2_00001", loaded) == matches(hive, "Key2_00001")
+
+
+def test_stale_index_is_not_loaded(hive_file):
+    hive = regf.open_hive(hive_file)
+    search_index.save_index(hive_file, search_index.build_index(hive_file, hive))
+    stat = os.stat(hive_file)
+    assert search_index.load_index(hive_file, hive) is not None
+
+    os.utime(hive_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert search_index.load_index(hive_file, hive) is None
+
+    # Only the header sequence numbers change, the size and modification time are put back
+    with open(hive_file, "r+b") as f:
+        f.seek(4)
+        f.write(b"\x02\x00\x00\x00\x02\x00\x00\x00")
+    os.utime(hive_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert search_index.load_index(hive_file, regf.open_hive(hive_file)) is None
+
+    with open(hive_file, "r+b") as f:
+        f.seek(4)
+        f.write(b"\x01\x00\x00\x00\x01\x00\x00\x00")
+    os.utime(hive_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert search_index.load_index(hive_file, regf.open_hive(hive_file)) is not None
+
+    with open(hive_file, "ab") as f:
+        f.write(bytes(0x1000))
+    os.utime(hive_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert search_index.load_index(hive_file, regf.open_hive(hive_file)) is None
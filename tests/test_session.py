@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+
+import regf_generator
+
+from registryspy import key_tree
+from registryspy import regf
+from registryspy import session
+
+SHAPE = regf_generator.HiveShape(depth=2, fanout=3, values_per_key=1)
+
+
+def skeleton(filename: str, renamed: str) -> dict:
+    """Returns the skeleton of a hive's root and its subkeys, with the first subkey renamed so that a
+    restored skeleton can be told apart from a hive that was read again"""
+    hive = regf.open_hive(filename)
+    root = key_tree.load_root(filename, prefetch=SHAPE.fanout)
+    keys = [[root.offset, -1, root.name, root.num_subkeys, root.timestamp]]
+    keys.extend([child.offset, 0, child.name, child.num_subkeys, child.timestamp] for child in root.children)
+    keys[1][2] = renamed
+    return {"fingerprint": session.fingerprint(filename, hive), "keys": keys}
+
+
+def test_session_round_trip(tmp_path):
+    path = str(tmp_path / "saved" / ("work" + session.SESSION_EXTENSION))
+    state = {"hives": [{"filename": "C:\\Hives\\SOFTWARE", "expanded": [4128, 4256], "skeleton": None}],
+             "selected": {"filename": "C:\\Hives\\SOFTWARE", "offset": 4256, "value": "Välue"}}
+    session.save(path, state)
+    assert session.load(path) == dict(state, version=session.SESSION_VERSION)
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_other_versions_and_damaged_sessions_are_ignored(tmp_path):
+    path = str(tmp_path / ("other" + session.SESSION_EXTENSION))
+    assert session.load(path) is None
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": session.SESSION_VERSION + 1, "hives": []}, f)
+    assert session.load(path) is None
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"version": 1, "hives": [')
+    assert session.load(path) is None
+
+
+def test_skeleton_is_only_restored_for_the_same_hive(write_hive, tmp_path):
+    filename = str(tmp_path / "hive.hiv")
+    shutil.copyfile(write_hive("session", SHAPE), filename)
+    cached = skeleton(filename, "Cached")
+
+    root = key_tree.load_root(filename, skeleton=cached)
+    assert [child.name for child in root.children] == ["Cached", "Key1_00001", "Key1_00002"]
+    assert root.children[1].subkey_offsets() == regf.subkey_offsets(regf.buffer(root.hive), root.children[1].offset)
+
+    # Written to since the session was saved
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    root = key_tree.load_root(filename, skeleton=cached)
+    assert [child.name for child in root.children] == []
+    root.load()
+    assert root.name == "ROOT" and root.num_subkeys == SHAPE.fanout
+
+    # Saved by a version that cached different key metadata
+    cached = skeleton(filename, "Cached")
+    cached["fingerprint"]["version"] = session.SKELETON_VERSION + 1
+    assert key_tree.load_root(filename, skeleton=cached).children == []
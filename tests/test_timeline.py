@@ -0,0 +1,47 @@
+import regf_generator
+
+from registryspy import regf
+from registryspy import timeline
+
+SHAPE = regf_generator.HiveShape(depth=2, fanout=6, values_per_key=1)
+# Keys are written a second apart, in the order the generator writes them
+SECOND = 10_000_000
+
+
+def written(key: int) -> int:
+    """Returns the timestamp the generator gives the key it writes key-th, from 1"""
+    return regf_generator.BASE_FILETIME + key * SECOND
+
+
+def build(write_hive, name: str, shape=SHAPE) -> timeline.TimelineIndex:
+    return timeline.build_index(regf.open_hive(write_hive(name, shape)))
+
+
+def test_build_index(write_hive):
+    index = build(write_hive, "hive")
+    assert len(index) == SHAPE.key_count()
+    assert list(index.timestamps) == [written(key) for key in range(1, SHAPE.key_count() + 1)]
+    assert index.first() == written(1) and index.last() == written(SHAPE.key_count())
+
+
+def test_query_range_is_inclusive(write_hive):
+    index = build(write_hive, "hive")
+    entries = timeline.query([index], written(10), written(20))
+    assert [entries[row][0] for row in range(len(entries))] == [written(key) for key in range(10, 21)]
+    assert all(entries[row][2] == 0 for row in range(len(entries)))
+    assert len(timeline.query([index])) == len(index)
+    assert len(timeline.query([index], end=written(1) - 1)) == 0
+    assert len(timeline.query([index], start=written(SHAPE.key_count()) + 1)) == 0
+
+
+def test_query_merges_hives(write_hive):
+    first = build(write_hive, "first")
+    second = build(write_hive, "second", regf_generator.HiveShape(depth=1, fanout=30, values_per_key=0))
+    entries = timeline.query([first, second], written(5), written(25))
+    rows = [entries[row] for row in range(len(entries))]
+    assert len(rows) == 2 * 21
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+    # Keys written at the same time are in the order of their hives
+    assert [row[2] for row in rows[:2]] == [0, 1]
+    assert {offset for _, offset, source in rows if source == 1} == set(
+        offset for _, offset in second.entries(written(5), written(25)))